@@ -1,8 +1,10 @@
-from fastapi import APIRouter, HTTPException, Path
+from fastapi import APIRouter, HTTPException, Path, Query
 from typing import Optional
 
-from app.models.producer import ProducerResponse
+from app.core.config import settings
+from app.models.producer import ProducerResponse, SimilarProducer, SimilarProducersResponse
 from app.models.database import db
+from app.models.ml_model import recommender_model
 
 router = APIRouter()
 
@@ -29,4 +31,31 @@ async def get_producer(
     
     # Convert MongoDB _id to string for response
     producer["id"] = str(producer.pop("_id"))
-    return ProducerResponse(**producer)
\ No newline at end of file
+    return ProducerResponse(**producer)
+
+
+@router.get("/producer/{producer_id}/similar", response_model=SimilarProducersResponse)
+async def get_similar_producers(
+    producer_id: str = Path(..., title="The ID of the producer to find similar producers for"),
+    limit: int = Query(settings.SIMILAR_PRODUCERS_K, ge=1, le=settings.SIMILAR_PRODUCERS_K,
+                       description="Maximum number of similar producers to return"),
+):
+    """
+    Get the producers most similar to a specific producer.
+    Answered from the neighbour table computed when the model was trained.
+    """
+    similar = recommender_model.similar(producer_id, top_n=limit)
+    
+    if similar is None:
+        raise HTTPException(
+            status_code=404,
+            detail=f"Producer with ID '{producer_id}' not found in the trained model"
+        )
+    
+    return SimilarProducersResponse(
+        producer_id=producer_id,
+        similar=[
+            SimilarProducer(id=producer["id"], fullName=producer["name"], similarity_score=producer["similarity_score"])
+            for producer in similar
+        ]
+    )
@@ -1,12 +1,21 @@
-from fastapi import APIRouter, HTTPException, Depends
+import json
+import asyncio
+from fastapi import APIRouter, HTTPException, Depends, Request
+from fastapi.responses import StreamingResponse
+from starlette.concurrency import run_in_threadpool
 from typing import List, Optional
 from bson import ObjectId
-import google.generativeai as genai
 from google.api_core import exceptions
 from pydantic import BaseModel
 
-from app.models.producer import RecommendationRequest, RecommendationResponse, ProducerRecommendation
+from app.models.producer import (
+    RecommendationRequest, RecommendationResponse, ProducerRecommendation, RECOMMENDATION_PROJECTION,
+    BatchRecommendationRequest, BatchRecommendationResponse, BatchRecommendationResult, BatchRecommendation
+)
 from app.models.ml_model import recommender_model
+from app.models.reasons import generate_recommendation_reasons, iter_recommendation_reasons
+from app.models.llm_client import Deadline, LLMUnavailableError
+from app.models.query_parser import QueryParameters, query_parser
 from app.models.database import db
 from app.core.config import settings
 
@@ -16,197 +25,105 @@ router = APIRouter()
 class NaturalLanguageQuery(BaseModel):
     query: str
 
-# Pydantic model for Gemini response
-class QueryParameters(BaseModel):
-    genres: List[str]
-    skills: List[str]
-    tools: Optional[List[str]] = None
-    experience: Optional[str] = None
+async def _extract_query_parameters(query_text: str, deadline: Deadline) -> QueryParameters:
+    """Extract genres, skills, tools and experience from a natural language query"""
+    # Without the local parser, Gemini is the only way to read a query
+    if not settings.GEMINI_API_KEY and not settings.LOCAL_QUERY_PARSER:
+        raise HTTPException(
+            status_code=500, 
+            detail="Gemini API key not configured. Please set GEMINI_API_KEY in .env file."
+        )
+    
+    # Matched against the vocabulary first; Gemini parses are cached and shared by identical concurrent queries
+    try:
+        return await query_parser.parse(query_text, deadline)
+    except (LLMUnavailableError, asyncio.TimeoutError) as e:
+        raise HTTPException(
+            status_code=503,
+            detail=f"Query could not be parsed, Gemini is unavailable: {str(e) or 'timed out'}"
+        )
 
-async def generate_recommendation_reason(producer_data, user_query, matching_genres):
+async def _fetch_recommended_producers(recommendations: List[dict]) -> List[tuple]:
     """
-    Generate AI reasoning for why this producer is recommended based on the user's query
+    Look up recommended producers in the database with one query, reading only the fields of a recommendation;
+    returns (recommendation, producer id, document) for those found, in ranking order
     """
-    try:
-        # Check if Gemini API key is configured
-        if not settings.GEMINI_API_KEY:
-            return None
-            
-        # Initialize Gemini API with the API key
-        genai.configure(api_key=settings.GEMINI_API_KEY)
-        
-        # Extract producer details for the prompt
-        producer_name = producer_data.get("fullName", "Unknown Producer")
-        producer_genres = producer_data.get("genres", [])
-        producer_skills = producer_data.get("skills", [])
-        producer_tools = producer_data.get("tools", [])
-        producer_experience = producer_data.get("experience", "")
-        producer_country = producer_data.get("country", "")
-        
-        # Create the prompt for Gemini
-        prompt = f"""
-        You are a music producer recommendation expert. Your task is to explain why a specific music producer would be a good match for a user's request.
-        
-        User's query: "{user_query}"
-        
-        Producer details:
-        - Name: {producer_name}
-        - Genres: {', '.join(producer_genres)}
-        - Skills: {', '.join(producer_skills)}
-        - Tools: {', '.join(producer_tools if producer_tools else [])}
-        - Experience: {producer_experience}
-        - Country: {producer_country}
-        
-        The user's query matches the following genres: {', '.join(matching_genres)}
-        
-        Generate a concise, personalized explanation 30-60 words) for why this producer would be a good match for the user's needs.
-        
-        The response should:
-        1. Highlight the producer's strengths related to the user's needs
-        2. Mention specific matching genres/skills/tools
-        3. Explain why this producer would be valuable for the user's specific project
-        4. If the producer isn't a perfect match, acknowledge this but explain what value they still offer
-        
-        Your response should be friendly, direct, and specific to this producer and request.
-        """
-        
-        # Generate the reasoning
-        model = genai.GenerativeModel('gemini-2.0-flash')
-        response = model.generate_content(
-            contents=prompt,
-            generation_config={
-                "temperature": 0.7,
-                "max_output_tokens": 200,
-            }
-        )
-        
-        # Return the generated text
-        return response.text.strip()
-        
-    except Exception as e:
-        print(f"Error generating recommendation reason: {str(e)}")
-        return None
+    producer_ids = []
+    for rec in recommendations:
+        producer_id = rec["id"]
+    
+        # Convert string ID to ObjectId if needed
+        try:
+            if not isinstance(producer_id, ObjectId) and ObjectId.is_valid(producer_id):
+                producer_id = ObjectId(producer_id)
+        except Exception as e:
+            print(f"Could not convert ID: {str(e)}")
+        producer_ids.append(producer_id)
+    
+    print(f"Looking up producers with IDs: {[str(producer_id) for producer_id in producer_ids]}")
+    producers = await db.get_producers_by_ids(producer_ids, RECOMMENDATION_PROJECTION)
+    
+    found = []
+    for rec, producer_id, producer_data in zip(recommendations, producer_ids, producers):
+        if producer_data:
+            print(f"Found producer: {producer_data.get('fullName', '')}")
+            found.append((rec, producer_id, producer_data))
+    
+    return found
+
+def _producer_recommendation(rec: dict, producer_id, producer_data: dict,
+                             reason: Optional[str] = None) -> ProducerRecommendation:
+    """Build the response entry for a recommended producer from its database document"""
+    # Process featuredTracks - handle both dictionary and string formats
+    featured_tracks = producer_data.get("featuredTracks", [])
+    processed_tracks = []
+    
+    if featured_tracks:
+        try:
+            # Check if we have a list of dictionaries
+            if isinstance(featured_tracks, list):
+                for track in featured_tracks:
+                    if isinstance(track, dict):
+                        # For dictionary format, create a string representation
+                        title = track.get('title', 'Unknown Track')
+                        artist = track.get('artist', 'Unknown Artist')
+                        processed_tracks.append(f"{artist} - {title}")
+                    else:
+                        # If it's already a string, use it as is
+                        processed_tracks.append(track)
+        except Exception as e:
+            print(f"Error processing featured tracks for {producer_data.get('fullName', '')}: {str(e)}")
+            # Use empty list if there's an error
+            processed_tracks = []
+    
+    # Create a ProducerRecommendation object with all fields
+    return ProducerRecommendation(
+        id=str(producer_id),
+        fullName=producer_data.get("fullName", ""),
+        similarity_score=rec["similarity_score"],
+        genres=producer_data.get("genres"),
+        skills=producer_data.get("skills"),
+        experience=producer_data.get("experience"),
+        profileImage=producer_data.get("profileImage"),
+        country=producer_data.get("country"),
+        about=producer_data.get("about"),
+        tools=producer_data.get("tools"),
+        featuredTracks=processed_tracks,
+        reason=reason
+    )
 
 @router.post("/query", response_model=RecommendationResponse)
 async def natural_language_recommendation(query: NaturalLanguageQuery):
     """
     Get producer recommendations using natural language query
     """
+    # Parsing and reasons share the request's time budget
+    deadline = Deadline(settings.QUERY_DEADLINE_SECONDS)
     try:
         # Process the natural language query with Gemini API
         print(f"Processing natural language query: {query.query}")
         
-        # Check if Gemini API key is configured
-        if not settings.GEMINI_API_KEY:
-            raise HTTPException(
-                status_code=500, 
-                detail="Gemini API key not configured. Please set GEMINI_API_KEY in .env file."
-            )
-        
-        # Get available genres, skills, and tools from the model metadata
-        available_genres = []
-        available_skills = []
-        available_tools = []
-        available_experience_levels = []
-        
-        if recommender_model.metadata:
-            available_genres = recommender_model.metadata.get("all_genres", [])
-            available_skills = recommender_model.metadata.get("all_skills", [])
-            available_tools = recommender_model.metadata.get("all_tools", [])
-            available_experience_levels = recommender_model.metadata.get("all_experience_levels", [])
-        
-        # Initialize Gemini API with the API key
-        genai.configure(api_key=settings.GEMINI_API_KEY)
-        
-        # Create formatted lists for the prompt
-        genres_list = ", ".join([f'"{genre}"' for genre in available_genres])
-        skills_list = ", ".join([f'"{skill}"' for skill in available_skills])
-        tools_list = ", ".join([f'"{tool}"' for tool in available_tools])
-        experience_list = ", ".join([f'"{exp}"' for exp in available_experience_levels])
-        
-        # Create prompt that explains the task and context with examples
-        prompt = f"""
-        You are an expert music producer classifier. Your task is to analyze a user's description 
-        of what they're looking for in a music producer and extract the relevant genres, skills, 
-        tools, and experience level required.
-        
-        IMPORTANT: Only use values from the provided lists below. If something is mentioned in the query but doesn't
-        match anything in these lists, find the closest match or omit it.
-        
-        Available genres: {genres_list}
-        
-        Available skills: {skills_list}
-        
-        Available tools: {tools_list}
-        
-        Available experience levels: {experience_list}
-        
-        For each category, only include values that are explicitly mentioned or strongly implied and exist in the available lists.
-        If a category is not mentioned at all, provide an empty list or null.
-        
-        Here are some examples:
-        
-        Example 1:
-        User query: "I need a jazz producer who is good at mixing and has experience with Logic Pro. They should have at least 3-5 years of experience."
-        Response:
-        {{
-            "genres": ["Jazz"],
-            "skills": ["Mixing"],
-            "tools": ["Logic Pro"],
-            "experience": "3-5 years"
-        }}
-        
-        Example 2:
-        User query: "Looking for someone who can produce EDM and trap music. They should be skilled in sound design and mastering."
-        Response:
-        {{
-            "genres": ["EDM", "Trap"],
-            "skills": ["Sound Design", "Mastering"],
-            "tools": [],
-            "experience": null
-        }}
-        
-        Example 3:
-        User query: "I want a producer for my indie folk album who knows how to record live instruments."
-        Response:
-        {{
-            "genres": ["Indie", "Folk"],
-            "skills": ["Live Recording"],
-            "tools": [],
-            "experience": null
-        }}
-        
-        Now, analyze this user query: "{query.query}"
-        
-        Respond with a JSON object containing the following fields:
-        - genres: List of music genres mentioned (ONLY from the available genres list)
-        - skills: List of skills mentioned (ONLY from the available skills list)
-        - tools: List of tools/software mentioned (ONLY from the available tools list)
-        - experience: Experience level mentioned (ONLY from the available experience levels list)
-        """
-        
-        # Generate structured response
-        model = genai.GenerativeModel('gemini-2.0-flash')
-        response = model.generate_content(
-            contents=prompt,
-            generation_config={
-                "response_mime_type": "application/json",
-            }
-        )
-        
-        # Parse the response as JSON
-        response_json = response.text
-        import json
-        extracted_params = json.loads(response_json)
-        print(f"Extracted parameters: {extracted_params}")
-        
-        # Convert to proper structure
-        params = QueryParameters(
-            genres=extracted_params.get("genres", []),
-            skills=extracted_params.get("skills", []),
-            tools=extracted_params.get("tools", []),
-            experience=extracted_params.get("experience")
-        )
+        params = await _extract_query_parameters(query.query, deadline)
         
         # Ensure we have at least one genre or skill to search with
         if not params.genres and not params.skills:
@@ -214,8 +131,9 @@ async def natural_language_recommendation(query: NaturalLanguageQuery):
                 recommendations=[]
             )
         
-        # Use the extracted parameters to get recommendations
-        recommendations = recommender_model.recommend(
+        # Use the extracted parameters to get recommendations; scoring runs in the threadpool so it does not block the event loop
+        recommendations = await run_in_threadpool(
+            recommender_model.recommend,
             genres=params.genres if params.genres else [],
             skills=params.skills if params.skills else [],
             tools=params.tools if params.tools else [],
@@ -227,74 +145,25 @@ async def natural_language_recommendation(query: NaturalLanguageQuery):
             return RecommendationResponse(recommendations=[])
         
         # Fetch producer details from database
+        found = await _fetch_recommended_producers(recommendations)
+        
+        # Generate AI reasoning for all recommendations with one batched call; a failed or late reason is None
+        reasons = await generate_recommendation_reasons(
+            [(str(producer_id), producer_data, rec.get("matching_genres", [])) for rec, producer_id, producer_data in found],
+            user_query=query.query,
+            criteria=params.model_dump(),
+            deadline=deadline
+        )
+        
         result_recommendations = []
-        for rec in recommendations:
-            producer_id = rec["id"]
-            print(f"Looking up producer with ID: {producer_id}")
-            
-            # Convert string ID to ObjectId if needed
+        for rec, producer_id, producer_data in found:
+            reason = reasons.get(str(producer_id))
             try:
-                if not isinstance(producer_id, ObjectId) and ObjectId.is_valid(producer_id):
-                    producer_id = ObjectId(producer_id)
+                result_recommendations.append(_producer_recommendation(rec, producer_id, producer_data, reason))
             except Exception as e:
-                print(f"Could not convert ID: {str(e)}")
-            
-            producer_data = await db.get_producer_by_id(producer_id)
-            
-            if producer_data:
-                print(f"Found producer: {producer_data.get('fullName', '')}")
-                
-                # Process featuredTracks - handle both dictionary and string formats
-                featured_tracks = producer_data.get("featuredTracks", [])
-                processed_tracks = []
-                
-                if featured_tracks:
-                    try:
-                        # Check if we have a list of dictionaries
-                        if isinstance(featured_tracks, list):
-                            for track in featured_tracks:
-                                if isinstance(track, dict):
-                                    # For dictionary format, create a string representation
-                                    title = track.get('title', 'Unknown Track')
-                                    artist = track.get('artist', 'Unknown Artist')
-                                    processed_tracks.append(f"{artist} - {title}")
-                                else:
-                                    # If it's already a string, use it as is
-                                    processed_tracks.append(track)
-                    except Exception as e:
-                        print(f"Error processing featured tracks for {producer_data.get('fullName', '')}: {str(e)}")
-                        # Use empty list if there's an error
-                        processed_tracks = []
-                
-                try:
-                    # Generate AI reasoning for this recommendation
-                    reason = await generate_recommendation_reason(
-                        producer_data=producer_data,
-                        user_query=query.query,
-                        matching_genres=rec.get("matching_genres", [])
-                    )
-                    
-                    # Create a ProducerRecommendation object with all fields
-                    result_recommendations.append(
-                            ProducerRecommendation(
-                                id=str(producer_id),
-                                fullName=producer_data.get("fullName", ""),
-                                similarity_score=rec["similarity_score"],
-                                genres=producer_data.get("genres"),
-                                skills=producer_data.get("skills"),
-                                experience=producer_data.get("experience"),
-                                profileImage=producer_data.get("profileImage"),
-                                country=producer_data.get("country"),
-                                about=producer_data.get("about"),
-                                tools=producer_data.get("tools"),
-                                featuredTracks=processed_tracks,
-                                reason=reason
-                            )
-                        )                    
-                except Exception as e:
-                    print(f"Error creating recommendation for {producer_data.get('fullName', '')}: {str(e)}")
-                    # Continue to the next producer if we can't create a recommendation for this one
-                    continue
+                print(f"Error creating recommendation for {producer_data.get('fullName', '')}: {str(e)}")
+                # Continue to the next producer if we can't create a recommendation for this one
+                continue
         
         # In case no recommendations were found
         if not result_recommendations:
@@ -309,7 +178,8 @@ async def natural_language_recommendation(query: NaturalLanguageQuery):
                 print("Attempting fallback recommendation with broader criteria...")
                 # Try to match with just the first genre and no other criteria
                 if params.genres:
-                    fallback_recommendations = recommender_model.recommend(
+                    fallback_recommendations = await run_in_threadpool(
+                        recommender_model.recommend,
                         genres=[params.genres[0]],
                         skills=[],
                         tools=[],
@@ -330,6 +200,8 @@ async def natural_language_recommendation(query: NaturalLanguageQuery):
         
         return RecommendationResponse(recommendations=result_recommendations)
     
+    except HTTPException:
+        raise
     except exceptions.GoogleAPIError as api_error:
         print(f"Gemini API error: {str(api_error)}")
         raise HTTPException(
@@ -343,4 +215,142 @@ async def natural_language_recommendation(query: NaturalLanguageQuery):
         raise HTTPException(
             status_code=500,
             detail=f"Error processing query: {str(e)}"
-        )
\ No newline at end of file
+        )
+
+def _stream_event(event: str, data: dict, sse: bool) -> str:
+    """Format one streamed event as a server-sent event or a line of JSON"""
+    if sse:
+        return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+    return json.dumps({"event": event, "data": data}) + "\n"
+
+@router.post("/query/stream")
+async def natural_language_recommendation_stream(query: NaturalLanguageQuery, request: Request):
+    """
+    Get producer recommendations for a natural language query as a stream of events,
+    sent as soon as each part is ready:
+    - parameters: the genres, skills, tools and experience extracted from the query
+    - recommendations: the ranked producers, as soon as they are scored
+    - producers: the ranked producers' profiles from the database, without reasons
+    - reason: {id, reason} for one producer, as each reason is generated
+    - done, or error with a detail message
+    Requests that accept text/event-stream get server-sent events; others get one JSON object per line.
+    """
+    sse = "text/event-stream" in request.headers.get("accept", "")
+    print(f"Processing streamed natural language query: {query.query}")
+    deadline = Deadline(settings.QUERY_DEADLINE_SECONDS)
+    
+    async def events():
+        try:
+            params = await _extract_query_parameters(query.query, deadline)
+            yield _stream_event("parameters", params.model_dump(), sse)
+            
+            recommendations = []
+            if params.genres or params.skills:
+                recommendations = await run_in_threadpool(
+                    recommender_model.recommend,
+                    genres=params.genres if params.genres else [],
+                    skills=params.skills if params.skills else [],
+                    tools=params.tools if params.tools else [],
+                    experience=params.experience,
+                    top_n=settings.TOP_N_RECOMMENDATIONS
+                )
+            ranked = [
+                BatchRecommendation(
+                    id=rec["id"],
+                    fullName=rec["name"],
+                    similarity_score=rec["similarity_score"],
+                    matching_genres=rec["matching_genres"]
+                ).model_dump()
+                for rec in recommendations
+            ]
+            yield _stream_event("recommendations", {"recommendations": ranked}, sse)
+            
+            found = await _fetch_recommended_producers(recommendations)
+            producers = []
+            for rec, producer_id, producer_data in found:
+                try:
+                    producers.append(_producer_recommendation(rec, producer_id, producer_data))
+                except Exception as e:
+                    print(f"Error creating recommendation for {producer_data.get('fullName', '')}: {str(e)}")
+            yield _stream_event("producers", RecommendationResponse(recommendations=producers).model_dump(), sse)
+            
+            items = [(str(producer_id), producer_data, rec.get("matching_genres", [])) for rec, producer_id, producer_data in found]
+            async for producer_id, reason in iter_recommendation_reasons(items, user_query=query.query, criteria=params.model_dump(),
+                                                                   deadline=deadline):
+                yield _stream_event("reason", {"id": producer_id, "reason": reason}, sse)
+            
+            yield _stream_event("done", {}, sse)
+        except HTTPException as e:
+            yield _stream_event("error", {"detail": e.detail}, sse)
+        except exceptions.GoogleAPIError as api_error:
+            print(f"Gemini API error: {str(api_error)}")
+            yield _stream_event("error", {"detail": f"Error processing query with Gemini API: {str(api_error)}"}, sse)
+        except Exception as e:
+            import traceback
+            print(f"Error processing streamed natural language query: {str(e)}")
+            print(traceback.format_exc())
+            yield _stream_event("error", {"detail": f"Error processing query: {str(e)}"}, sse)
+    
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream" if sse else "application/x-ndjson",
+        # Ask proxies not to buffer the stream
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+def _batch_result(index: int, recommendations: List[dict]) -> BatchRecommendationResult:
+    """Convert one query's recommendations from the model into the response model"""
+    return BatchRecommendationResult(
+        index=index,
+        recommendations=[
+            BatchRecommendation(
+                id=rec["id"],
+                fullName=rec["name"],
+                similarity_score=rec["similarity_score"],
+                matching_genres=rec["matching_genres"]
+            )
+            for rec in recommendations
+        ]
+    )
+
+@router.post("/recommend/batch", response_model=BatchRecommendationResponse)
+async def batch_recommendation(batch: BatchRecommendationRequest, request: Request):
+    """
+    Get producer recommendations for many structured queries in one request.
+    Skips natural language parsing and recommendation reasons. Batches larger than
+    BATCH_STREAM_THRESHOLD, or requests that accept application/x-ndjson, get one
+    JSON result per line as each query is ranked.
+    """
+    if len(batch.queries) > settings.BATCH_MAX_QUERIES:
+        raise HTTPException(
+            status_code=413,
+            detail=f"Batch of {len(batch.queries)} queries exceeds the limit of {settings.BATCH_MAX_QUERIES}"
+        )
+    
+    queries = [query.model_dump() for query in batch.queries]
+    top_n = batch.top_n or settings.TOP_N_RECOMMENDATIONS
+    
+    stream = (len(queries) > settings.BATCH_STREAM_THRESHOLD
+              or "application/x-ndjson" in request.headers.get("accept", ""))
+    if stream:
+        def result_lines():
+            # Runs in the threadpool, so scoring does not block the event loop
+            for index, recommendations in enumerate(recommender_model.iter_recommend_batch(queries, top_n)):
+                yield _batch_result(index, recommendations).model_dump_json() + "\n"
+        
+        return StreamingResponse(result_lines(), media_type="application/x-ndjson")
+    
+    try:
+        results = await run_in_threadpool(recommender_model.recommend_batch, queries, top_n)
+    except Exception as e:
+        import traceback
+        print(f"Error processing batch recommendation: {str(e)}")
+        print(traceback.format_exc())
+        raise HTTPException(
+            status_code=500,
+            detail=f"Error processing batch: {str(e)}"
+        )
+    
+    return BatchRecommendationResponse(
+        results=[_batch_result(index, recommendations) for index, recommendations in enumerate(results)]
+    )
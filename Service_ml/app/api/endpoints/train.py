@@ -1,48 +1,71 @@
-from fastapi import APIRouter, HTTPException, Depends
+from fastapi import APIRouter, HTTPException, Depends, Query
 from typing import Optional
+from starlette.concurrency import run_in_threadpool
 
-from app.models.producer import TrainingResponse
+from app.models.producer import TrainingResponse, TrainingJobResponse
 from app.models.ml_model import recommender_model
-from app.models.database import db
-from app.core.config import settings
+from app.models.training_jobs import training_jobs, train_from_database
 
 router = APIRouter()
 
 
-@router.post("/train", response_model=TrainingResponse)
+@router.post("/train", response_model=TrainingJobResponse, status_code=202)
 async def train_model():
     """
-    Train the recommendation model with the latest producer data
+    Start training the recommendation model with the latest producer data.
+    Returns the training job at once; poll GET /train/{job_id} for its progress.
+    If a training job is already running, that job is returned instead of starting another.
     """
     try:
-        # Get all producers from database
-        producers = await db.get_producers()
-        
-        if not producers or len(producers) < 5:
-            return TrainingResponse(
-                success=False,
-                message="Not enough data to train model. Minimum 5 producers required.",
-                details={"producers_count": len(producers) if producers else 0}
-            )
-        
-        # Train the model
-        training_result = await recommender_model.train(producers)
-        
-        if not training_result["success"]:
-            return TrainingResponse(
-                success=False,
-                message=training_result["message"],
-                details=training_result.get("details")
-            )
-        
-        return TrainingResponse(
-            success=True,
-            message=f"Model trained successfully with {len(producers)} producers",
-            details=training_result["details"]
+        job, started = await training_jobs.submit(train_from_database)
+    except Exception as e:
+        raise HTTPException(
+            status_code=500,
+            detail=f"Error starting model training: {str(e)}"
         )
-        
+    
+    return TrainingJobResponse(**job, already_running=not started)
+
+@router.get("/train/{job_id}", response_model=TrainingJobResponse)
+async def get_training_job(job_id: str):
+    """
+    Get the status and progress stages of a training job
+    """
+    job = training_jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Training job '{job_id}' not found")
+    return TrainingJobResponse(**job)
+
+@router.post("/train/rollback", response_model=TrainingResponse)
+async def rollback_model(
+    version: Optional[str] = Query(None, title="Model version to serve; defaults to the version before the current one"),
+):
+    """
+    Switch back to a previously trained model version without retraining
+    """
+    try:
+        # Waits for the store lock, so it runs in the threadpool rather than on the event loop
+        rolled_back_to = await run_in_threadpool(recommender_model.rollback, version)
+    except ValueError as e:
+        raise HTTPException(status_code=404, detail=str(e))
     except Exception as e:
         raise HTTPException(
             status_code=500,
-            detail=f"Error training model: {str(e)}"
-        )
\ No newline at end of file
+            detail=f"Error rolling back model: {str(e)}"
+        )
+    
+    if not rolled_back_to:
+        return TrainingResponse(
+            success=False,
+            message="No previous model version available to roll back to",
+            details={"available_versions": recommender_model.store.list_versions()}
+        )
+    
+    return TrainingResponse(
+        success=True,
+        message=f"Now serving model version {rolled_back_to}",
+        details={
+            "model_version": rolled_back_to,
+            "available_versions": recommender_model.store.list_versions()
+        }
+    )
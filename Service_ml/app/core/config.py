@@ -17,12 +17,56 @@ class Settings(BaseSettings):
     PRODUCER_COLLECTION: str = "musicians"
     
     # ML Model Configuration
-    MODEL_PATH: str = Field("./model/producer_recommender_model.pkl")
-    MODEL_METADATA_PATH: str = Field("./model/model_metadata.json")
+    MODEL_PATH: str = Field("./model/producer_recommender_model.pkl")  # Legacy neighbour model, no longer used
+    MODEL_METADATA_PATH: str = Field("./model/model_metadata.json")  # Legacy JSON format, read for migration only
+    MODEL_ARTIFACT_DIR: str = Field("./model/artifact")  # Holds one directory per model version
+    MODEL_KEEP_VERSIONS: int = 3  # Previous versions kept for rollback
+    TRAINING_BATCH_SIZE: int = 500  # Producers fetched and encoded per batch during training
+    EVALUATION_SAMPLE_SIZE: int = 2000  # Producers sampled to estimate average neighbour similarity; 0 evaluates all
+    EVALUATION_BLOCK_ELEMENTS: int = 16_000_000  # Similarity values held in memory at once during evaluation
+    SIMILAR_PRODUCERS_K: int = 10  # Most similar producers precomputed for every producer at train time
+    TRAINING_JOBS_KEEP: int = 20  # Status files of finished training jobs kept for polling
+    MODEL_RELOAD_SECONDS: int = 5  # How often each server process checks for models written by other processes
+    
+    # Incremental model updates
+    INCREMENTAL_UPDATES: bool = True  # Apply producer inserts, updates and deletes to the served model as they happen
+    PRODUCER_CHANGE_STREAM: bool = False  # Follow a MongoDB change stream instead of Database method calls (needs a replica set)
+    CHANGE_STREAM_BATCH_SIZE: int = 100  # Most change stream events applied together
+    MODEL_COMPACTION_HOURS: int = 24  # How often a model with incremental updates is rebuilt from the database
+    
+    # Change-aware retraining
+    RETRAIN_CHANGE_THRESHOLD: float = 0.05  # Retrain early once this share of producers changed since the last training
+    RETRAIN_CHECK_MINUTES: int = 60  # How often the producer data is checked for changes
+    
+    # Candidate generation backend; only "exact" (every genre-matching producer is scored) is available
+    ANN_BACKEND: str = "exact"
     TOP_N_RECOMMENDATIONS: int = 3
+    BATCH_MAX_QUERIES: int = 1000  # Largest batch accepted by the batch recommendation endpoint
+    BATCH_STREAM_THRESHOLD: int = 100  # Larger batches are streamed back as newline-delimited JSON
+    BATCH_BLOCK_ELEMENTS: int = 16_000_000  # Dot products held in memory at once when scoring a batch
+    SPARSE_FEATURES: bool = True  # Store and score producer features as CSR; False keeps a dense matrix
     
     # Gemini API Configuration
     GEMINI_API_KEY: str = Field("", env="GEMINI_API_KEY")
+    GEMINI_API_ENDPOINT: Optional[str] = None  # Another endpoint, e.g. http://localhost:8090 for fake_gemini_server.py
+    GEMINI_TRANSPORT: Optional[str] = None  # "rest" for plain HTTP endpoints; the library's default is gRPC
+    QUERY_DEADLINE_SECONDS: float = 15.0  # Time budget of a /query request, shared by its Gemini calls
+    QUERY_PARSE_TIMEOUT_SECONDS: float = 5.0  # Queries Gemini has not parsed in time use the local extraction
+    LLM_HEDGE_PERCENTILE: Optional[float] = 95  # Repeat calls slower than this latency percentile; None disables
+    LLM_BREAKER_FAILURE_RATE: float = 0.5  # Share of failed Gemini calls that pauses calling it
+    LLM_BREAKER_MIN_CALLS: int = 10  # Calls within the window needed before the breaker can open
+    LLM_BREAKER_WINDOW_SECONDS: float = 60
+    LLM_BREAKER_COOLDOWN_SECONDS: float = 30  # How long calls are paused before a trial call
+    REASON_TIMEOUT_SECONDS: float = 10.0  # Recommendation reasons not generated in time are left empty
+    REASON_MAX_CONCURRENCY: int = 8  # Reason requests in flight at once across all queries
+    REASON_CACHE_SIZE: int = 10_000  # Generated reasons kept in memory
+    REASON_CACHE_TTL_SECONDS: int = 86_400  # How long a generated reason is reused
+    REASON_CACHE_PATH: Optional[str] = None  # SQLite file keeping reasons across restarts, e.g. ./model/reason_cache.sqlite
+    QUERY_CACHE_SIZE: int = 1000  # Parsed natural language queries kept in memory
+    QUERY_CACHE_TTL_SECONDS: int = 3600  # How long a parsed query is reused
+    LOCAL_QUERY_PARSER: bool = True  # Extract query parameters from the model's vocabulary before asking Gemini
+    LOCAL_QUERY_MIN_CONFIDENCE: float = 0.6  # Less confident local extractions are sent to Gemini, if configured
+    QUERY_SYNONYMS_PATH: Optional[str] = None  # JSON file of extra aliases, e.g. {"Hip-Hop": ["boom bap"]}
     
     # Security Configuration (if needed)
     API_KEY: Optional[str] = Field(None, env="API_KEY")
@@ -0,0 +1,101 @@
+import os
+import time
+from typing import Optional
+
+try:
+    import fcntl
+except ImportError:
+    # Windows
+    fcntl = None
+    import msvcrt
+
+# Windows locks byte ranges, and a locked range cannot be read by other processes;
+# lock one byte far past the owner text so that it stays readable
+_WINDOWS_LOCK_OFFSET = 1 << 20
+
+
+def _try_lock(fd: int) -> bool:
+    if fcntl is not None:
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            return False
+        return True
+    os.lseek(fd, _WINDOWS_LOCK_OFFSET, os.SEEK_SET)
+    try:
+        msvcrt.locking(fd, msvcrt.LK_NBLCK, 1)
+    except OSError:
+        return False
+    return True
+
+
+def _lock(fd: int):
+    if fcntl is not None:
+        fcntl.flock(fd, fcntl.LOCK_EX)
+        return
+    while not _try_lock(fd):
+        time.sleep(0.05)
+
+
+def _unlock(fd: int):
+    if fcntl is not None:
+        fcntl.flock(fd, fcntl.LOCK_UN)
+        return
+    os.lseek(fd, _WINDOWS_LOCK_OFFSET, os.SEEK_SET)
+    msvcrt.locking(fd, msvcrt.LK_UNLCK, 1)
+
+
+class FileLock:
+    """
+    Advisory lock on a file, shared by every process that opens the same path.
+    The lock is released when it is released explicitly or when the holding process exits,
+    so a crashed holder never leaves it stuck. Uses flock, or msvcrt.locking on Windows.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._fd: Optional[int] = None
+
+    @property
+    def held(self) -> bool:
+        """Whether this object currently holds the lock"""
+        return self._fd is not None
+
+    def acquire(self, blocking: bool = False) -> bool:
+        """Take the lock; without blocking, returns False at once if another holder has it"""
+        if self._fd is not None:
+            return True
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        if blocking:
+            _lock(fd)
+        elif not _try_lock(fd):
+            os.close(fd)
+            return False
+        self._fd = fd
+        return True
+
+    def release(self):
+        """Give up the lock if held"""
+        if self._fd is not None:
+            _unlock(self._fd)
+            os.close(self._fd)
+            self._fd = None
+
+    def write_owner(self, owner: str):
+        """Record who holds the lock in the lock file, for processes that fail to take it"""
+        if self._fd is None:
+            raise RuntimeError("Lock is not held")
+        os.ftruncate(self._fd, 0)
+        os.lseek(self._fd, 0, os.SEEK_SET)
+        os.write(self._fd, owner.encode("utf-8"))
+        os.fsync(self._fd)
+
+    def read_owner(self) -> Optional[str]:
+        """The owner recorded by the current or last holder, if any"""
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                owner = f.read().strip()
+        except FileNotFoundError:
+            return None
+        return owner or None
@@ -1,41 +1,154 @@
+import os
+import json
 import asyncio
 import schedule
 import logging
-from datetime import datetime
+from datetime import datetime, timedelta
+from typing import Dict, Any, Optional
 
+from app.core.config import settings
 from app.models.ml_model import recommender_model
 from app.models.database import db
+from app.models.training_jobs import training_jobs, train_from_database
 
 # Set up logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Result of the latest change check, shared with the other worker processes through the model directory
+DATASET_CHECK_FILE = "dataset_check.json"
+# Longest wait before retrying after failed scheduled retrainings
+MAX_RETRAIN_BACKOFF_MINUTES = 24 * 60
+
+# Consecutive failed scheduled retrainings, and when the next one may start
+_retrain_failures = 0
+_retrain_not_before: Optional[datetime] = None
+
+def _record_retrain_result(succeeded: bool):
+    """Reset the back-off after a successful retraining, double it after a failed one"""
+    global _retrain_failures, _retrain_not_before
+    if succeeded:
+        _retrain_failures = 0
+        _retrain_not_before = None
+        return
+    _retrain_failures += 1
+    delay = min(settings.RETRAIN_CHECK_MINUTES * 2 ** (_retrain_failures - 1), MAX_RETRAIN_BACKOFF_MINUTES)
+    _retrain_not_before = datetime.now() + timedelta(minutes=delay)
+    logger.warning(f"{_retrain_failures} scheduled retraining(s) failed in a row - next attempt after {_retrain_not_before:%Y-%m-%d %H:%M}")
+
 async def retrain_model():
     """Scheduled task to retrain the recommendation model monthly"""
+    if _retrain_not_before is not None and datetime.now() < _retrain_not_before:
+        logger.info(f"Last scheduled retraining failed - not retrying before {_retrain_not_before:%Y-%m-%d %H:%M}")
+        return False
     try:
         logger.info("Starting scheduled model retraining")
         
-        # Get all producers from database
-        producers = await db.get_producers()
-        
-        if not producers or len(producers) < 5:
-            logger.warning(f"Not enough producers to train model. Found {len(producers) if producers else 0} producers.")
+        # Runs as a training job, so it never overlaps a manual or another process's training
+        job, started = await training_jobs.submit(train_from_database)
+        if not started:
+            logger.info(f"Training job {job['job_id']} already in progress - skipping")
             return False
         
-        # Use the existing train method from recommender_model
-        result = await recommender_model.train(producers)
-        
-        if result["success"]:
-            logger.info(f"Model retrained successfully with {len(producers)} producers")
-            logger.info(f"Training details: {result['details']}")
+        job = await training_jobs.wait(job["job_id"])
+        if job["status"] == "succeeded":
+            logger.info(f"Model retrained successfully with {job['details']['dataset_size']} producers")
+            logger.info(f"Training details: {job['details']}")
         else:
-            logger.error(f"Failed to retrain model: {result['message']}")
+            logger.error(f"Failed to retrain model: {job['message']}")
         
-        return result["success"]
+        _record_retrain_result(job["status"] == "succeeded")
+        return job["status"] == "succeeded"
     
     except Exception as e:
         logger.error(f"Error during model retraining: {str(e)}")
+        _record_retrain_result(False)
+        return False
+
+async def check_dataset_changes() -> Dict[str, Any]:
+    """
+    Compare the producer data with the data the served model was trained on.
+    The changed share counts producers updated since the last training plus any drop in the count
+    (deleted producers), relative to the trained dataset size.
+    A served model without a recorded fingerprint, such as a migrated one, gets the current
+    fingerprint as its baseline; only a model outside the store counts every producer as changed.
+    The result is saved for latest_dataset_changes.
+    """
+    current = await db.get_dataset_fingerprint()
+    trained = recommender_model.trained_fingerprint
+    
+    if trained is None and recommender_model.record_fingerprint(current):
+        logger.info("Served model has no dataset fingerprint - recording the current producer data as its baseline")
+        trained = current
+    
+    if trained is None:
+        changed_fraction: Optional[float] = 1.0
+    elif current == trained:
+        changed_fraction = 0.0
+    else:
+        changed = max(trained["count"] - current["count"], 0)
+        if trained.get("max_updated_at"):
+            changed += await db.count_producers_updated_since(trained["max_updated_at"])
+        else:
+            changed += max(current["count"] - trained["count"], 0)
+        # The fingerprints differ, so at least one producer changed
+        changed_fraction = max(changed, 1) / max(trained["count"], 1)
+    
+    changes = {"current": current, "trained": trained, "changed_fraction": changed_fraction}
+    _save_dataset_check(changes)
+    return changes
+
+def _save_dataset_check(changes: Dict[str, Any]):
+    path = os.path.join(recommender_model.store.root, DATASET_CHECK_FILE)
+    tmp_path = f"{path}.tmp-{os.getpid()}"
+    try:
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({**changes, "checked_at": datetime.now().isoformat()}, f, default=str)
+        os.replace(tmp_path, path)
+    except OSError as e:
+        logger.warning(f"Could not save the producer data change check: {str(e)}")
+
+def latest_dataset_changes() -> Optional[Dict[str, Any]]:
+    """The result of the latest check_dataset_changes in any worker, or None before the first one"""
+    try:
+        with open(os.path.join(recommender_model.store.root, DATASET_CHECK_FILE), "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return None
+
+async def retrain_if_changed():
+    """Monthly retraining, skipped when the producer data has not changed since the last training"""
+    try:
+        changes = await check_dataset_changes()
+    except Exception as e:
+        logger.error(f"Error checking producer data for changes: {str(e)}")
+        return False
+    
+    if changes["changed_fraction"] == 0:
+        logger.info("Producer data unchanged since the last training - skipping scheduled retraining")
+        return False
+    return await retrain_model()
+
+async def retrain_on_large_change():
+    """Retrain before the monthly run once enough of the producer data has changed"""
+    try:
+        changes = await check_dataset_changes()
+    except Exception as e:
+        logger.error(f"Error checking producer data for changes: {str(e)}")
+        return False
+    
+    if changes["changed_fraction"] < settings.RETRAIN_CHANGE_THRESHOLD:
+        logger.debug(f"{changes['changed_fraction']:.1%} of producers changed - below the retraining threshold")
         return False
+    logger.info(f"{changes['changed_fraction']:.1%} of producers changed since the last training - retraining early")
+    return await retrain_model()
+
+def run_change_check():
+    """Wrapper function to execute the async retrain_on_large_change function"""
+    try:
+        asyncio.get_event_loop().create_task(retrain_on_large_change())
+    except Exception as e:
+        logger.error(f"Error executing scheduled change check: {str(e)}")
 
 # Create a wrapper function to run the async function
 def run_retrain():
@@ -51,15 +164,32 @@ def run_retrain():
             loop = asyncio.get_event_loop()
             if loop.is_running():
                 # If the loop is already running (normal case in FastAPI)
-                asyncio.create_task(retrain_model())
+                asyncio.create_task(retrain_if_changed())
             else:
                 # Fallback in case the loop isn't running
-                loop.run_until_complete(retrain_model())
+                loop.run_until_complete(retrain_if_changed())
         except Exception as e:
             logger.error(f"Error executing scheduled retraining: {str(e)}")
     else:
         logger.debug("Not the 1st day of the month - skipping retraining")
 
+async def compact_model():
+    """Scheduled task to rebuild the model from the database once it has incremental updates"""
+    pending_updates = recommender_model.pending_updates
+    if pending_updates == 0:
+        logger.debug("No incremental model updates - skipping compaction")
+        return False
+    
+    logger.info(f"Compacting model with {pending_updates} incremental updates")
+    return await retrain_model()
+
+def run_compaction():
+    """Wrapper function to execute the async compact_model function"""
+    try:
+        asyncio.get_event_loop().create_task(compact_model())
+    except Exception as e:
+        logger.error(f"Error executing scheduled compaction: {str(e)}")
+
 async def scheduler_loop():
     """Run the scheduler loop to check for pending jobs"""
     logger.info("Scheduler loop started")
@@ -79,6 +209,10 @@ def start_scheduler():
         logger.info("Starting the task scheduler")
         schedule.every().day.at("00:00").do(run_retrain)
         logger.info("Model retraining scheduled for the 1st day of each month at 00:00")
+        schedule.every(settings.MODEL_COMPACTION_HOURS).hours.do(run_compaction)
+        logger.info(f"Model compaction scheduled every {settings.MODEL_COMPACTION_HOURS} hours")
+        schedule.every(settings.RETRAIN_CHECK_MINUTES).minutes.do(run_change_check)
+        logger.info(f"Producer data checked for changes every {settings.RETRAIN_CHECK_MINUTES} minutes")
         return asyncio.create_task(scheduler_loop())
     except Exception as e:
         logger.error(f"Error starting scheduler: {e}")
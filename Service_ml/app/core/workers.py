@@ -0,0 +1,68 @@
+import os
+import asyncio
+import logging
+from typing import List
+
+from app.core.config import settings
+from app.core.file_lock import FileLock
+from app.core.scheduler import start_scheduler
+from app.models.ml_model import recommender_model
+from app.models.database import db
+
+logger = logging.getLogger(__name__)
+
+LEADER_LOCK_FILE = "leader.lock"
+
+# Held by the one server process that runs the scheduler and follows producer changes
+leader_lock = FileLock(os.path.join(settings.MODEL_ARTIFACT_DIR, LEADER_LOCK_FILE))
+
+
+def is_leader() -> bool:
+    """Whether this server process is the leader"""
+    return leader_lock.held
+
+
+def _start_leader_tasks() -> List[asyncio.Task]:
+    """Background work that must run in only one process: scheduled retraining and the change stream"""
+    tasks = []
+    scheduler_task = start_scheduler()
+    if scheduler_task:
+        tasks.append(scheduler_task)
+    if settings.PRODUCER_CHANGE_STREAM:
+        tasks.append(asyncio.create_task(db.watch_producer_changes()))
+    return tasks
+
+
+async def coordinate_workers():
+    """
+    Run alongside every server process, e.g. each worker of uvicorn --workers N.
+    One process becomes the leader by taking a lock in the model directory and runs the
+    leader tasks; the others keep trying, so one of them takes over if the leader exits.
+    Every process, the leader included, regularly reloads the model when another process
+    has installed a new version or recorded producer updates. Versions are memory-mapped,
+    so all processes share one copy of the arrays in the page cache.
+    """
+    leader_tasks: List[asyncio.Task] = []
+    loop = asyncio.get_running_loop()
+    try:
+        while True:
+            if not leader_lock.held and leader_lock.acquire():
+                leader_lock.write_owner(str(os.getpid()))
+                logger.info(f"Process {os.getpid()} is the leader: running the scheduler")
+                leader_tasks = _start_leader_tasks()
+
+            try:
+                await loop.run_in_executor(None, recommender_model.refresh)
+            except Exception as e:
+                logger.error(f"Error reloading model: {str(e)}")
+
+            await asyncio.sleep(settings.MODEL_RELOAD_SECONDS)
+    finally:
+        for task in leader_tasks:
+            task.cancel()
+        for task in leader_tasks:
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+        leader_lock.release()
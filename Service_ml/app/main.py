@@ -5,7 +5,13 @@ import asyncio
 from app.core.config import settings
 from app.api.router import api_router
 from app.models.database import db
-from app.core.scheduler import start_scheduler, get_next_retraining_time
+from app.models.ml_model import recommender_model
+from app.models.reason_cache import reason_cache
+from app.models.query_parser import query_parser
+from app.models.llm_client import llm_stats
+from app.core.scheduler import get_next_retraining_time, latest_dataset_changes
+from app.core.workers import coordinate_workers, is_leader
+from app.models.training import shutdown_training_executor
 
 # Create FastAPI app
 app = FastAPI(
@@ -26,37 +32,47 @@ app.add_middleware(
 # Include API routes
 app.include_router(api_router)
 
-# Scheduler task
-scheduler_task = None
+# Worker coordination task: leader election, and the scheduler and change stream when leader
+coordination_task = None
 
 @app.on_event("startup")
 async def startup_db_client():
-    """Initialize database connection and start scheduler on startup"""
-    global scheduler_task
+    """Initialize database connection and start worker coordination on startup"""
+    global coordination_task
     try:
         # Connect to database
         await db.connect_to_database()
-        # Start the scheduler in a background task
-        scheduler_task = start_scheduler()
+        # Keep the model up to date as producers are added, changed or removed
+        db.add_change_listener(recommender_model.on_producer_changes)
+        # Drop cached recommendation reasons of changed producers
+        db.add_change_listener(reason_cache.on_producer_changes)
+        # Start the scheduler if this process is elected leader, and follow models written by other processes
+        coordination_task = asyncio.create_task(coordinate_workers())
     except Exception as e:
         print(f"Error during startup: {e}")
 
 
 @app.on_event("shutdown")
 async def shutdown_db_client():
-    """Close database connection and cancel scheduler on shutdown"""
-    global scheduler_task
+    """Close database connection and stop worker coordination on shutdown"""
+    global coordination_task
     
-    # Close database connection
-    await db.close_database_connection()
-    
-    # Cancel the scheduler task if it exists
-    if scheduler_task:
-        scheduler_task.cancel()
+    # Stop the scheduler and change stream and hand leadership to another process
+    if coordination_task:
+        coordination_task.cancel()
         try:
-            await scheduler_task
+            await coordination_task
         except asyncio.CancelledError:
             pass
+    
+    # Close database connection
+    await db.close_database_connection()
+    
+    # Stop the training worker process
+    shutdown_training_executor()
+    
+    # Write out queued reason cache entries
+    reason_cache.close()
 
 
 @app.get("/", tags=["status"])
@@ -75,11 +91,23 @@ async def health_check():
     next_retraining = get_next_retraining_time()
     next_retraining_str = next_retraining.strftime("%Y-%m-%d %H:%M:%S") if next_retraining else None
     
+    # Latest comparison of the producer data with the data the model was trained on, made by the scheduled change check
+    dataset = latest_dataset_changes() or {"current": None, "trained": None, "changed_fraction": None, "checked_at": None}
+    
     return {
         "status": "healthy",
         "database_connected": db.client is not None,
         "model_loaded": hasattr(app, "model") and app.model is not None,
-        "next_model_retraining": next_retraining_str
+        "model_version": recommender_model.state.version if recommender_model.state is not None else None,
+        "leader": is_leader(),
+        "next_model_retraining": next_retraining_str,
+        "dataset_fingerprint": dataset["current"],
+        "trained_dataset_fingerprint": dataset["trained"],
+        "dataset_changed_fraction": dataset["changed_fraction"],
+        "dataset_checked_at": dataset["checked_at"],
+        "reason_cache": reason_cache.stats(),
+        "query_cache": query_parser.stats(),
+        "llm": llm_stats()
     }
 
 
@@ -0,0 +1,139 @@
+import os
+import json
+import numpy as np
+from scipy import sparse
+from typing import Dict, Any, Optional
+
+from app.models.serving import ServingState
+
+# Bump when the on-disk layout changes in a way older readers cannot handle
+ARTIFACT_FORMAT_VERSION = 2
+# Version 1 artifacts only stored a dense feature matrix and are still readable
+SUPPORTED_FORMAT_VERSIONS = (1, 2)
+MANIFEST_FILE = "manifest.json"
+
+
+def artifact_exists(directory: str) -> bool:
+    """Check whether a model artifact has been written to the directory"""
+    return os.path.exists(os.path.join(directory, MANIFEST_FILE))
+
+
+def _state_arrays(state: ServingState) -> Dict[str, np.ndarray]:
+    """Arrays stored next to the manifest, one .npy file each so they can be memory-mapped"""
+    if state.is_sparse:
+        arrays = {
+            "feature_data": state.feature_matrix.data,
+            "feature_indices": state.feature_matrix.indices,
+            "feature_indptr": state.feature_matrix.indptr
+        }
+    else:
+        arrays = {"feature_matrix": state.feature_matrix}
+    arrays["row_norms"] = state.row_norms
+    arrays["genre_index_indptr"] = state.genre_index_indptr
+    arrays["genre_index_rows"] = state.genre_index_rows
+    if state.neighbor_table is not None:
+        arrays["neighbor_indices"], arrays["neighbor_scores"] = state.neighbor_table
+    return arrays
+
+
+def _atomic_write(path: str, write):
+    """Write a file next to its destination and move it into place in one step"""
+    tmp_path = f"{path}.tmp-{os.getpid()}"
+    with open(tmp_path, "wb") as f:
+        write(f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+def save_artifact(directory: str, state: ServingState, info: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Persist a serving state as a manifest plus one .npy file per array.
+    Arrays are written first and the manifest last, each replaced atomically,
+    so processes that have the previous files mapped keep reading valid data.
+    Returns the manifest that was written.
+    """
+    os.makedirs(directory, exist_ok=True)
+
+    arrays = {}
+    for name, array in _state_arrays(state).items():
+        array = np.ascontiguousarray(array)
+        file_name = f"{name}.npy"
+        _atomic_write(os.path.join(directory, file_name), lambda f: np.save(f, array))
+        arrays[name] = {"file": file_name, "dtype": str(array.dtype), "shape": list(array.shape)}
+
+    manifest = {
+        "format_version": ARTIFACT_FORMAT_VERSION,
+        "feature_format": "csr" if state.is_sparse else "dense",
+        "feature_shape": [state.n_producers, state.n_features],
+        "all_genres": state.all_genres,
+        "all_skills": state.all_skills,
+        "all_tools": state.all_tools,
+        "all_experience_levels": state.all_experience_levels,
+        "producer_ids": state.producer_ids,
+        "producer_names": state.producer_names,
+        **info,
+        "arrays": arrays
+    }
+    _atomic_write(os.path.join(directory, MANIFEST_FILE),
+                  lambda f: f.write(json.dumps(manifest).encode("utf-8")))
+    return manifest
+
+
+def load_artifact(directory: str, mmap_mode: Optional[str] = "r", version: Optional[str] = None) -> ServingState:
+    """
+    Load a serving state, with its manifest as metadata, from an artifact directory.
+    Arrays are memory-mapped read-only by default so that several server
+    processes share the same pages through the OS page cache.
+    """
+    with open(os.path.join(directory, MANIFEST_FILE), "r") as f:
+        manifest = json.load(f)
+
+    format_version = manifest.get("format_version")
+    if format_version not in SUPPORTED_FORMAT_VERSIONS:
+        raise ValueError(f"Unsupported model artifact format version: {format_version}")
+
+    arrays = {}
+    for name, spec in manifest["arrays"].items():
+        array = np.load(os.path.join(directory, spec["file"]), mmap_mode=mmap_mode, allow_pickle=False)
+        if list(array.shape) != spec["shape"] or str(array.dtype) != spec["dtype"]:
+            raise ValueError(f"Model artifact array '{name}' does not match its manifest")
+        arrays[name] = array
+
+    if manifest.get("feature_format", "dense") == "csr":
+        feature_matrix = sparse.csr_matrix(
+            (arrays["feature_data"], arrays["feature_indices"], arrays["feature_indptr"]),
+            shape=tuple(manifest["feature_shape"])
+        )
+    else:
+        feature_matrix = arrays["feature_matrix"]
+
+    state = ServingState(
+        feature_matrix=feature_matrix,
+        producer_ids=manifest["producer_ids"],
+        producer_names=manifest["producer_names"],
+        all_genres=manifest["all_genres"],
+        all_skills=manifest["all_skills"],
+        all_tools=manifest["all_tools"],
+        all_experience_levels=manifest["all_experience_levels"],
+        row_norms=arrays["row_norms"],
+        genre_index=(arrays["genre_index_indptr"], arrays["genre_index_rows"]),
+        neighbor_table=(arrays["neighbor_indices"], arrays["neighbor_scores"]) if "neighbor_indices" in arrays else None,
+        metadata=manifest,
+        version=version
+    )
+    return state
+
+
+def load_legacy_metadata(metadata_path: str, sparse_features: bool = False) -> ServingState:
+    """
+    Load a model saved in the original format, where the feature matrix is
+    embedded in the JSON metadata file. Kept so existing models can be migrated.
+    """
+    with open(metadata_path, "r") as f:
+        metadata = json.load(f)
+    state = ServingState.from_metadata(metadata, sparse_features=sparse_features)
+    # The raw feature list is not kept around once the serving state is built
+    metadata.pop("feature_matrix", None)
+    state.metadata = metadata
+    return state
@@ -1,7 +1,13 @@
+import asyncio
+from datetime import datetime
 from motor.motor_asyncio import AsyncIOMotorClient, AsyncIOMotorDatabase, AsyncIOMotorCollection
-from typing import Dict, List, Any, Optional
+from typing import Dict, List, Any, Optional, AsyncIterator, Awaitable, Callable
 
 from app.core.config import settings
+from app.models.features import TRAINING_PROJECTION, training_fields
+
+# Receives producer changes as a list of {"upsert": producer document} or {"delete": producer id}
+ChangeListener = Callable[[List[Dict[str, Any]]], Awaitable[None]]
 
 
 class Database:
@@ -10,6 +16,9 @@ class Database:
     client: Optional[AsyncIOMotorClient] = None
     db: Optional[AsyncIOMotorDatabase] = None
     
+    def __init__(self):
+        self.change_listeners: List[ChangeListener] = []
+    
     async def connect_to_database(self):
         """Connect to MongoDB database"""
         self.client = AsyncIOMotorClient(settings.MONGODB_URL)
@@ -32,12 +41,76 @@ class Database:
         producers = await collection.find({"role": "Music Producer"}).to_list(length=None)
         return producers
     
+    async def count_producers(self) -> int:
+        """Count producers in database"""
+        collection = self.get_collection(settings.PRODUCER_COLLECTION)
+        return await collection.count_documents({"role": "Music Producer"})
+    
+    async def get_dataset_fingerprint(self) -> Dict[str, Any]:
+        """
+        Cheap summary of the producer data: the number of producers and the latest updatedAt.
+        Both come from the database without reading any producer documents in full.
+        """
+        collection = self.get_collection(settings.PRODUCER_COLLECTION)
+        count = await collection.count_documents({"role": "Music Producer"})
+        latest = await collection.find_one(
+            {"role": "Music Producer", "updatedAt": {"$exists": True}},
+            {"updatedAt": 1},
+            sort=[("updatedAt", -1)]
+        )
+        updated_at = latest.get("updatedAt") if latest else None
+        if isinstance(updated_at, datetime):
+            updated_at = updated_at.isoformat()
+        return {"count": count, "max_updated_at": str(updated_at) if updated_at is not None else None}
+    
+    async def count_producers_updated_since(self, updated_at: str) -> int:
+        """Count producers added or changed after the given updatedAt from a fingerprint"""
+        collection = self.get_collection(settings.PRODUCER_COLLECTION)
+        try:
+            since: Any = datetime.fromisoformat(updated_at)
+        except ValueError:
+            # updatedAt is stored as a string rather than a date
+            since = updated_at
+        return await collection.count_documents({"role": "Music Producer", "updatedAt": {"$gt": since}})
+    
+    async def iter_training_producers(self, batch_size: int = None) -> AsyncIterator[List[Dict[str, Any]]]:
+        """
+        Stream producers in batches with only the fields used for training.
+        The projection is applied server-side, so unused fields never leave the database.
+        """
+        batch_size = batch_size or settings.TRAINING_BATCH_SIZE
+        collection = self.get_collection(settings.PRODUCER_COLLECTION)
+        cursor = collection.find({"role": "Music Producer"}, TRAINING_PROJECTION).batch_size(batch_size)
+        
+        batch = []
+        async for producer in cursor:
+            batch.append(producer)
+            if len(batch) >= batch_size:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+    
     async def get_producer_by_id(self, producer_id: str) -> Optional[Dict[str, Any]]:
         """Get producer by ID"""
         collection = self.get_collection(settings.PRODUCER_COLLECTION)
         producer = await collection.find_one({"_id": producer_id, "role": "Music Producer"})
         return producer
     
+    async def get_producers_by_ids(self, producer_ids: List[Any],
+                                   projection: Optional[Dict[str, Any]] = None) -> List[Optional[Dict[str, Any]]]:
+        """
+        Get several producers with one query, in the order of the given ids; None for ids
+        that are not producers. A projection limits the fields read from the database.
+        """
+        if not producer_ids:
+            return []
+        collection = self.get_collection(settings.PRODUCER_COLLECTION)
+        cursor = collection.find({"_id": {"$in": list(producer_ids)}, "role": "Music Producer"}, projection)
+        # The database returns matches in its own order
+        producers = {producer["_id"]: producer async for producer in cursor}
+        return [producers.get(producer_id) for producer_id in producer_ids]
+    
     async def get_producer_by_name(self, name: str) -> Optional[Dict[str, Any]]:
         """Get producer by name"""
         collection = self.get_collection(settings.PRODUCER_COLLECTION)
@@ -48,6 +121,7 @@ class Database:
         """Add a new producer to database"""
         collection = self.get_collection(settings.PRODUCER_COLLECTION)
         result = await collection.insert_one(producer_data)
+        await self._notify_saved(result.inserted_id)
         return str(result.inserted_id)
     
     async def update_producer(self, producer_id: str, producer_data: Dict[str, Any]) -> bool:
@@ -57,13 +131,77 @@ class Database:
             {"_id": producer_id},
             {"$set": producer_data}
         )
+        if result.modified_count > 0:
+            await self._notify_saved(producer_id)
         return result.modified_count > 0
     
     async def delete_producer(self, producer_id: str) -> bool:
         """Delete producer from database"""
         collection = self.get_collection(settings.PRODUCER_COLLECTION)
         result = await collection.delete_one({"_id": producer_id})
+        if result.deleted_count > 0:
+            await self._notify_changes([{"delete": str(producer_id)}])
         return result.deleted_count > 0
+    
+    def add_change_listener(self, listener: ChangeListener):
+        """Register a coroutine function to call with producer changes"""
+        self.change_listeners.append(listener)
+    
+    async def _notify_changes(self, changes: List[Dict[str, Any]]):
+        """Pass producer changes to every listener; a failing listener does not fail the write"""
+        for listener in self.change_listeners:
+            try:
+                await listener(changes)
+            except Exception as e:
+                print(f"Error in producer change listener: {str(e)}")
+    
+    async def _notify_saved(self, producer_id: Any):
+        """Notify listeners of a written producer, unless a change stream will report it"""
+        if settings.PRODUCER_CHANGE_STREAM or not self.change_listeners:
+            return
+        collection = self.get_collection(settings.PRODUCER_COLLECTION)
+        producer = await collection.find_one({"_id": producer_id}, {**TRAINING_PROJECTION, "role": 1})
+        await self._notify_changes([self._producer_change(producer, producer_id)])
+    
+    @staticmethod
+    def _producer_change(producer: Optional[Dict[str, Any]], producer_id: Any) -> Dict[str, Any]:
+        """The model change for a written document: only music producers are recommended"""
+        if producer and producer.get("role") == "Music Producer":
+            return {"upsert": training_fields(producer)}
+        return {"delete": str(producer_id)}
+    
+    async def watch_producer_changes(self):
+        """
+        Follow the producer collection's change stream and pass changes to the listeners.
+        Events that arrive together are passed on as one batch. Requires MongoDB to run as a replica set.
+        """
+        collection = self.get_collection(settings.PRODUCER_COLLECTION)
+        pipeline = [{"$match": {"operationType": {"$in": ["insert", "update", "replace", "delete"]}}}]
+        resume_token = None
+        while True:
+            try:
+                async with collection.watch(pipeline, full_document="updateLookup",
+                                            resume_after=resume_token) as stream:
+                    print("Watching producer changes")
+                    while stream.alive:
+                        event = await stream.next()
+                        events = [event]
+                        while len(events) < settings.CHANGE_STREAM_BATCH_SIZE:
+                            event = await stream.try_next()
+                            if event is None:
+                                break
+                            events.append(event)
+                        
+                        await self._notify_changes([
+                            self._producer_change(event.get("fullDocument"), event["documentKey"]["_id"])
+                            for event in events
+                        ])
+                        resume_token = stream.resume_token
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"Producer change stream error: {str(e)}")
+                await asyncio.sleep(5)
 
 
 # Create database instance
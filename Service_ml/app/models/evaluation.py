@@ -0,0 +1,96 @@
+import numpy as np
+from scipy import sparse
+from typing import Dict, Any, Iterator, Optional, Tuple
+
+# z-score for a two-sided 95% confidence interval
+CONFIDENCE_Z = 1.96
+
+
+def normalize_rows(feature_matrix):
+    """L2-normalize every row in float64; rows with no features stay all zero"""
+    if sparse.issparse(feature_matrix):
+        matrix = sparse.csr_matrix(feature_matrix, dtype=np.float64, copy=True)
+        norms = np.sqrt(np.asarray(matrix.power(2).sum(axis=1)).ravel())
+        scale = np.divide(1.0, norms, out=np.zeros_like(norms), where=norms > 0)
+        # Scale each stored value by its row's factor
+        matrix.data *= np.repeat(scale, np.diff(matrix.indptr))
+        return matrix
+    matrix = np.asarray(feature_matrix, dtype=np.float64)
+    norms = np.linalg.norm(matrix, axis=1)
+    scale = np.divide(1.0, norms, out=np.zeros_like(norms), where=norms > 0)
+    return matrix * scale[:, None]
+
+
+def blocked_top_k(normalized, k: int, rows: Optional[np.ndarray] = None,
+                  block_elements: int = 16_000_000) -> Iterator[Tuple[np.ndarray, np.ndarray, np.ndarray]]:
+    """
+    Find the k most similar producers (including the producer itself) for each requested row.
+    Similarities are computed one block of rows at a time so that at most
+    block_elements similarity values are held in memory.
+    Yields (rows, neighbour indices, similarities) per block, best neighbours first.
+    """
+    n_producers = normalized.shape[0]
+    if rows is None:
+        rows = np.arange(n_producers)
+    k = min(k, n_producers)
+    block_size = max(1, block_elements // max(n_producers, 1))
+    transposed = normalized.T.tocsr() if sparse.issparse(normalized) else normalized.T
+
+    for start in range(0, len(rows), block_size):
+        block_rows = rows[start:start + block_size]
+        similarities = normalized[block_rows] @ transposed
+        if sparse.issparse(similarities):
+            similarities = similarities.toarray()
+        similarities = np.asarray(similarities)
+
+        if k < n_producers:
+            candidates = np.argpartition(-similarities, k - 1, axis=1)[:, :k]
+        else:
+            candidates = np.tile(np.arange(n_producers), (len(block_rows), 1))
+        candidate_similarities = np.take_along_axis(similarities, candidates, axis=1)
+        # Order by descending similarity, breaking ties by producer index
+        order = np.lexsort((candidates, -candidate_similarities), axis=1)
+        yield (block_rows,
+               np.take_along_axis(candidates, order, axis=1),
+               np.take_along_axis(candidate_similarities, order, axis=1))
+
+
+def evaluate_neighbor_similarity(feature_matrix, n_neighbors: int, sample_size: Optional[int] = None,
+                                 block_elements: int = 16_000_000, random_state: int = 0) -> Dict[str, Any]:
+    """
+    Average cosine similarity between each producer and its nearest neighbours, excluding itself.
+    When sample_size is smaller than the catalogue, the statistic is estimated on a random sample
+    of producers and reported with a 95% confidence interval.
+    """
+    normalized = normalize_rows(feature_matrix)
+    n_producers = normalized.shape[0]
+
+    rows = np.arange(n_producers)
+    sampled = bool(sample_size) and sample_size < n_producers
+    if sampled:
+        rows = np.sort(np.random.default_rng(random_state).choice(n_producers, size=sample_size, replace=False))
+
+    per_producer = np.empty(len(rows))
+    position = 0
+    for block_rows, _, similarities in blocked_top_k(normalized, n_neighbors, rows, block_elements):
+        # Skip the first neighbour when it is the producer itself (a distance of zero)
+        is_self = similarities[:, 0] > 1 - 1e-6
+        totals = similarities.sum(axis=1)
+        counts = np.full(len(block_rows), similarities.shape[1], dtype=np.float64)
+        totals[is_self] -= similarities[is_self, 0]
+        counts[is_self] -= 1
+        per_producer[position:position + len(block_rows)] = totals / counts
+        position += len(block_rows)
+
+    result = {
+        "avg_similarity": float(np.mean(per_producer)),
+        "evaluated_producers": int(len(rows))
+    }
+    if sampled:
+        # Standard error with a finite population correction
+        standard_error = (np.std(per_producer, ddof=1) / np.sqrt(len(rows))
+                          * np.sqrt(1 - len(rows) / n_producers))
+        margin = CONFIDENCE_Z * standard_error
+        result["avg_similarity_ci"] = [float(result["avg_similarity"] - margin), float(result["avg_similarity"] + margin)]
+    return result
+
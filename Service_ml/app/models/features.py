@@ -0,0 +1,149 @@
+import numpy as np
+from scipy import sparse
+from typing import List, Dict, Any
+
+from app.models.serving import GENRE_WEIGHT, SKILL_WEIGHT, TOOL_WEIGHT, EXPERIENCE_WEIGHT
+
+# Producer fields that make up the feature vector, in column order
+FEATURE_FIELDS = ("genres", "skills", "tools", "experience")
+FIELD_WEIGHTS = np.array([GENRE_WEIGHT, SKILL_WEIGHT, TOOL_WEIGHT, EXPERIENCE_WEIGHT], dtype=np.float32)
+
+# Only these fields are needed to train the model
+TRAINING_PROJECTION = {"_id": 1, "fullName": 1, "genres": 1, "skills": 1, "tools": 1, "experience": 1}
+
+# Initial guess of non-zero features per producer, used to pre-size the buffers
+ESTIMATED_FEATURES_PER_PRODUCER = 12
+
+
+def training_fields(producer: Dict[str, Any]) -> Dict[str, Any]:
+    """The fields of a producer document used for training, with its id as a string"""
+    return {
+        key: str(producer[key]) if key == "_id" else producer[key]
+        for key in TRAINING_PROJECTION if key in producer
+    }
+
+
+class EncodedProducers:
+    """Producer feature rows with their final, sorted vocabularies"""
+
+    def __init__(self, producer_ids: List[str], producer_names: List[str], vocabularies: Dict[str, List[str]],
+                 indptr: np.ndarray, indices: np.ndarray, data: np.ndarray):
+        self.producer_ids = producer_ids
+        self.producer_names = producer_names
+        self.all_genres = vocabularies["genres"]
+        self.all_skills = vocabularies["skills"]
+        self.all_tools = vocabularies["tools"]
+        self.all_experience_levels = vocabularies["experience"]
+        self.indptr = indptr
+        self.indices = indices
+        self.data = data
+
+    @property
+    def n_producers(self) -> int:
+        return len(self.producer_ids)
+
+    @property
+    def n_features(self) -> int:
+        return (len(self.all_genres) + len(self.all_skills) + len(self.all_tools)
+                + len(self.all_experience_levels))
+
+    def feature_matrix(self, sparse_features: bool = True):
+        """Feature matrix as CSR, or as a dense array when the dense path is configured"""
+        matrix = sparse.csr_matrix((self.data, self.indices, self.indptr),
+                                   shape=(self.n_producers, self.n_features))
+        matrix.sort_indices()
+        return matrix if sparse_features else matrix.toarray()
+
+
+class FeatureEncoder:
+    """
+    Encodes producer documents into sparse feature rows as they arrive, batch by batch.
+    Vocabulary values get provisional ids in the order they are first seen; finalize()
+    maps them to the sorted column layout once every producer has been added.
+    """
+
+    def __init__(self, expected_count: int = 0):
+        capacity = max(expected_count, 1)
+        self.producer_ids: List[str] = []
+        self.producer_names: List[str] = []
+        self._vocabularies: List[Dict[Any, int]] = [{} for _ in FEATURE_FIELDS]
+        # Number of entries written after each row, and the (field, provisional id) of every entry
+        self._row_ends = np.zeros(capacity, dtype=np.int64)
+        self._fields = np.zeros(capacity * ESTIMATED_FEATURES_PER_PRODUCER, dtype=np.int8)
+        self._ids = np.zeros(capacity * ESTIMATED_FEATURES_PER_PRODUCER, dtype=np.int32)
+        self._nnz = 0
+
+    def _entries(self, producer: Dict[str, Any]) -> List[tuple]:
+        entries = []
+        for field, key in enumerate(FEATURE_FIELDS[:3]):
+            values = producer.get(key)
+            if not isinstance(values, list):
+                continue
+            vocabulary = self._vocabularies[field]
+            # Repeated values count once, like a multi-hot encoding
+            for value in dict.fromkeys(values):
+                entries.append((field, vocabulary.setdefault(value, len(vocabulary))))
+
+        experience = producer.get("experience")
+        if experience and isinstance(experience, str):
+            vocabulary = self._vocabularies[3]
+            entries.append((3, vocabulary.setdefault(experience, len(vocabulary))))
+        return entries
+
+    def add(self, producer: Dict[str, Any]):
+        """Encode a single producer document"""
+        entries = self._entries(producer)
+        row = len(self.producer_ids)
+
+        if row >= len(self._row_ends):
+            self._row_ends = np.resize(self._row_ends, 2 * len(self._row_ends))
+        end = self._nnz + len(entries)
+        if end > len(self._ids):
+            capacity = max(end, 2 * len(self._ids))
+            self._fields = np.resize(self._fields, capacity)
+            self._ids = np.resize(self._ids, capacity)
+
+        if entries:
+            fields, ids = zip(*entries)
+            self._fields[self._nnz:end] = fields
+            self._ids[self._nnz:end] = ids
+        self._nnz = end
+        self._row_ends[row] = end
+
+        self.producer_ids.append(str(producer["_id"]))
+        self.producer_names.append(producer.get("fullName", ""))
+
+    def add_batch(self, producers: List[Dict[str, Any]]):
+        """Encode a batch of producer documents"""
+        for producer in producers:
+            self.add(producer)
+
+    def finalize(self) -> EncodedProducers:
+        """Sort the vocabularies and build the final feature rows"""
+        fields = self._fields[:self._nnz]
+        ids = self._ids[:self._nnz]
+        indices = np.empty(self._nnz, dtype=np.int32)
+
+        vocabularies = {}
+        offset = 0
+        for field, key in enumerate(FEATURE_FIELDS):
+            vocabulary = self._vocabularies[field]
+            values = sorted(vocabulary)
+            # Map provisional ids to positions in the sorted vocabulary
+            column_of_id = np.empty(len(values), dtype=np.int32)
+            column_of_id[[vocabulary[value] for value in values]] = np.arange(len(values), dtype=np.int32)
+            mask = fields == field
+            indices[mask] = offset + column_of_id[ids[mask]]
+            vocabularies[key] = values
+            offset += len(values)
+
+        n_rows = len(self.producer_ids)
+        indptr = np.concatenate(([0], self._row_ends[:n_rows])).astype(np.int64)
+        return EncodedProducers(
+            producer_ids=self.producer_ids,
+            producer_names=self.producer_names,
+            vocabularies=vocabularies,
+            indptr=indptr,
+            indices=indices,
+            data=FIELD_WEIGHTS[fields]
+        )
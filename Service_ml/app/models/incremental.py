@@ -0,0 +1,267 @@
+import copy
+import numpy as np
+from scipy import sparse
+from typing import List, Dict, Any, Tuple
+
+from app.models.serving import ServingState, top_k_indices
+from app.models.features import FEATURE_FIELDS, FIELD_WEIGHTS
+
+# Serving state attributes holding each field's vocabulary and its value -> column lookup
+VOCABULARY_ATTRIBUTES = {
+    "genres": ("all_genres", "genre_columns"),
+    "skills": ("all_skills", "skill_columns"),
+    "tools": ("all_tools", "tool_columns"),
+    "experience": ("all_experience_levels", "experience_columns")
+}
+
+
+def apply_producer_updates(state: ServingState, changes: List[Dict[str, Any]]) -> ServingState:
+    """
+    Apply producer changes to a copy of a serving state and return the copy.
+    Each change is {"upsert": producer document} or {"delete": producer id}, applied in order.
+    New producers are appended as rows and deleted ones are tombstoned, so row numbers stay stable.
+    New vocabulary values get columns after the existing ones, so existing rows are never re-encoded.
+    The genre index, neighbour table and per-column producer counts are patched for the changed rows only.
+    """
+    updated = copy.copy(state)
+    updated.producer_ids = list(state.producer_ids)
+    updated.producer_names = list(state.producer_names)
+    updated.producer_rows = dict(state.producer_rows)
+    updated.genre_positions = dict(state.genre_positions)
+    for vocabulary_attribute, columns_attribute in VOCABULARY_ATTRIBUTES.values():
+        setattr(updated, vocabulary_attribute, list(getattr(state, vocabulary_attribute)))
+        setattr(updated, columns_attribute, dict(getattr(state, columns_attribute)))
+
+    # New feature entries of every upserted row, and the rows of deleted producers
+    changed: Dict[int, Tuple[np.ndarray, np.ndarray]] = {}
+    deleted = set()
+    for change in changes:
+        if "delete" in change:
+            row = updated.producer_rows.pop(str(change["delete"]), None)
+            if row is not None:
+                deleted.add(row)
+                changed.pop(row, None)
+            continue
+
+        producer = change["upsert"]
+        producer_id = str(producer["_id"])
+        row = updated.producer_rows.get(producer_id)
+        if row is None:
+            row = len(updated.producer_ids)
+            updated.producer_rows[producer_id] = row
+            updated.producer_ids.append(producer_id)
+            updated.producer_names.append(producer.get("fullName", ""))
+        else:
+            updated.producer_names[row] = producer.get("fullName", "")
+        deleted.discard(row)
+        changed[row] = _encode_producer(updated, producer)
+
+    updated.n_producers = len(updated.producer_ids)
+    affected = np.array(sorted(set(changed) | deleted), dtype=np.int32)
+
+    _update_features(updated, state, changed, deleted)
+    updated.deleted_rows = np.zeros(updated.n_producers, dtype=bool)
+    updated.deleted_rows[:state.n_producers] = state.deleted_rows
+    updated.deleted_rows[list(deleted)] = True
+    _update_genre_index(updated, state, changed, affected)
+    if state.neighbor_table is not None:
+        updated.neighbor_table = _update_neighbor_table(updated, state.neighbor_table, changed, affected)
+
+    updated.metadata = {
+        **state.metadata,
+        **{attribute: getattr(updated, attribute) for attribute, _ in VOCABULARY_ATTRIBUTES.values()}
+    }
+    updated.applied_updates = state.applied_updates + len(changes)
+    return updated
+
+
+def _encode_producer(state: ServingState, producer: Dict[str, Any]) -> Tuple[np.ndarray, np.ndarray]:
+    """Feature columns and values of a producer, adding columns for vocabulary values not seen before"""
+    columns = []
+    values = []
+    for field, key in enumerate(FEATURE_FIELDS):
+        raw = producer.get(key)
+        if key == "experience":
+            raw = [raw] if raw and isinstance(raw, str) else []
+        elif not isinstance(raw, list):
+            continue
+
+        vocabulary_attribute, columns_attribute = VOCABULARY_ATTRIBUTES[key]
+        vocabulary = getattr(state, vocabulary_attribute)
+        column_of_value = getattr(state, columns_attribute)
+        for value in dict.fromkeys(raw):
+            if value not in column_of_value:
+                column_of_value[value] = state.n_features
+                vocabulary.append(value)
+                if key == "genres":
+                    state.genre_positions[value] = len(vocabulary) - 1
+                state.n_features += 1
+            columns.append(column_of_value[value])
+            values.append(FIELD_WEIGHTS[field])
+
+    order = np.argsort(columns)
+    return np.asarray(columns, dtype=np.int32)[order], np.asarray(values, dtype=np.float32)[order]
+
+
+def _update_features(updated: ServingState, state: ServingState,
+                     changed: Dict[int, Tuple[np.ndarray, np.ndarray]], deleted: set):
+    """Build the feature matrix, row norms and column counts with the changed rows replaced and deleted rows emptied"""
+    empty = (np.empty(0, dtype=np.int32), np.empty(0, dtype=np.float32))
+    rewritten = {row: changed.get(row, empty) for row in set(changed) | deleted}
+    shape = (updated.n_producers, updated.n_features)
+
+    column_counts = np.zeros(updated.n_features, dtype=np.int64)
+    column_counts[:state.n_features] = state.column_counts
+    for row, (columns, _) in rewritten.items():
+        if row < state.n_producers:
+            old_columns = _row_columns(state, row)
+            np.subtract.at(column_counts, old_columns, 1)
+        np.add.at(column_counts, columns, 1)
+    updated.column_counts = column_counts
+
+    if state.is_sparse:
+        matrix = state.feature_matrix
+        lengths = np.zeros(updated.n_producers, dtype=np.int64)
+        lengths[:state.n_producers] = np.diff(matrix.indptr)
+        index_pieces, data_pieces = [], []
+        position = 0
+        for row in sorted(rewritten):
+            columns, values = rewritten[row]
+            if row < state.n_producers:
+                index_pieces.append(matrix.indices[position:matrix.indptr[row]])
+                data_pieces.append(matrix.data[position:matrix.indptr[row]])
+                position = matrix.indptr[row + 1]
+            else:
+                # Appended rows come after every existing one
+                index_pieces.append(matrix.indices[position:])
+                data_pieces.append(matrix.data[position:])
+                position = len(matrix.indices)
+            index_pieces.append(columns)
+            data_pieces.append(values)
+            lengths[row] = len(columns)
+        index_pieces.append(matrix.indices[position:])
+        data_pieces.append(matrix.data[position:])
+        updated.feature_matrix = sparse.csr_matrix(
+            (np.concatenate(data_pieces), np.concatenate(index_pieces),
+             np.concatenate(([0], np.cumsum(lengths)))),
+            shape=shape
+        )
+    else:
+        matrix = np.zeros(shape, dtype=np.float32)
+        matrix[:state.n_producers, :state.n_features] = state.feature_matrix
+        for row, (columns, values) in rewritten.items():
+            matrix[row] = 0
+            matrix[row, columns] = values
+        updated.feature_matrix = matrix
+
+    row_norms = np.zeros(updated.n_producers)
+    row_norms[:state.n_producers] = state.row_norms
+    for row, (_, values) in rewritten.items():
+        row_norms[row] = np.sqrt(np.sum(values.astype(np.float64) ** 2))
+    updated.row_norms = row_norms
+
+
+def _row_columns(state: ServingState, row: int) -> np.ndarray:
+    """Columns with a non-zero value in a row of a serving state's feature matrix"""
+    if state.is_sparse:
+        start, end = state.feature_matrix.indptr[row], state.feature_matrix.indptr[row + 1]
+        return state.feature_matrix.indices[start:end][state.feature_matrix.data[start:end] != 0]
+    return np.flatnonzero(state.feature_matrix[row])
+
+
+def _update_genre_index(updated: ServingState, state: ServingState,
+                        changed: Dict[int, Tuple[np.ndarray, np.ndarray]], affected: np.ndarray):
+    """Remove the affected rows from the genre postings and insert the changed rows' current genres"""
+    n_rows = updated.n_producers
+    n_genres = len(updated.all_genres)
+    # Encode postings as genre * rows + row, which keeps them sorted by genre, then row
+    genre_ids = np.repeat(np.arange(len(state.genre_index_indptr) - 1, dtype=np.int64),
+                          np.diff(state.genre_index_indptr))
+    keep = ~np.isin(state.genre_index_rows, affected)
+    keys = genre_ids[keep] * n_rows + state.genre_index_rows[keep]
+
+    genre_of_column = {updated.genre_columns[genre]: position for genre, position in updated.genre_positions.items()}
+    new_keys = np.array(sorted(
+        genre_of_column[column] * n_rows + row
+        for row, (columns, values) in changed.items()
+        for column, value in zip(columns.tolist(), values.tolist())
+        if column in genre_of_column and value > 1.9  # Genre features were multiplied by 2.0
+    ), dtype=np.int64)
+    keys = np.insert(keys, np.searchsorted(keys, new_keys), new_keys)
+
+    updated.genre_index_rows = (keys % n_rows).astype(np.int32)
+    updated.genre_index_indptr = np.searchsorted(keys // n_rows, np.arange(n_genres + 1)).astype(np.int64)
+
+
+def _update_neighbor_table(updated: ServingState, neighbor_table: Tuple[np.ndarray, np.ndarray],
+                           changed: Dict[int, Tuple[np.ndarray, np.ndarray]], affected: np.ndarray,
+                           block_elements: int = 16_000_000) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Rescore the changed rows and every row that listed an affected producer against the whole catalogue,
+    then add the changed producers to the other rows they are now among the closest neighbours of.
+    """
+    old_indices, old_scores = neighbor_table
+    n_producers = updated.n_producers
+    k = old_indices.shape[1]
+    indices = np.full((n_producers, k), -1, dtype=np.int32)
+    indices[:len(old_indices)] = old_indices
+    # Empty slots score -inf while the table is being patched
+    scores = np.full((n_producers, k), -np.inf, dtype=np.float32)
+    scores[:len(old_scores)] = old_scores
+    scores[indices < 0] = -np.inf
+    if k == 0:
+        return indices, scores
+
+    lost_neighbor = np.isin(indices, affected).any(axis=1)
+    indices[affected] = -1
+    scores[affected] = -np.inf
+    rescore = np.union1d(np.flatnonzero(lost_neighbor), np.array(sorted(changed), dtype=np.int64))
+    rescore = rescore[~updated.deleted_rows[rescore]]
+    rescored = np.zeros(n_producers, dtype=bool)
+    rescored[rescore] = True
+
+    matrix = updated.feature_matrix
+    transposed = matrix.T.tocsr() if updated.is_sparse else matrix.T
+    block_size = max(1, block_elements // max(n_producers, 1))
+    for start in range(0, len(rescore), block_size):
+        rows = rescore[start:start + block_size]
+        dot_products = matrix[rows] @ transposed
+        if sparse.issparse(dot_products):
+            dot_products = dot_products.toarray()
+        denominators = updated.row_norms[rows][:, None] * updated.row_norms[None, :]
+        similarities = np.zeros(denominators.shape)
+        np.divide(np.asarray(dot_products, dtype=np.float64), denominators, out=similarities, where=denominators > 0)
+        similarities[:, updated.deleted_rows] = -np.inf
+
+        for row, row_similarities in zip(rows.tolist(), similarities):
+            row_similarities[row] = -np.inf
+            top = top_k_indices(row_similarities, k)
+            top = top[row_similarities[top] > -np.inf]
+            indices[row] = -1
+            scores[row] = -np.inf
+            indices[row, :len(top)] = top
+            scores[row, :len(top)] = row_similarities[top]
+
+            if row in changed:
+                # Rows not rescored that the changed producer now beats their last neighbour for,
+                # with ties going to the lower row as in a full build
+                last_scores = scores[:, -1]
+                closer = (row_similarities > last_scores) | (
+                    (row_similarities == last_scores) & (indices[:, -1] > row)
+                )
+                closer = np.flatnonzero(closer & ~rescored)
+                indices[closer, -1] = row
+                scores[closer, -1] = row_similarities[closer]
+                _sort_neighbor_rows(indices, scores, closer)
+
+    scores[indices < 0] = 0
+    return indices, scores
+
+
+def _sort_neighbor_rows(indices: np.ndarray, scores: np.ndarray, rows: np.ndarray):
+    """Re-sort the given neighbour lists by descending score, breaking ties by index; empty slots go last"""
+    if len(rows) == 0:
+        return
+    order = np.lexsort((indices[rows], -scores[rows]), axis=1)
+    indices[rows] = np.take_along_axis(indices[rows], order, axis=1)
+    scores[rows] = np.take_along_axis(scores[rows], order, axis=1)
@@ -0,0 +1,271 @@
+import time
+import asyncio
+from collections import deque
+from functools import partial
+from typing import List, Dict, Any, Optional
+import google.generativeai as genai
+
+from app.core.config import settings
+
+GEMINI_MODEL_NAME = "gemini-2.0-flash"
+
+
+class LLMUnavailableError(Exception):
+    """The model was not asked: no API key is configured or the circuit breaker is open"""
+
+
+class Deadline:
+    """The time left to answer one request, shared by every model call made for it"""
+
+    def __init__(self, seconds: float):
+        self.expires_at = time.monotonic() + seconds
+
+    def remaining(self) -> float:
+        return max(self.expires_at - time.monotonic(), 0.0)
+
+
+def time_budget(timeout: float, deadline: Optional[Deadline] = None) -> float:
+    """A call's timeout, cut short by the request's deadline if there is one"""
+    return timeout if deadline is None else min(timeout, deadline.remaining())
+
+
+class CircuitBreaker:
+    """
+    Stops calls to a failing upstream. The breaker opens when at least min_calls calls
+    finished within the last window_seconds and failure_rate of them failed; while it is
+    open calls fail at once. After cooldown_seconds one trial call is let through, which
+    closes the breaker if it succeeds and opens it again if it fails.
+    """
+
+    def __init__(self, failure_rate: float = 0.5, min_calls: int = 10,
+                 window_seconds: float = 60, cooldown_seconds: float = 30):
+        self.failure_rate = failure_rate
+        self.min_calls = min_calls
+        self.window_seconds = window_seconds
+        self.cooldown_seconds = cooldown_seconds
+        # (finish time, succeeded) of recent calls, oldest first
+        self._outcomes: deque = deque()
+        self._opened_at: Optional[float] = None
+        self._trial_running = False
+        self.rejected = 0
+
+    @property
+    def state(self) -> str:
+        if self._opened_at is None:
+            return "closed"
+        if time.monotonic() - self._opened_at < self.cooldown_seconds:
+            return "open"
+        return "half_open"
+
+    def allow(self) -> bool:
+        """Whether a call may be made now; a call that is allowed must be followed by record or release"""
+        state = self.state
+        if state == "closed":
+            return True
+        if state == "half_open" and not self._trial_running:
+            self._trial_running = True
+            return True
+        self.rejected += 1
+        return False
+
+    def release(self):
+        """Forget an allowed call that ended without an outcome, e.g. because the request was cancelled"""
+        self._trial_running = False
+
+    def record(self, succeeded: bool):
+        now = time.monotonic()
+        if self._opened_at is not None:
+            self._trial_running = False
+            if succeeded:
+                print("Gemini circuit breaker closed")
+                self._opened_at = None
+                self._outcomes.clear()
+            else:
+                self._opened_at = now
+            return
+
+        self._outcomes.append((now, succeeded))
+        while self._outcomes and self._outcomes[0][0] < now - self.window_seconds:
+            self._outcomes.popleft()
+        failures = sum(1 for _, ok in self._outcomes if not ok)
+        if len(self._outcomes) >= self.min_calls and failures >= self.failure_rate * len(self._outcomes):
+            print(f"Gemini circuit breaker opened: {failures} of the last {len(self._outcomes)} calls failed")
+            self._opened_at = now
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "state": self.state,
+            "recent_calls": len(self._outcomes),
+            "recent_failures": sum(1 for _, ok in self._outcomes if not ok),
+            "rejected": self.rejected
+        }
+
+
+class LLMClient:
+    """
+    Gemini calls with a timeout, the caller's deadline and a circuit breaker.
+    The model is configured once and reused. Once hedge_min_samples calls have succeeded,
+    a call still unanswered after the hedge_percentile latency of recent calls is sent a
+    second time and whichever answer comes first is used. Clients for different kinds of
+    calls can share one breaker, since they share one upstream.
+    model is anything with generate_content_async, e.g. a fake for testing; by default
+    it is GEMINI_MODEL_NAME with the configured API key, endpoint and transport.
+    """
+
+    def __init__(self, timeout_seconds: float, breaker: CircuitBreaker,
+                 hedge_percentile: Optional[float] = None, hedge_min_samples: int = 20, model=None):
+        self.timeout_seconds = timeout_seconds
+        self.breaker = breaker
+        self.hedge_percentile = hedge_percentile
+        self.hedge_min_samples = hedge_min_samples
+        self._model = model
+        self._injected = model is not None
+        self._model_config = None
+        # Latencies of recent successful attempts, in seconds
+        self._latencies: deque = deque(maxlen=200)
+        self.calls = 0
+        self.failures = 0
+        self.hedged = 0
+
+    @property
+    def available(self) -> bool:
+        """Whether there is a model to call"""
+        return self._injected or bool(settings.GEMINI_API_KEY)
+
+    def _get_model(self):
+        """The Gemini model, configured once and again only when the settings change"""
+        if self._injected:
+            return self._model
+        config = (settings.GEMINI_API_KEY, settings.GEMINI_API_ENDPOINT, settings.GEMINI_TRANSPORT)
+        if self._model is None or self._model_config != config:
+            _configure(*config)
+            self._model = genai.GenerativeModel(GEMINI_MODEL_NAME)
+            self._model_config = config
+        return self._model
+
+    def hedge_delay(self) -> Optional[float]:
+        """How long to wait for an answer before asking again, or None not to"""
+        if self.hedge_percentile is None or len(self._latencies) < self.hedge_min_samples:
+            return None
+        latencies = sorted(self._latencies)
+        return latencies[min(int(len(latencies) * self.hedge_percentile / 100), len(latencies) - 1)]
+
+    async def generate(self, prompt: str, generation_config: Dict[str, Any],
+                       deadline: Optional[Deadline] = None, timeout: Optional[float] = None) -> str:
+        """
+        The model's answer to a prompt. Raises LLMUnavailableError without calling the model
+        if it is not configured or the breaker is open, asyncio.TimeoutError if there is no
+        answer within the timeout or the deadline, and the model's own errors.
+        """
+        if not self.available:
+            raise LLMUnavailableError("Gemini API key not configured")
+        timeout = self.timeout_seconds if timeout is None else timeout
+        budget = time_budget(timeout, deadline)
+        if budget <= 0:
+            raise asyncio.TimeoutError()
+        if not self.breaker.allow():
+            raise LLMUnavailableError("Gemini is failing; calls are paused")
+
+        self.calls += 1
+        try:
+            text = await asyncio.wait_for(self._hedged(prompt, generation_config, budget), timeout=budget)
+        except asyncio.CancelledError:
+            self.breaker.release()
+            raise
+        except asyncio.TimeoutError:
+            self.failures += 1
+            if budget < timeout:
+                # Cut short by the caller's deadline, which says nothing about the upstream
+                self.breaker.release()
+            else:
+                self.breaker.record(False)
+            raise
+        except Exception:
+            self.failures += 1
+            self.breaker.record(False)
+            raise
+        self.breaker.record(True)
+        return text
+
+    async def _hedged(self, prompt: str, generation_config: Dict[str, Any], budget: float) -> str:
+        attempts: List[asyncio.Task] = [asyncio.ensure_future(self._attempt(prompt, generation_config, budget))]
+        try:
+            delay = self.hedge_delay()
+            if delay is not None and delay < budget:
+                done, _ = await asyncio.wait(attempts, timeout=delay)
+                if not done:
+                    self.hedged += 1
+                    attempts.append(asyncio.ensure_future(self._attempt(prompt, generation_config, budget - delay)))
+            pending = set(attempts)
+            while True:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                answered = [attempt for attempt in done if attempt.exception() is None]
+                if answered:
+                    return answered[0].result()
+                if not pending:
+                    # Every attempt failed; report the error of one of them
+                    raise done.pop().exception()
+        finally:
+            for attempt in attempts:
+                attempt.cancel()
+
+    async def _attempt(self, prompt: str, generation_config: Dict[str, Any], timeout: float) -> str:
+        model = self._get_model()
+        started = time.monotonic()
+        if settings.GEMINI_TRANSPORT == "rest" and not self._injected:
+            # The library has no asynchronous REST client, so the call runs in a thread
+            loop = asyncio.get_running_loop()
+            response = await loop.run_in_executor(None, partial(
+                model.generate_content, contents=prompt, generation_config=generation_config,
+                request_options={"timeout": timeout}
+            ))
+        else:
+            response = await model.generate_content_async(
+                contents=prompt, generation_config=generation_config,
+                request_options={"timeout": timeout}
+            )
+        text = response.text
+        self._latencies.append(time.monotonic() - started)
+        return text
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "calls": self.calls,
+            "failures": self.failures,
+            "hedged": self.hedged,
+            "hedge_delay": self.hedge_delay()
+        }
+
+
+def _configure(api_key: str, api_endpoint: Optional[str], transport: Optional[str]):
+    """Configure the Gemini library; it keeps one client per process, shared by every model"""
+    client_options = {"api_endpoint": api_endpoint} if api_endpoint else None
+    genai.configure(api_key=api_key, transport=transport, client_options=client_options)
+
+
+def llm_stats() -> Dict[str, Any]:
+    """Breaker state and per-client counters, for the health check"""
+    return {
+        "breaker": gemini_breaker.stats(),
+        "query": query_llm.stats(),
+        "reasons": reason_llm.stats()
+    }
+
+
+# One breaker for the one upstream; parsing and reason calls keep their own latencies and timeouts
+gemini_breaker = CircuitBreaker(
+    failure_rate=settings.LLM_BREAKER_FAILURE_RATE,
+    min_calls=settings.LLM_BREAKER_MIN_CALLS,
+    window_seconds=settings.LLM_BREAKER_WINDOW_SECONDS,
+    cooldown_seconds=settings.LLM_BREAKER_COOLDOWN_SECONDS
+)
+query_llm = LLMClient(
+    timeout_seconds=settings.QUERY_PARSE_TIMEOUT_SECONDS,
+    breaker=gemini_breaker,
+    hedge_percentile=settings.LLM_HEDGE_PERCENTILE
+)
+reason_llm = LLMClient(
+    timeout_seconds=settings.REASON_TIMEOUT_SECONDS,
+    breaker=gemini_breaker,
+    hedge_percentile=settings.LLM_HEDGE_PERCENTILE
+)
@@ -1,176 +1,269 @@
 import os
-import json
 import time
+import asyncio
+import threading
+from functools import partial
 import numpy as np
-import pandas as pd
-from typing import List, Dict, Any, Tuple, Optional
-from datetime import datetime
-from sklearn.neighbors import NearestNeighbors
-from sklearn.preprocessing import MultiLabelBinarizer, OneHotEncoder
-from sklearn.model_selection import train_test_split
-from sklearn.metrics.pairwise import cosine_similarity
-import joblib
+from typing import List, Dict, Any, Iterator, Optional, Tuple, AsyncIterable, Callable
 
 from app.core.config import settings
+from app.models.serving import ServingState
+from app.models.artifact import (
+    artifact_exists, save_artifact, load_artifact, load_legacy_metadata
+)
+from app.models.model_store import ModelStore
+from app.models.features import FeatureEncoder, training_fields
+from app.models.neighbors import build_neighbor_table
+from app.models.incremental import apply_producer_updates
+from app.models.training import get_training_executor, build_model_artifact
+
+# Metadata fields that the artifact manifest stores itself rather than taking from the training info
+MANIFEST_FIELDS = {
+    "format_version", "feature_format", "feature_shape", "arrays",
+    "all_genres", "all_skills", "all_tools", "all_experience_levels", "producer_ids", "producer_names"
+}
 
 
 class ProducerRecommenderModel:
     """Machine learning model for recommending music producers"""
     
     def __init__(self):
-        self.model = None
-        self.metadata = None
-        self.genre_mlb = None
-        self.skill_mlb = None
-        self.tool_mlb = None
-        self.feature_matrix = None
-        self.producer_ids = None
+        self.store = ModelStore(settings.MODEL_ARTIFACT_DIR, keep_versions=settings.MODEL_KEEP_VERSIONS)
+        # The serving state is replaced as a whole, so readers always see one complete model
+        self.state: Optional[ServingState] = None
+        # Serializes incremental updates and the install of newly trained versions;
+        # the store's own lock does the same across server processes
+        self._update_lock = threading.Lock()
+        # Version and update log size last seen by refresh
+        self._seen_updates: Optional[tuple] = None
         self._load_model()
     
+    @property
+    def metadata(self) -> Optional[Dict[str, Any]]:
+        """Metadata of the model currently being served"""
+        state = self.state
+        return state.metadata if state is not None else None
+    
+    @property
+    def trained_fingerprint(self) -> Optional[Dict[str, Any]]:
+        """Fingerprint of the producer data the served model was trained on, if recorded"""
+        state = self.state
+        if state is None:
+            return None
+        fingerprint = state.metadata.get("dataset_fingerprint")
+        if fingerprint is None and state.version is not None:
+            fingerprint = self.store.read_fingerprint(state.version)
+        return fingerprint
+    
+    def record_fingerprint(self, fingerprint: Dict[str, Any]) -> bool:
+        """
+        Record a fingerprint for a served version trained without one, such as a migrated model.
+        Returns False if the served model is not in the store.
+        """
+        state = self.state
+        if state is None or state.version is None:
+            return False
+        self.store.write_fingerprint(state.version, fingerprint)
+        return True
+    
+    @property
+    def pending_updates(self) -> int:
+        """Incremental producer changes applied to the served model since it was trained"""
+        state = self.state
+        return state.applied_updates if state is not None else 0
+    
+    def _read_version(self, version: str) -> ServingState:
+        """Load a committed model version from the store, replaying its incremental updates"""
+        state = load_artifact(self.store.version_dir(version), version=version)
+        changes = self.store.read_updates(version)
+        if changes:
+            state = apply_producer_updates(state, changes)
+        return state
+    
+    def _install_version(self, version: str, changes: Optional[List[Dict[str, Any]]] = None) -> ServingState:
+        """Load a version, apply and record any extra producer changes, make it current on disk and start serving it"""
+        state = self._read_version(version)
+        if changes:
+            state = apply_producer_updates(state, changes)
+            self.store.append_updates(version, changes)
+        self.store.set_current(version)
+        self.state = state
+        return state
+    
+    def _catch_up(self) -> bool:
+        """
+        Bring the served model up to date with the store, which other processes may have changed:
+        load a new current version, or apply updates recorded for the served one.
+        Call with both locks held. Returns whether the served model changed.
+        """
+        version = self.store.current_version()
+        state = self.state
+        if version is None:
+            return False
+        if state is None or state.version != version:
+            self.state = self._read_version(version)
+            self._seen_updates = None
+            print(f"Reloaded model version {version}")
+            return True
+        
+        size = self.store.updates_size(version)
+        if self._seen_updates == (version, size):
+            return False
+        changes = self.store.read_updates(version)[state.applied_updates:]
+        if changes:
+            self.state = apply_producer_updates(state, changes)
+        self._seen_updates = (version, size)
+        return bool(changes)
+    
+    def refresh(self) -> bool:
+        """Pick up model versions and producer updates written by other server processes"""
+        with self._update_lock, self.store.locked():
+            return self._catch_up()
+    
+    def _read_unversioned_model(self) -> Optional[ServingState]:
+        """Load a model saved before versioning: a single artifact directory or the legacy JSON metadata"""
+        if artifact_exists(settings.MODEL_ARTIFACT_DIR):
+            return load_artifact(settings.MODEL_ARTIFACT_DIR)
+        if os.path.exists(settings.MODEL_METADATA_PATH):
+            return load_legacy_metadata(settings.MODEL_METADATA_PATH, sparse_features=settings.SPARSE_FEATURES)
+        return None
+    
+    def _migrate(self, state: ServingState) -> str:
+        """Save a model loaded from an unversioned location as a new version"""
+        info = {key: value for key, value in state.metadata.items() if key not in MANIFEST_FIELDS}
+        if state.neighbor_table is None:
+            state.neighbor_table = build_neighbor_table(
+                state.feature_matrix, settings.SIMILAR_PRODUCERS_K,
+                block_elements=settings.EVALUATION_BLOCK_ELEMENTS
+            )
+            info["neighbor_k"] = settings.SIMILAR_PRODUCERS_K
+        
+        version, staging_dir = self.store.create_staging_dir()
+        try:
+            save_artifact(staging_dir, state, info)
+            self.store.commit_staging_dir(version, staging_dir)
+        except Exception:
+            self.store.discard_staging_dir(staging_dir)
+            raise
+        return version
+    
     def _load_model(self) -> bool:
         """Load the trained model and metadata from disk"""
         try:
-            if os.path.exists(settings.MODEL_PATH) and os.path.exists(settings.MODEL_METADATA_PATH):
-                self.model = joblib.load(settings.MODEL_PATH)
-                with open(settings.MODEL_METADATA_PATH, "r") as f:
-                    self.metadata = json.load(f)
-                print("Model loaded successfully")
+            version = self.store.current_version()
+            if version:
+                self.state = self._read_version(version)
+                print(f"Model version {version} loaded successfully")
                 return True
-            else:
+            
+            state = self._read_unversioned_model()
+            if state is None:
                 print("Model files not found.")
                 return False
+            
+            # Migrate a model saved in an older format into the versioned store
+            try:
+                with self.store.locked():
+                    # Another process may have migrated it first
+                    if self.store.current_version():
+                        self._catch_up()
+                        return True
+                    version = self._migrate(state)
+                    state = self._install_version(version)
+                print(f"Migrated model to version {version}")
+            except OSError as e:
+                print(f"Could not migrate model to the versioned store: {e}")
+                self.state = state
+            print("Model loaded successfully")
+            return True
         except Exception as e:
             print(f"Error loading model: {e}")
             return False
     
-    async def train(self, producers: List[Dict[str, Any]]) -> Dict[str, Any]:
-        """Train a new model using producer data"""
+    def rollback(self, version: Optional[str] = None) -> Optional[str]:
+        """
+        Serve a previously trained version, by default the one before the current model.
+        Returns the version now being served, or None if there is nothing to roll back to.
+        """
+        current = self.state.version if self.state is not None else None
+        version = version or self.store.previous_version(current)
+        if not version:
+            return None
+        if version not in self.store.list_versions():
+            raise ValueError(f"Model version '{version}' does not exist")
+        with self._update_lock, self.store.locked():
+            self._install_version(version)
+        return version
+    
+    def _training_base(self) -> Tuple[Optional[str], int]:
+        """The current version and the number of updates recorded for it, read under the store lock"""
+        with self.store.locked():
+            base_version = self.store.current_version()
+            base_updates = len(self.store.read_updates(base_version)) if base_version else 0
+        return base_version, base_updates
+    
+    def _install_trained(self, version: str, base_version: Optional[str], base_updates: int) -> List[str]:
+        """
+        Load a newly trained version, catch it up with changes recorded during training by any process,
+        swap it in with a single assignment and delete old versions. Returns the deleted versions.
+        """
+        with self._update_lock, self.store.locked():
+            changes = self.store.read_updates(base_version)[base_updates:] if base_version else []
+            self._install_version(version, changes)
+            return self.store.prune()
+    
+    async def train(self, producer_batches: AsyncIterable[List[Dict[str, Any]]],
+                    expected_count: int = 0, fingerprint: Optional[Dict[str, Any]] = None,
+                    progress: Optional[Callable[[str], None]] = None) -> Dict[str, Any]:
+        """
+        Train a new model using producer data.
+        The fingerprint of the data, taken before reading it, is recorded with the new version.
+        Producers are encoded batch by batch as they arrive, so only one batch of documents
+        is held at a time. The rest of the work runs in a worker process while the current
+        model keeps serving requests, and the new model is installed once its artifact has been written.
+        progress, if given, is called with each training stage as it starts: fetch, encode,
+        index, evaluate and persist. The last three are reported from the worker process.
+        """
         try:
             start_time = time.time()
-            
-            # Extract only the fields we need for training
-            producer_data = []
-            for p in producers:
-                producer_data.append({
-                    "_id": str(p["_id"]),
-                    "fullName": p.get("fullName", ""),
-                    "genres": p.get("genres", []),
-                    "skills": p.get("skills", []),
-                    "tools": p.get("tools", []),
-                    "experience": p.get("experience", "")
-                })
-            
-            # Convert to DataFrame
-            df = pd.DataFrame(producer_data)
-            
-            # Extract all unique values for each feature
-            all_genres = set()
-            all_skills = set()
-            all_tools = set()
-            all_experience_levels = set()
-            
-            for producer in producer_data:
-                all_genres.update(producer["genres"])
-                all_skills.update(producer["skills"])
-                all_tools.update(producer["tools"])
-                all_experience_levels.add(producer["experience"])
-            
-            all_genres = sorted(list(all_genres))
-            all_skills = sorted(list(all_skills))
-            all_tools = sorted(list(all_tools))
-            all_experience_levels = sorted(list(filter(None, all_experience_levels)))
-            
-            # Create binary features for list fields
-            genre_mlb = MultiLabelBinarizer(classes=all_genres)
-            skill_mlb = MultiLabelBinarizer(classes=all_skills)
-            tool_mlb = MultiLabelBinarizer(classes=all_tools)
-            
-            # Ensure all fields are properly formatted
-            df["genres"] = df["genres"].apply(lambda x: x if isinstance(x, list) else [])
-            df["skills"] = df["skills"].apply(lambda x: x if isinstance(x, list) else [])
-            df["tools"] = df["tools"].apply(lambda x: x if isinstance(x, list) else [])
-            
-            # Transform features
-            genre_features = genre_mlb.fit_transform(df["genres"])
-            skill_features = skill_mlb.fit_transform(df["skills"])
-            tool_features = tool_mlb.fit_transform(df["tools"])
-            
-            # Feature Weighting: Genres and skills are 2x more important than tools
-            genre_features = genre_features * 2.0
-            skill_features = skill_features * 2.0
-            
-            # Create feature matrix by combining all features
-            X = np.hstack((genre_features, skill_features, tool_features))
-            
-            # If we have experience data, add it as one-hot encoded features
-            if all_experience_levels:
-                # Create a mapping for experience levels
-                exp_mapping = {level: i for i, level in enumerate(all_experience_levels)}
-                # Map experience to numerical values, with missing values set to -1
-                df["experience_num"] = df["experience"].map(lambda x: exp_mapping.get(x, -1))
-                # One-hot encode experience
-                exp_encoder = OneHotEncoder(sparse_output=False, handle_unknown='ignore')
-                exp_features = exp_encoder.fit_transform(df[["experience_num"]])
-                # Add to feature matrix
-                X = np.hstack((X, exp_features))
-            
-            # Target is the index, which we'll map back to producer IDs
-            producer_ids = df["_id"].tolist()
-            producer_names = df["fullName"].tolist()
-            
-            # Compute nearest neighbor indices using cosine similarity
-            # We're using NearestNeighbors instead of KNN for more flexibility
-            n_neighbors = min(11, len(producer_ids))  # Include the producer itself + up to 10 neighbors
-            model = NearestNeighbors(n_neighbors=n_neighbors, metric='cosine', algorithm='brute')
-            model.fit(X)
-            
-            # Evaluate model by computing average neighbor similarity for each producer
-            distances, indices = model.kneighbors(X)
-            
-            # Compute similarity (1 - distance) and take average excluding self (first entry)
-            avg_similarities = []
-            for i in range(len(X)):
-                # Skip the first element (self) in similarity calculation
-                similarities = 1 - distances[i][1:] if distances[i][0] < 1e-6 else 1 - distances[i]
-                avg_similarities.append(np.mean(similarities))
-            
-            avg_similarity = np.mean(avg_similarities)
-            
-            # Create model directory if it doesn't exist
-            os.makedirs(os.path.dirname(settings.MODEL_PATH), exist_ok=True)
-            
-            # Save model with timestamp
-            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-            
-            # Save model
-            joblib.dump(model, settings.MODEL_PATH)
-            
-            # Save metadata
-            metadata = {
-                "all_genres": all_genres,
-                "all_skills": all_skills,
-                "all_tools": all_tools,
-                "all_experience_levels": all_experience_levels,
-                "producer_ids": producer_ids,
-                "producer_names": producer_names,
-                "feature_matrix": X.tolist(),  # Store feature matrix for similarity calculations
-                "training_date": timestamp,
-                "dataset_size": len(producers),
-                "avg_similarity": float(avg_similarity),
-                "n_neighbors": n_neighbors
-            }
-            
-            with open(settings.MODEL_METADATA_PATH, "w") as f:
-                json.dump(metadata, f)
-            
-            # Update instance variables
-            self.model = model
-            self.metadata = metadata
-            self.genre_mlb = genre_mlb
-            self.skill_mlb = skill_mlb
-            self.tool_mlb = tool_mlb
-            self.feature_matrix = X
-            self.producer_ids = producer_ids
+            # The locks are taken in threads, so waiting for another process never blocks the event loop
+            loop = asyncio.get_running_loop()
+            # Changes recorded from now on may be missing from the producers being read
+            base_version, base_updates = await loop.run_in_executor(None, self._training_base)
+            
+            if progress:
+                progress("fetch")
+            encoder = FeatureEncoder(expected_count)
+            async for batch in producer_batches:
+                encoder.add_batch(batch)
+            if progress:
+                progress("encode")
+            encoded = encoder.finalize()
+            
+            if encoded.n_producers == 0:
+                raise ValueError("No producers to train on")
+            
+            info = await loop.run_in_executor(
+                get_training_executor(),
+                partial(
+                    build_model_artifact,
+                    encoded,
+                    self.store.root,
+                    sparse_features=settings.SPARSE_FEATURES,
+                    evaluation_sample_size=settings.EVALUATION_SAMPLE_SIZE,
+                    evaluation_block_elements=settings.EVALUATION_BLOCK_ELEMENTS,
+                    neighbor_k=settings.SIMILAR_PRODUCERS_K,
+                    ann_backend=settings.ANN_BACKEND,
+                    dataset_fingerprint=fingerprint,
+                    progress=progress
+                )
+            )
+            
+            removed = await loop.run_in_executor(
+                None, self._install_trained, info["version"], base_version, base_updates
+            )
+            if removed:
+                print(f"Removed old model versions: {removed}")
             
             training_time = time.time() - start_time
             
@@ -178,11 +271,13 @@ class ProducerRecommenderModel:
                 "success": True,
                 "message": "Model trained successfully",
                 "details": {
-                    "average_similarity": round(avg_similarity, 4),
+                    "average_similarity": round(info["avg_similarity"], 4),
                     "training_time": f"{training_time:.2f} seconds",
-                    "model_version": timestamp,
-                    "dataset_size": len(producers),
-                    "n_neighbors": n_neighbors
+                    "model_version": info["version"],
+                    "dataset_size": info["dataset_size"],
+                    "n_neighbors": info["n_neighbors"],
+                    "evaluated_producers": info["evaluated_producers"],
+                    "average_similarity_ci": info.get("avg_similarity_ci")
                 }
             }
             
@@ -199,126 +294,45 @@ class ProducerRecommenderModel:
         Recommend producers based on genres, skills, tools and experience
         Ensures that all recommended producers match at least one requested genre
         """
-        if not self.metadata:
+        state = self.state
+        if state is None:
             print("No metadata available. Please train the model first.")
             return []
         
         try:
             print(f"Starting recommendation with: genres={genres}, skills={skills}, tools={tools}, experience={experience}")
             
-            # Extract the producers' data from metadata
-            if "feature_matrix" not in self.metadata:
-                print("Feature matrix not found in metadata")
-                return []
-            
-            feature_matrix = np.array(self.metadata["feature_matrix"])
-            producer_ids = self.metadata["producer_ids"]
-            producer_names = self.metadata.get("producer_names", [""] * len(producer_ids))
-            all_genres = self.metadata["all_genres"]
+            producer_ids = state.producer_ids
+            producer_names = state.producer_names
             
             print(f"Loaded data for {len(producer_ids)} producers")
             
-            # Step 1: Find producers that match at least one of the requested genres
-            genre_matching_producers = []
+            # Create feature vector for the request
+            query_vector = state.build_query_vector(genres, skills, tools, experience)
             
-            # Get indices for each producer that has any of the requested genres
-            for i, producer_id in enumerate(producer_ids):
-                producer_genres = []
-                
-                # Extract producer's genres directly from features
-                for j, genre in enumerate(all_genres):
-                    # Genre features were multiplied by 2.0 during training
-                    if feature_matrix[i, j] > 1.9:  # Allow for small floating point differences
-                        producer_genres.append(genre)
-                
-                # Check if producer has any of the requested genres
-                matching_genres = [g for g in genres if g in producer_genres]
-                
-                if matching_genres:
-                    genre_matching_producers.append({
-                        "id": producer_id,
-                        "name": producer_names[i] if i < len(producer_names) else "",
-                        "index": i,
-                        "matching_genres": matching_genres
-                    })
+            # Find producers that match at least one of the requested genres and rank them by similarity on all criteria
+            top_rows, top_scores, n_candidates = state.rank(query_vector, genres, top_n)
             
-            print(f"Found {len(genre_matching_producers)} producers matching at least one requested genre")
+            print(f"Found {n_candidates} producers matching at least one requested genre")
             
             # If we don't have enough genre-matching producers, issue a warning but continue
-            if len(genre_matching_producers) < top_n:
-                print(f"WARNING: Only found {len(genre_matching_producers)} producers matching the requested genres")
+            if n_candidates < top_n:
+                print(f"WARNING: Only found {n_candidates} producers matching the requested genres")
             
-            if not genre_matching_producers:
+            if n_candidates == 0:
                 print("No producers match any of the requested genres")
                 return []
             
-            # Step 2: Among genre-matching producers, calculate similarity based on all criteria
-            # Create feature vector for the request
-            query_vector = np.zeros(feature_matrix.shape[1])
-            
-            # Set genre features (with weight 2.0)
-            for genre in genres:
-                if genre in all_genres:
-                    genre_idx = all_genres.index(genre)
-                    query_vector[genre_idx] = 2.0
-            
-            # Set skill features (with weight 2.0)
-            skill_offset = len(all_genres)
-            all_skills = self.metadata["all_skills"]
-            for skill in skills:
-                if skill in all_skills:
-                    skill_idx = all_skills.index(skill)
-                    query_vector[skill_offset + skill_idx] = 2.0
-            
-            # Set tool features (with weight 1.0)
-            tool_offset = skill_offset + len(all_skills)
-            all_tools = self.metadata["all_tools"]
-            if tools:
-                for tool in tools:
-                    if tool in all_tools:
-                        tool_idx = all_tools.index(tool)
-                        query_vector[tool_offset + tool_idx] = 1.0
-            
-            # Set experience feature (with weight 1.0)
-            if "all_experience_levels" in self.metadata and experience:
-                exp_offset = tool_offset + len(all_tools)
-                all_exp = self.metadata["all_experience_levels"]
-                if experience in all_exp:
-                    exp_idx = all_exp.index(experience)
-                    query_vector[exp_offset + exp_idx] = 1.0
-            
-            # Calculate similarity for each genre-matching producer
-            for producer in genre_matching_producers:
-                producer_vector = feature_matrix[producer["index"]]
-                
-                # Calculate cosine similarity
-                dot_product = np.dot(query_vector, producer_vector)
-                query_norm = np.linalg.norm(query_vector)
-                producer_norm = np.linalg.norm(producer_vector)
-                
-                if query_norm > 0 and producer_norm > 0:
-                    similarity = dot_product / (query_norm * producer_norm)
-                else:
-                    similarity = 0
-                    
-                # Boost similarity based on number of matching genres
-                genre_match_boost = len(producer["matching_genres"]) / len(genres)
-                
-                # Final score combines similarity with genre match boost
-                producer["similarity_score"] = float(similarity * (1 + genre_match_boost))
-            
-            # Sort by similarity score
-            genre_matching_producers.sort(key=lambda x: x["similarity_score"], reverse=True)
-            
             # Return top N recommendations
             recommendations = []
-            for producer in genre_matching_producers[:top_n]:
-                recommendations.append({
-                    "id": producer["id"],
-                    "name": producer["name"],
-                    "similarity_score": producer["similarity_score"],
-                    "matching_genres": producer["matching_genres"]
-                })
+            for index, score in zip(top_rows.tolist(), top_scores.tolist()):
+                producer = {
+                    "id": producer_ids[index],
+                    "name": producer_names[index] if index < len(producer_names) else "",
+                    "similarity_score": score,
+                    "matching_genres": state.matching_genres(index, genres)
+                }
+                recommendations.append(producer)
                 print(f"Recommending: {producer['name']} (ID: {producer['id']}) with score {producer['similarity_score']:.4f}")
                 print(f"  Matching genres: {producer['matching_genres']}")
             
@@ -329,6 +343,81 @@ class ProducerRecommenderModel:
             print(f"Error in recommendation: {str(e)}")
             print(traceback.format_exc())
             return []
+    
+    def apply_updates(self, changes: List[Dict[str, Any]]) -> bool:
+        """
+        Apply producer changes to the served model without retraining.
+        Each change is {"upsert": producer document} or {"delete": producer id}. The changes are
+        recorded with the current version so they survive a restart, and the updated model is
+        swapped in with a single assignment. Returns False if there is no model to update.
+        """
+        changes = [
+            {"upsert": training_fields(change["upsert"])} if "upsert" in change else {"delete": str(change["delete"])}
+            for change in changes
+        ]
+        with self._update_lock, self.store.locked():
+            # Apply changes other processes recorded first, so every process applies them in log order
+            self._catch_up()
+            state = self.state
+            if state is None:
+                return False
+            updated = apply_producer_updates(state, changes)
+            if state.version:
+                self.store.append_updates(state.version, changes)
+            self.state = updated
+        print(f"Applied {len(changes)} producer changes to model version {state.version}")
+        return True
+    
+    async def on_producer_changes(self, changes: List[Dict[str, Any]]):
+        """Database change listener; applies the changes off the event loop"""
+        if not settings.INCREMENTAL_UPDATES:
+            return
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(None, self.apply_updates, changes)
+    
+    def iter_recommend_batch(self, queries: List[Dict[str, Any]], top_n: int = 3) -> Iterator[List[Dict[str, Any]]]:
+        """
+        Recommend producers for many queries, yielding each query's recommendations in order.
+        Queries are dicts with genres, skills, tools and experience, ranked exactly as recommend()
+        ranks them but scored against the whole catalogue together, one block of queries at a time.
+        """
+        state = self.state
+        if state is None:
+            print("No metadata available. Please train the model first.")
+            for _ in queries:
+                yield []
+            return
+        
+        yield from state.recommend_batch(queries, top_n, block_elements=settings.BATCH_BLOCK_ELEMENTS)
+    
+    def recommend_batch(self, queries: List[Dict[str, Any]], top_n: int = 3) -> List[List[Dict[str, Any]]]:
+        """Recommend producers for many queries at once; returns one list of recommendations per query"""
+        start_time = time.time()
+        results = list(self.iter_recommend_batch(queries, top_n))
+        print(f"Recommended producers for {len(queries)} queries in {time.time() - start_time:.3f} seconds")
+        return results
+    
+    def similar(self, producer_id: str, top_n: int = 10) -> Optional[List[Dict[str, Any]]]:
+        """
+        Producers most similar to the given one, read from the neighbour table built at train time.
+        Returns None if the producer is not part of the model being served.
+        """
+        state = self.state
+        if state is None:
+            return None
+        row = state.producer_rows.get(producer_id)
+        if row is None:
+            return None
+        
+        rows, scores = state.similar_producers(row, top_n)
+        return [
+            {
+                "id": state.producer_ids[index],
+                "name": state.producer_names[index],
+                "similarity_score": score
+            }
+            for index, score in zip(rows.tolist(), scores.tolist())
+        ]
 
 
 # Create model instance
@@ -0,0 +1,165 @@
+import os
+import json
+import shutil
+from contextlib import contextmanager
+from datetime import datetime
+from typing import List, Dict, Any, Iterator, Optional, Tuple
+
+from app.core.file_lock import FileLock
+
+CURRENT_FILE = "CURRENT"
+VERSIONS_DIR = "versions"
+STAGING_PREFIX = ".staging-"
+UPDATES_FILE = "updates.jsonl"
+FINGERPRINT_FILE = "dataset_fingerprint.json"
+LOCK_FILE = "store.lock"
+
+
+class ModelStore:
+    """
+    Versioned model directories with a pointer file naming the current version.
+    A version is written to a staging directory and renamed into place only once
+    complete, and the pointer is replaced atomically, so readers never see a
+    partially written model.
+    """
+
+    def __init__(self, root: str, keep_versions: int = 3):
+        self.root = root
+        self.keep_versions = keep_versions
+        self.versions_dir = os.path.join(root, VERSIONS_DIR)
+
+    def version_dir(self, version: str) -> str:
+        """Directory holding the artifact for a version"""
+        return os.path.join(self.versions_dir, version)
+
+    def create_staging_dir(self) -> Tuple[str, str]:
+        """Create an empty directory to write a new version into; returns (version, path)"""
+        os.makedirs(self.versions_dir, exist_ok=True)
+        version = datetime.now().strftime("%Y%m%d_%H%M%S_%f")
+        path = os.path.join(self.versions_dir, f"{STAGING_PREFIX}{version}-{os.getpid()}")
+        os.makedirs(path)
+        return version, path
+
+    def commit_staging_dir(self, version: str, staging_dir: str) -> str:
+        """Move a fully written staging directory into place as a version"""
+        path = self.version_dir(version)
+        os.rename(staging_dir, path)
+        return path
+
+    def discard_staging_dir(self, staging_dir: str):
+        """Remove a staging directory left by a failed write"""
+        shutil.rmtree(staging_dir, ignore_errors=True)
+
+    @contextmanager
+    def locked(self) -> Iterator[None]:
+        """
+        Hold the store's lock, shared by every process using the store. Held while changing
+        the current version or recording updates, so that processes serving the same store
+        agree on the order of changes.
+        """
+        lock = FileLock(os.path.join(self.root, LOCK_FILE))
+        lock.acquire(blocking=True)
+        try:
+            yield
+        finally:
+            lock.release()
+
+    def list_versions(self) -> List[str]:
+        """Committed versions, oldest first"""
+        if not os.path.isdir(self.versions_dir):
+            return []
+        return sorted(
+            name for name in os.listdir(self.versions_dir)
+            if not name.startswith(STAGING_PREFIX) and os.path.isdir(os.path.join(self.versions_dir, name))
+        )
+
+    def current_version(self) -> Optional[str]:
+        """Version named by the pointer file, if any"""
+        try:
+            with open(os.path.join(self.root, CURRENT_FILE), "r") as f:
+                version = f.read().strip()
+        except FileNotFoundError:
+            return None
+        return version or None
+
+    def set_current(self, version: str):
+        """Point the store at a committed version"""
+        if not os.path.isdir(self.version_dir(version)):
+            raise ValueError(f"Model version '{version}' does not exist")
+        path = os.path.join(self.root, CURRENT_FILE)
+        tmp_path = f"{path}.tmp-{os.getpid()}"
+        with open(tmp_path, "w") as f:
+            f.write(version)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+
+    def previous_version(self, version: Optional[str] = None) -> Optional[str]:
+        """The committed version just before the given one (or before the current one)"""
+        version = version or self.current_version()
+        older = [v for v in self.list_versions() if version is None or v < version]
+        return older[-1] if older else None
+
+    def prune(self) -> List[str]:
+        """Delete all but the current version and the configured number of versions before it"""
+        current = self.current_version()
+        versions = self.list_versions()
+        if current not in versions:
+            return []
+        older = [v for v in versions if v < current]
+        removed = older[:max(len(older) - self.keep_versions, 0)]
+        for version in removed:
+            # Processes that still have the old arrays mapped keep reading them after unlink
+            shutil.rmtree(self.version_dir(version), ignore_errors=True)
+        return removed
+
+    def append_updates(self, version: str, changes: List[Dict[str, Any]]):
+        """
+        Record incremental producer changes made to a version, one JSON line per change.
+        The version's artifact itself is never rewritten; the changes are replayed when it is loaded.
+        """
+        path = os.path.join(self.version_dir(version), UPDATES_FILE)
+        with open(path, "a", encoding="utf-8") as f:
+            f.write("".join(json.dumps(change) + "\n" for change in changes))
+            f.flush()
+            os.fsync(f.fileno())
+
+    def write_fingerprint(self, version: str, fingerprint: Dict[str, Any]):
+        """Record the dataset fingerprint of a version whose artifact has none, e.g. a migrated model"""
+        path = os.path.join(self.version_dir(version), FINGERPRINT_FILE)
+        tmp_path = f"{path}.tmp-{os.getpid()}"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(fingerprint, f)
+        os.replace(tmp_path, path)
+
+    def read_fingerprint(self, version: str) -> Optional[Dict[str, Any]]:
+        """The dataset fingerprint recorded with write_fingerprint, if any"""
+        try:
+            with open(os.path.join(self.version_dir(version), FINGERPRINT_FILE), "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            return None
+
+    def updates_size(self, version: str) -> int:
+        """Size in bytes of a version's update log; grows whenever updates are recorded"""
+        try:
+            return os.path.getsize(os.path.join(self.version_dir(version), UPDATES_FILE))
+        except FileNotFoundError:
+            return 0
+
+    def read_updates(self, version: str) -> List[Dict[str, Any]]:
+        """Incremental producer changes recorded for a version, in the order they were made"""
+        path = os.path.join(self.version_dir(version), UPDATES_FILE)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                lines = f.read().splitlines()
+        except FileNotFoundError:
+            return []
+        changes = []
+        for line in lines:
+            try:
+                changes.append(json.loads(line))
+            except json.JSONDecodeError:
+                # A write cut short by a crash leaves a partial last line
+                break
+        return changes
@@ -0,0 +1,41 @@
+import numpy as np
+from typing import Tuple, Optional
+
+from app.models.evaluation import normalize_rows, blocked_top_k
+
+
+def build_neighbor_table(feature_matrix, k: int, block_elements: int = 16_000_000) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Precompute the k most similar producers for every producer, excluding the producer itself.
+    Returns (indices, scores) arrays of shape (producers, k), best first; slots beyond the
+    number of available neighbours hold index -1 and score 0.
+    Similarities are computed exactly, in blocks.
+    """
+    normalized = normalize_rows(feature_matrix)
+    n_producers = normalized.shape[0]
+    indices = np.full((n_producers, k), -1, dtype=np.int32)
+    scores = np.zeros((n_producers, k), dtype=np.float32)
+    if k == 0 or n_producers == 0:
+        return indices, scores
+
+    for block_rows, neighbors, similarities in blocked_top_k(normalized, k + 1, block_elements=block_elements):
+        for row, row_neighbors, row_similarities in zip(block_rows, neighbors, similarities):
+            _fill_row(indices, scores, row, row_neighbors, row_similarities)
+    return indices, scores
+
+def _fill_row(indices: np.ndarray, scores: np.ndarray, row: int,
+              neighbors: np.ndarray, similarities: np.ndarray):
+    """Store a row's neighbours, dropping the row itself"""
+    keep = neighbors != row
+    neighbors = neighbors[keep][:indices.shape[1]]
+    similarities = similarities[keep][:indices.shape[1]]
+    indices[row, :len(neighbors)] = neighbors
+    scores[row, :len(similarities)] = similarities
+
+
+def lookup_neighbors(indices: np.ndarray, scores: np.ndarray, row: int,
+                     limit: Optional[int] = None) -> Tuple[np.ndarray, np.ndarray]:
+    """Neighbours of a producer from a precomputed table, best first"""
+    row_indices = indices[row, :limit]
+    valid = row_indices >= 0
+    return row_indices[valid], scores[row, :limit][valid]
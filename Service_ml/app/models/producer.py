@@ -107,6 +107,12 @@ class ProducerRecommendation(BaseModel):
     featuredTracks: Optional[List[str]] = None
     reason: Optional[str] = None
 
+# Only these fields of a producer document are needed to build a ProducerRecommendation
+RECOMMENDATION_PROJECTION = {
+    "_id": 1, "fullName": 1, "genres": 1, "skills": 1, "experience": 1, "profileImage": 1,
+    "country": 1, "about": 1, "tools": 1, "featuredTracks": 1
+}
+
 class RecommendationResponse(BaseModel):
     """Response model for producer recommendations"""
     recommendations: List[ProducerRecommendation]
@@ -134,6 +140,98 @@ class RecommendationResponse(BaseModel):
         }
     )
 
+class BatchRecommendationRequest(BaseModel):
+    """Request model for recommendations for many structured queries at once"""
+    queries: List[RecommendationRequest]
+    top_n: Optional[int] = Field(None, ge=1, le=100)
+    
+    model_config = ConfigDict(
+        json_schema_extra={
+            "example": {
+                "queries": [
+                    {
+                        "genres": ["Jazz", "Indie"],
+                        "skills": ["Music Producing", "Sound Designing"],
+                        "tools": ["Cubase"],
+                        "experience": "1-2 years"
+                    },
+                    {
+                        "genres": ["Hip Hop"],
+                        "skills": ["Mixing"]
+                    }
+                ],
+                "top_n": 3
+            }
+        }
+    )
+
+
+class BatchRecommendation(BaseModel):
+    """Model for a single recommendation in a batch, without profile details"""
+    id: str
+    fullName: str
+    similarity_score: float
+    matching_genres: List[str]
+
+
+class BatchRecommendationResult(BaseModel):
+    """Recommendations for one query of a batch"""
+    index: int
+    recommendations: List[BatchRecommendation]
+
+
+class BatchRecommendationResponse(BaseModel):
+    """Response model for batch recommendations"""
+    results: List[BatchRecommendationResult]
+    
+    model_config = ConfigDict(
+        json_schema_extra={
+            "example": {
+                "results": [
+                    {
+                        "index": 0,
+                        "recommendations": [
+                            {
+                                "id": "68074bba2ef8a1eb37630127",
+                                "fullName": "Billy Fernando",
+                                "similarity_score": 0.95,
+                                "matching_genres": ["Jazz", "Indie"]
+                            }
+                        ]
+                    }
+                ]
+            }
+        }
+    )
+
+
+class SimilarProducer(BaseModel):
+    """Model for a producer similar to another one"""
+    id: str
+    fullName: str
+    similarity_score: float
+
+
+class SimilarProducersResponse(BaseModel):
+    """Response model for similar producers"""
+    producer_id: str
+    similar: List[SimilarProducer]
+    
+    model_config = ConfigDict(
+        json_schema_extra={
+            "example": {
+                "producer_id": "68074bba2ef8a1eb37630127",
+                "similar": [
+                    {
+                        "id": "68074c1d2ef8a1eb3763012b",
+                        "fullName": "Nimal Perera",
+                        "similarity_score": 0.87
+                    }
+                ]
+            }
+        }
+    )
+
 class TrainingResponse(BaseModel):
     """Response model for model training"""
     success: bool
@@ -152,4 +250,48 @@ class TrainingResponse(BaseModel):
                 }
             }
         }
-    )
\ No newline at end of file
+    )
+
+class TrainingStage(BaseModel):
+    """Progress of one stage of a training job"""
+    name: str
+    status: str  # pending, running, done or failed
+    started_at: Optional[str] = None
+    finished_at: Optional[str] = None
+
+
+class TrainingJobResponse(BaseModel):
+    """Response model for a training job"""
+    job_id: str
+    status: str  # queued, running, succeeded or failed
+    stage: Optional[str] = None
+    stages: List[TrainingStage]
+    created_at: str
+    started_at: Optional[str] = None
+    finished_at: Optional[str] = None
+    message: Optional[str] = None
+    details: Optional[Dict[str, Any]] = None
+    already_running: bool = False  # Set when a training request found this job already running
+    
+    model_config = ConfigDict(
+        json_schema_extra={
+            "example": {
+                "job_id": "3f2b6c1e9a4d4f0e8b7a6c5d4e3f2a1b",
+                "status": "running",
+                "stage": "index",
+                "stages": [
+                    {"name": "fetch", "status": "done", "started_at": "2025-05-01T12:00:00", "finished_at": "2025-05-01T12:00:04"},
+                    {"name": "encode", "status": "done", "started_at": "2025-05-01T12:00:04", "finished_at": "2025-05-01T12:00:05"},
+                    {"name": "index", "status": "running", "started_at": "2025-05-01T12:00:05", "finished_at": None},
+                    {"name": "evaluate", "status": "pending", "started_at": None, "finished_at": None},
+                    {"name": "persist", "status": "pending", "started_at": None, "finished_at": None}
+                ],
+                "created_at": "2025-05-01T12:00:00",
+                "started_at": "2025-05-01T12:00:00",
+                "finished_at": None,
+                "message": None,
+                "details": None,
+                "already_running": False
+            }
+        }
+    )
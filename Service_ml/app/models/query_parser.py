@@ -0,0 +1,254 @@
+import re
+import json
+import time
+import asyncio
+import hashlib
+from collections import OrderedDict
+from functools import partial
+from typing import List, Dict, Any, Optional, Tuple
+from pydantic import BaseModel
+
+from app.core.config import settings
+from app.models.llm_client import Deadline, query_llm
+from app.models.ml_model import recommender_model
+from app.models.vocabulary_matcher import VocabularyMatcher, load_synonyms
+
+
+# Pydantic model for Gemini response
+class QueryParameters(BaseModel):
+    genres: List[str]
+    skills: List[str]
+    tools: Optional[List[str]] = None
+    experience: Optional[str] = None
+
+
+def normalize_query(query_text: str) -> str:
+    """Fold case, punctuation and whitespace, so trivially different queries share a cache entry"""
+    return " ".join(re.sub(r"[^\w\s]", " ", query_text.casefold()).split())
+
+
+def _vocabulary(metadata: Optional[Dict[str, Any]]) -> Tuple[List[str], List[str], List[str], List[str]]:
+    metadata = metadata or {}
+    return (
+        metadata.get("all_genres", []),
+        metadata.get("all_skills", []),
+        metadata.get("all_tools", []),
+        metadata.get("all_experience_levels", [])
+    )
+
+
+class QueryParser:
+    """
+    Turns natural language queries into QueryParameters.
+    Queries are first matched against the served model's vocabulary locally; Gemini is only
+    asked when that finds nothing or is not confident, and never without an API key; if it
+    fails, is unavailable or does not answer within the request's deadline, the local extraction is used.
+    Gemini's parses are cached by normalized query text under the served model's vocabulary,
+    with LRU and TTL eviction; identical queries arriving while one is being parsed
+    wait for that parse instead of making their own call. The shared parse has its own
+    timeout, QUERY_PARSE_TIMEOUT_SECONDS, and each request only bounds its own wait for it
+    by its deadline. The cache empties itself when the vocabulary changes, e.g. after retraining.
+    """
+
+    def __init__(self, max_entries: int = 1000, ttl_seconds: float = 3600):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        # normalized query -> (expiry time, parameters), least recently used first
+        self._entries: "OrderedDict[str, Tuple[float, QueryParameters]]" = OrderedDict()
+        self._in_flight: Dict[str, asyncio.Task] = {}
+        self._vocabulary_version: Optional[str] = None
+        # The metadata the prompt prefix and vocabulary version were computed from
+        self._metadata: Optional[Dict[str, Any]] = None
+        self._prompt_prefix = ""
+        self._matcher: Optional[VocabularyMatcher] = None
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.local_hits = 0
+
+    def _refresh_vocabulary(self):
+        """Recompute the vocabulary version, prompt prefix and matcher when the served model's metadata changes"""
+        metadata = recommender_model.metadata
+        if self._vocabulary_version is not None and metadata is self._metadata:
+            return
+        vocabulary = _vocabulary(metadata)
+        version = hashlib.sha256(json.dumps(vocabulary).encode("utf-8")).hexdigest()
+        if version != self._vocabulary_version:
+            self._entries.clear()
+            self._vocabulary_version = version
+            self._prompt_prefix = _prompt_prefix(*vocabulary)
+            self._matcher = VocabularyMatcher(*vocabulary, synonyms=load_synonyms(settings.QUERY_SYNONYMS_PATH))
+        self._metadata = metadata
+
+    async def parse(self, query_text: str, deadline: Optional[Deadline] = None) -> QueryParameters:
+        """Extract genres, skills, tools and experience from a natural language query"""
+        self._refresh_vocabulary()
+
+        local = None
+        if settings.LOCAL_QUERY_PARSER:
+            extracted, confidence = self._matcher.extract(query_text)
+            local = QueryParameters(**extracted)
+            if confidence >= settings.LOCAL_QUERY_MIN_CONFIDENCE or not query_llm.available:
+                self.local_hits += 1
+                return local
+
+        key = normalize_query(query_text)
+        now = time.time()
+
+        entry = self._entries.get(key)
+        if entry is not None:
+            if entry[0] > now:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[1].model_copy(deep=True)
+            del self._entries[key]
+
+        task = self._in_flight.get(key)
+        if task is not None:
+            self.coalesced += 1
+        else:
+            self.misses += 1
+            task = asyncio.create_task(self._parse_uncached(query_text, key, self._vocabulary_version))
+            self._in_flight[key] = task
+            task.add_done_callback(partial(self._parse_done, key))
+        try:
+            # Shielded, so a request giving up does not cancel the parse other requests wait for
+            params = await asyncio.wait_for(asyncio.shield(task), timeout=deadline.remaining() if deadline else None)
+        except Exception as e:
+            if local is None:
+                raise
+            print(f"Could not parse query with Gemini, using the local extraction: {str(e) or 'timed out'}")
+            return local
+        return params.model_copy(deep=True)
+
+    def _parse_done(self, key: str, task: asyncio.Task):
+        self._in_flight.pop(key, None)
+        # Every waiter may have given up on the parse already; its error is reported to the ones still waiting
+        if not task.cancelled():
+            task.exception()
+
+    async def _parse_uncached(self, query_text: str, key: str, vocabulary_version: str) -> QueryParameters:
+        prompt = self._prompt_prefix + _prompt_suffix(query_text)
+
+        # Generate structured response without blocking the event loop. The call is shared by every
+        # request waiting for this query, so it is bounded by the client's timeout, not by one request's deadline
+        text = await query_llm.generate(
+            prompt,
+            generation_config={
+                "response_mime_type": "application/json",
+            }
+        )
+
+        # Parse the response as JSON
+        extracted_params = json.loads(text)
+        print(f"Extracted parameters: {extracted_params}")
+
+        # Convert to proper structure
+        params = QueryParameters(
+            genres=extracted_params.get("genres", []),
+            skills=extracted_params.get("skills", []),
+            tools=extracted_params.get("tools", []),
+            experience=extracted_params.get("experience")
+        )
+
+        # Not cached if the vocabulary changed while the model was answering
+        if vocabulary_version == self._vocabulary_version:
+            self._entries[key] = (time.time() + self.ttl_seconds, params)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return params
+
+    def stats(self) -> Dict[str, Any]:
+        """Local, hit, miss and coalesced-request counters and the number of cached parses"""
+        lookups = self.hits + self.misses + self.coalesced
+        return {
+            "entries": len(self._entries),
+            "local_hits": self.local_hits,
+            "hits": self.hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else None
+        }
+
+
+def _prompt_prefix(available_genres: List[str], available_skills: List[str],
+                   available_tools: List[str], available_experience_levels: List[str]) -> str:
+    """The vocabulary-dependent part of the parsing prompt, which is the same for every query"""
+    # Create formatted lists for the prompt
+    genres_list = ", ".join([f'"{genre}"' for genre in available_genres])
+    skills_list = ", ".join([f'"{skill}"' for skill in available_skills])
+    tools_list = ", ".join([f'"{tool}"' for tool in available_tools])
+    experience_list = ", ".join([f'"{exp}"' for exp in available_experience_levels])
+
+    # Create prompt that explains the task and context with examples
+    return f"""
+    You are an expert music producer classifier. Your task is to analyze a user's description
+    of what they're looking for in a music producer and extract the relevant genres, skills,
+    tools, and experience level required.
+
+    IMPORTANT: Only use values from the provided lists below. If something is mentioned in the query but doesn't
+    match anything in these lists, find the closest match or omit it.
+
+    Available genres: {genres_list}
+
+    Available skills: {skills_list}
+
+    Available tools: {tools_list}
+
+    Available experience levels: {experience_list}
+
+    For each category, only include values that are explicitly mentioned or strongly implied and exist in the available lists.
+    If a category is not mentioned at all, provide an empty list or null.
+
+    Here are some examples:
+
+    Example 1:
+    User query: "I need a jazz producer who is good at mixing and has experience with Logic Pro. They should have at least 3-5 years of experience."
+    Response:
+    {{
+        "genres": ["Jazz"],
+        "skills": ["Mixing"],
+        "tools": ["Logic Pro"],
+        "experience": "3-5 years"
+    }}
+
+    Example 2:
+    User query: "Looking for someone who can produce EDM and trap music. They should be skilled in sound design and mastering."
+    Response:
+    {{
+        "genres": ["EDM", "Trap"],
+        "skills": ["Sound Design", "Mastering"],
+        "tools": [],
+        "experience": null
+    }}
+
+    Example 3:
+    User query: "I want a producer for my indie folk album who knows how to record live instruments."
+    Response:
+    {{
+        "genres": ["Indie", "Folk"],
+        "skills": ["Live Recording"],
+        "tools": [],
+        "experience": null
+    }}
+    """
+
+
+def _prompt_suffix(query_text: str) -> str:
+    """The query-dependent part of the parsing prompt"""
+    return f"""
+    Now, analyze this user query: "{query_text}"
+
+    Respond with a JSON object containing the following fields:
+    - genres: List of music genres mentioned (ONLY from the available genres list)
+    - skills: List of skills mentioned (ONLY from the available skills list)
+    - tools: List of tools/software mentioned (ONLY from the available tools list)
+    - experience: Experience level mentioned (ONLY from the available experience levels list)
+    """
+
+
+query_parser = QueryParser(
+    max_entries=settings.QUERY_CACHE_SIZE,
+    ttl_seconds=settings.QUERY_CACHE_TTL_SECONDS
+)
@@ -0,0 +1,225 @@
+import os
+import json
+import time
+import sqlite3
+import asyncio
+import hashlib
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Dict, Any, Optional, Tuple
+
+from app.core.config import settings
+
+# Producer fields a reason is written from
+PROFILE_FIELDS = ("fullName", "genres", "skills", "tools", "experience", "country")
+
+
+def _normalize(value: Any) -> Any:
+    """Case- and order-insensitive form of a profile or criteria value"""
+    if isinstance(value, (list, tuple, set)):
+        return sorted({str(item).strip().casefold() for item in value if item is not None})
+    if value is None:
+        return None
+    return str(value).strip().casefold()
+
+
+def profile_hash(producer_data: Dict[str, Any]) -> str:
+    """Hash of the profile fields a reason is written from; changes whenever one of them does"""
+    profile = {field: _normalize(producer_data.get(field)) for field in PROFILE_FIELDS}
+    return hashlib.sha256(json.dumps(profile, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+def reason_cache_key(producer_data: Dict[str, Any], matching_genres: List[str],
+                     criteria: Dict[str, Any]) -> str:
+    """Cache key of a reason: the producer's profile, the genres it matched and the query's parameters"""
+    key = {
+        "profile": profile_hash(producer_data),
+        "matching_genres": _normalize(matching_genres),
+        "criteria": {field: _normalize(value) for field, value in criteria.items()}
+    }
+    return hashlib.sha256(json.dumps(key, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+class ReasonCache:
+    """
+    Generated recommendation reasons, kept in memory with LRU and TTL eviction and,
+    if a path is given, in a SQLite file that survives restarts and is shared by
+    server processes. Entries of a producer are dropped when its profile changes.
+    The SQLite file is only used from one background thread: lookups that miss memory
+    are awaited there, and writes are queued behind them without being waited for.
+    """
+
+    def __init__(self, max_entries: int = 10_000, ttl_seconds: float = 86_400, path: Optional[str] = None):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.path = path
+        # key -> (expiry time, producer id, reason), least recently used first
+        self._entries: "OrderedDict[str, Tuple[float, str, str]]" = OrderedDict()
+        self._connection: Optional[sqlite3.Connection] = None
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+    def _disk_executor(self) -> Optional[ThreadPoolExecutor]:
+        """The thread owning the SQLite connection, started on first use; None without an on-disk tier"""
+        if self.path is None:
+            return None
+        if self._executor is None:
+            # One thread, so that queued writes are applied in order and before later lookups
+            self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="reason-cache")
+        return self._executor
+
+    def _disk(self) -> Optional[sqlite3.Connection]:
+        """The on-disk tier, opened on first use in the disk thread; None if not configured or unusable"""
+        if self.path is None or self._connection is not None:
+            return self._connection
+        try:
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            connection = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS reasons "
+                "(key TEXT PRIMARY KEY, producer_id TEXT NOT NULL, reason TEXT NOT NULL, expires_at REAL NOT NULL)"
+            )
+            connection.execute("CREATE INDEX IF NOT EXISTS reasons_producer ON reasons (producer_id)")
+            connection.execute("DELETE FROM reasons WHERE expires_at < ?", (time.time(),))
+            self._connection = connection
+        except sqlite3.Error as e:
+            print(f"Reason cache file {self.path} unavailable, caching in memory only: {str(e)}")
+            self.path = None
+        return self._connection
+
+    def _read_disk(self, keys: List[str], now: float) -> Dict[str, Tuple[str, str, float]]:
+        """Unexpired on-disk entries of the given keys, as key -> (producer id, reason, expiry time)"""
+        disk = self._disk()
+        if disk is None:
+            return {}
+        rows = {}
+        try:
+            # Stay well below SQLite's limit on query parameters
+            for start in range(0, len(keys), 500):
+                chunk = keys[start:start + 500]
+                for key, producer_id, reason, expires_at in disk.execute(
+                    f"SELECT key, producer_id, reason, expires_at FROM reasons "
+                    f"WHERE key IN ({', '.join('?' * len(chunk))}) AND expires_at > ?", (*chunk, now)
+                ):
+                    rows[key] = (producer_id, reason, expires_at)
+        except sqlite3.Error as e:
+            print(f"Error reading reason cache: {str(e)}")
+        return rows
+
+    def _write_disk(self, key: str, producer_id: str, reason: str, expires_at: float):
+        disk = self._disk()
+        if disk is None:
+            return
+        try:
+            disk.execute(
+                "INSERT OR REPLACE INTO reasons (key, producer_id, reason, expires_at) VALUES (?, ?, ?, ?)",
+                (key, producer_id, reason, expires_at)
+            )
+        except sqlite3.Error as e:
+            print(f"Error writing reason cache: {str(e)}")
+
+    def _delete_disk(self, producer_ids: List[str]):
+        disk = self._disk()
+        if disk is None:
+            return
+        try:
+            disk.executemany("DELETE FROM reasons WHERE producer_id = ?", [(pid,) for pid in producer_ids])
+        except sqlite3.Error as e:
+            print(f"Error invalidating reason cache: {str(e)}")
+
+    async def get_many(self, keys: List[str]) -> Dict[str, str]:
+        """The cached reasons of the given keys, as key -> reason; keys without one are left out"""
+        keys = list(dict.fromkeys(keys))
+        now = time.time()
+        reasons = {}
+        missed = []
+        for key in keys:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if entry[0] > now:
+                    self._entries.move_to_end(key)
+                    reasons[key] = entry[2]
+                    continue
+                del self._entries[key]
+            missed.append(key)
+        self.hits += len(reasons)
+
+        executor = self._disk_executor()
+        if executor is not None and missed:
+            loop = asyncio.get_running_loop()
+            rows = await loop.run_in_executor(executor, self._read_disk, missed, now)
+            for key, (producer_id, reason, expires_at) in rows.items():
+                self._remember(key, expires_at, producer_id, reason)
+                reasons[key] = reason
+            self.hits += len(rows)
+            self.disk_hits += len(rows)
+
+        self.misses += len(keys) - len(reasons)
+        return reasons
+
+    async def get(self, key: str) -> Optional[str]:
+        """The cached reason for a key, or None"""
+        return (await self.get_many([key])).get(key)
+
+    def put(self, key: str, producer_id: str, reason: str):
+        """Cache a reason for a producer; the on-disk copy is written in the background"""
+        expires_at = time.time() + self.ttl_seconds
+        self._remember(key, expires_at, producer_id, reason)
+        executor = self._disk_executor()
+        if executor is not None:
+            executor.submit(self._write_disk, key, producer_id, reason, expires_at)
+
+    def _remember(self, key: str, expires_at: float, producer_id: str, reason: str):
+        self._entries[key] = (expires_at, producer_id, reason)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def invalidate_producers(self, producer_ids: List[str]):
+        """Drop every cached reason of the given producers"""
+        producer_ids = {str(producer_id) for producer_id in producer_ids}
+        for key in [key for key, entry in self._entries.items() if entry[1] in producer_ids]:
+            del self._entries[key]
+        executor = self._disk_executor()
+        if executor is not None and producer_ids:
+            executor.submit(self._delete_disk, list(producer_ids))
+
+    def close(self):
+        """Finish the queued on-disk writes and close the SQLite file"""
+        if self._executor is not None:
+            self._executor.submit(self._close_disk)
+            self._executor.shutdown(wait=True)
+            self._executor = None
+
+    def _close_disk(self):
+        if self._connection is not None:
+            self._connection.close()
+            self._connection = None
+
+    async def on_producer_changes(self, changes: List[Dict[str, Any]]):
+        """Database change listener; a changed or deleted producer's reasons no longer apply"""
+        self.invalidate_producers([
+            change["upsert"]["_id"] if "upsert" in change else change["delete"]
+            for change in changes
+        ])
+
+    def stats(self) -> Dict[str, Any]:
+        """Hit and miss counters and the number of reasons held in memory"""
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else None
+        }
+
+
+reason_cache = ReasonCache(
+    max_entries=settings.REASON_CACHE_SIZE,
+    ttl_seconds=settings.REASON_CACHE_TTL_SECONDS,
+    path=settings.REASON_CACHE_PATH
+)
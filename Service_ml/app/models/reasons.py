@@ -0,0 +1,249 @@
+import json
+import asyncio
+from typing import List, Dict, Any, Optional, Tuple, AsyncIterator
+
+from app.core.config import settings
+from app.models.llm_client import LLMClient, LLMUnavailableError, Deadline, reason_llm, time_budget
+from app.models.reason_cache import ReasonCache, reason_cache, reason_cache_key
+
+REASON_MAX_OUTPUT_TOKENS = 200
+
+# Caps the reason requests in flight across all queries
+_reason_semaphore = asyncio.Semaphore(settings.REASON_MAX_CONCURRENCY)
+
+# A producer to explain: (producer id, producer document, genres of the query it matches)
+ReasonItem = Tuple[str, Dict[str, Any], List[str]]
+
+
+async def _generate(client: LLMClient, prompt: str, generation_config: Dict[str, Any],
+                    deadline: Optional[Deadline]) -> str:
+    """One model call, holding a request slot"""
+    async with _reason_semaphore:
+        text = await client.generate(prompt, generation_config, deadline=deadline)
+    return text.strip()
+
+
+async def generate_recommendation_reason(producer_data: Dict[str, Any], user_query: str,
+                                         matching_genres: List[str], client: Optional[LLMClient] = None,
+                                         deadline: Optional[Deadline] = None) -> Optional[str]:
+    """
+    Generate AI reasoning for why this producer is recommended based on the user's query.
+    Returns None if the reason cannot be generated within REASON_TIMEOUT_SECONDS or the
+    request's deadline, including any wait for a free request slot, or if Gemini is unavailable.
+    """
+    client = client or reason_llm
+    if not client.available:
+        return None
+    try:
+        return await asyncio.wait_for(
+            _generate(client, _reason_prompt(producer_data, user_query, matching_genres), {
+                "temperature": 0.7,
+                "max_output_tokens": REASON_MAX_OUTPUT_TOKENS,
+            }, deadline),
+            timeout=time_budget(settings.REASON_TIMEOUT_SECONDS, deadline)
+        )
+    except asyncio.TimeoutError:
+        print(f"Timed out generating recommendation reason for {producer_data.get('fullName', '')}")
+        return None
+    except LLMUnavailableError as e:
+        print(f"Not generating recommendation reason: {str(e)}")
+        return None
+    except Exception as e:
+        print(f"Error generating recommendation reason: {str(e)}")
+        return None
+
+
+def _reason_prompt(producer_data: Dict[str, Any], user_query: str, matching_genres: List[str]) -> str:
+    """Prompt asking for the reason of a single producer"""
+    # Extract producer details for the prompt
+    producer_name = producer_data.get("fullName", "Unknown Producer")
+    producer_genres = producer_data.get("genres", [])
+    producer_skills = producer_data.get("skills", [])
+    producer_tools = producer_data.get("tools", [])
+    producer_experience = producer_data.get("experience", "")
+    producer_country = producer_data.get("country", "")
+
+    return f"""
+        You are a music producer recommendation expert. Your task is to explain why a specific music producer would be a good match for a user's request.
+
+        User's query: "{user_query}"
+
+        Producer details:
+        - Name: {producer_name}
+        - Genres: {', '.join(producer_genres)}
+        - Skills: {', '.join(producer_skills)}
+        - Tools: {', '.join(producer_tools if producer_tools else [])}
+        - Experience: {producer_experience}
+        - Country: {producer_country}
+
+        The user's query matches the following genres: {', '.join(matching_genres)}
+
+        Generate a concise, personalized explanation 30-60 words) for why this producer would be a good match for the user's needs.
+
+        The response should:
+        1. Highlight the producer's strengths related to the user's needs
+        2. Mention specific matching genres/skills/tools
+        3. Explain why this producer would be valuable for the user's specific project
+        4. If the producer isn't a perfect match, acknowledge this but explain what value they still offer
+
+        Your response should be friendly, direct, and specific to this producer and request.
+        """
+
+
+def _batch_reason_prompt(items: List[ReasonItem], user_query: str) -> str:
+    """Prompt asking for the reasons of several producers at once, as a JSON object keyed by producer id"""
+    profiles = [
+        {
+            "id": producer_id,
+            "name": producer_data.get("fullName", "Unknown Producer"),
+            "genres": producer_data.get("genres") or [],
+            "skills": producer_data.get("skills") or [],
+            "tools": producer_data.get("tools") or [],
+            "experience": producer_data.get("experience") or "",
+            "country": producer_data.get("country") or "",
+            "matching_genres": matching_genres
+        }
+        for producer_id, producer_data, matching_genres in items
+    ]
+    return f"""
+        You are a music producer recommendation expert. Your task is to explain why each of the music producers below would be a good match for a user's request.
+
+        User's query: "{user_query}"
+
+        Producers (JSON, one object per producer; matching_genres are the genres of the query the producer matches):
+        {json.dumps(profiles, ensure_ascii=False)}
+
+        For each producer, generate a concise, personalized explanation (30-60 words) for why they would be a good match for the user's needs.
+
+        Each explanation should:
+        1. Highlight the producer's strengths related to the user's needs
+        2. Mention specific matching genres/skills/tools
+        3. Explain why this producer would be valuable for the user's specific project
+        4. If the producer isn't a perfect match, acknowledge this but explain what value they still offer
+
+        Explanations should be friendly, direct, and specific to each producer and the request.
+
+        Respond with a JSON object mapping each producer's id to its explanation, for example:
+        {{"<producer id>": "<explanation>"}}
+        """
+
+
+def parse_reason_map(text: str, producer_ids: List[str]) -> Dict[str, str]:
+    """
+    Read the reasons from a batched response. Entries for unknown ids and empty or
+    non-text reasons are dropped; invalid JSON yields no reasons at all.
+    """
+    try:
+        reasons = json.loads(text)
+    except (json.JSONDecodeError, TypeError):
+        return {}
+    if not isinstance(reasons, dict):
+        return {}
+    wanted = set(producer_ids)
+    return {
+        str(producer_id): reason.strip()
+        for producer_id, reason in reasons.items()
+        if str(producer_id) in wanted and isinstance(reason, str) and reason.strip()
+    }
+
+
+async def iter_recommendation_reasons(items: List[ReasonItem], user_query: str, client: Optional[LLMClient] = None,
+                                      criteria: Optional[Dict[str, Any]] = None,
+                                      cache: Optional[ReasonCache] = reason_cache,
+                                      deadline: Optional[Deadline] = None) -> AsyncIterator[Tuple[str, Optional[str]]]:
+    """
+    Yield (producer id, reason) pairs for several recommended producers as they become available;
+    every producer is yielded once. Reasons are cached by the producer's profile, the genres it
+    matched and the query's extracted criteria (the query text if none are given): cached reasons
+    are yielded first and the rest are generated with one model call within the request's deadline.
+    """
+    criteria = criteria if criteria is not None else {"query": user_query}
+    keys = {}
+    cached = {}
+    if cache is not None:
+        keys = {
+            producer_id: reason_cache_key(producer_data, matching_genres, criteria)
+            for producer_id, producer_data, matching_genres in items
+        }
+        cached = await cache.get_many(list(keys.values()))
+    uncached = []
+    for item in items:
+        producer_id = item[0]
+        reason = cached.get(keys[producer_id]) if cache is not None else None
+        if reason is not None:
+            yield producer_id, reason
+        else:
+            uncached.append(item)
+
+    async for producer_id, reason in _iter_generated_reasons(uncached, user_query, client, deadline):
+        if reason is not None and cache is not None:
+            cache.put(keys[producer_id], producer_id, reason)
+        yield producer_id, reason
+
+
+async def _iter_generated_reasons(items: List[ReasonItem], user_query: str, client: Optional[LLMClient] = None,
+                                  deadline: Optional[Deadline] = None) -> AsyncIterator[Tuple[str, Optional[str]]]:
+    """
+    Generate the reasons for several recommended producers with one model call, yielding
+    (producer id, reason) pairs as they become available; every producer is yielded once.
+    The query is sent once with a compact profile of each producer, and the model answers
+    with a JSON map of producer id to reason. Producers missing from a valid answer, or all
+    of them if the answer is unusable, get a reason from a call of their own and are yielded
+    as those calls complete. If the batched call times out, the time is spent and every reason is None;
+    the same goes for all reasons while Gemini is unavailable.
+    """
+    producer_ids = [producer_id for producer_id, _, _ in items]
+    if not items:
+        return
+    client = client or reason_llm
+    if not client.available:
+        for producer_id in producer_ids:
+            yield producer_id, None
+        return
+
+    reasons: Dict[str, str] = {}
+    try:
+        text = await asyncio.wait_for(
+            _generate(client, _batch_reason_prompt(items, user_query), {
+                "temperature": 0.7,
+                "max_output_tokens": REASON_MAX_OUTPUT_TOKENS * len(items),
+                "response_mime_type": "application/json",
+            }, deadline),
+            timeout=time_budget(settings.REASON_TIMEOUT_SECONDS, deadline)
+        )
+        reasons = parse_reason_map(text, producer_ids)
+    except (asyncio.TimeoutError, LLMUnavailableError) as e:
+        print(f"Not generating reasons for {len(items)} producers: {str(e) or 'timed out'}")
+        for producer_id in producer_ids:
+            yield producer_id, None
+        return
+    except Exception as e:
+        print(f"Error generating batched recommendation reasons: {str(e)}")
+
+    for producer_id in producer_ids:
+        if producer_id in reasons:
+            yield producer_id, reasons[producer_id]
+
+    missing = [item for item in items if item[0] not in reasons]
+    if missing:
+        print(f"Generating {len(missing)} of {len(items)} recommendation reasons individually")
+
+        async def individual_reason(item: ReasonItem) -> Tuple[str, Optional[str]]:
+            producer_id, producer_data, matching_genres = item
+            return producer_id, await generate_recommendation_reason(producer_data, user_query, matching_genres,
+                                                                     client=client, deadline=deadline)
+
+        for next_reason in asyncio.as_completed([individual_reason(item) for item in missing]):
+            yield await next_reason
+
+
+async def generate_recommendation_reasons(items: List[ReasonItem], user_query: str, client: Optional[LLMClient] = None,
+                                          criteria: Optional[Dict[str, Any]] = None,
+                                          cache: Optional[ReasonCache] = reason_cache,
+                                          deadline: Optional[Deadline] = None) -> Dict[str, Optional[str]]:
+    """Generate the reasons for several recommended producers; see iter_recommendation_reasons"""
+    reasons = {
+        producer_id: reason
+        async for producer_id, reason in iter_recommendation_reasons(items, user_query, client, criteria, cache, deadline)
+    }
+    return {producer_id: reasons.get(producer_id) for producer_id, _, _ in items}
@@ -0,0 +1,294 @@
+import numpy as np
+from scipy import sparse
+from typing import List, Dict, Any, Iterator, Optional, Tuple
+
+from app.models.neighbors import lookup_neighbors
+
+# Feature weights used when encoding producers and queries
+GENRE_WEIGHT = 2.0
+SKILL_WEIGHT = 2.0
+TOOL_WEIGHT = 1.0
+EXPERIENCE_WEIGHT = 1.0
+
+
+class ServingState:
+    """
+    Precomputed, read-only view of a trained model used to answer queries.
+    Built once when the model is loaded or trained so that requests never
+    have to convert the feature matrix or recompute row norms.
+    A state is never modified once it is serving; a new model, or an updated copy of
+    this one, replaces it as a whole.
+    """
+
+    def __init__(self, feature_matrix: np.ndarray, producer_ids: List[str], producer_names: List[str],
+                 all_genres: List[str], all_skills: List[str], all_tools: List[str],
+                 all_experience_levels: List[str], row_norms: Optional[np.ndarray] = None,
+                 genre_index: Optional[Tuple[np.ndarray, np.ndarray]] = None,
+                 neighbor_table: Optional[Tuple[np.ndarray, np.ndarray]] = None,
+                 metadata: Optional[Dict[str, Any]] = None, version: Optional[str] = None):
+        # Feature values are small integers, so float32 holds them exactly
+        self.is_sparse = sparse.issparse(feature_matrix)
+        if self.is_sparse:
+            self.feature_matrix = sparse.csr_matrix(feature_matrix, dtype=np.float32)
+            self.feature_matrix.sort_indices()
+        else:
+            self.feature_matrix = np.ascontiguousarray(feature_matrix, dtype=np.float32)
+        # Norms are kept in float64 so scores match the original per-row computation
+        if row_norms is None:
+            row_norms = self._compute_row_norms()
+        self.row_norms = row_norms
+        # Number of producers with each feature; values nobody has any more are left out of queries
+        self.column_counts = self._compute_column_counts()
+        self.producer_ids = list(producer_ids)
+        self.producer_names = list(producer_names)
+        self.metadata = metadata if metadata is not None else {}
+        self.version = version
+        # Precomputed (indices, scores) of each producer's most similar producers, if any
+        self.neighbor_table = neighbor_table
+        self.n_producers, self.n_features = self.feature_matrix.shape
+        self.producer_rows = {producer_id: row for row, producer_id in enumerate(self.producer_ids)}
+        # Rows of deleted producers
+        self.deleted_rows = np.zeros(self.n_producers, dtype=bool)
+        # Incremental producer changes applied since the model was built
+        self.applied_updates = 0
+
+        self.all_genres = list(all_genres)
+        self.all_skills = list(all_skills)
+        self.all_tools = list(all_tools)
+        self.all_experience_levels = list(all_experience_levels)
+
+        # Vocabulary -> column lookups (genres, skills, tools, experience are stacked in that order)
+        offset = 0
+        self.genre_columns = {genre: offset + i for i, genre in enumerate(self.all_genres)}
+        offset += len(self.all_genres)
+        self.skill_columns = {skill: offset + i for i, skill in enumerate(self.all_skills)}
+        offset += len(self.all_skills)
+        self.tool_columns = {tool: offset + i for i, tool in enumerate(self.all_tools)}
+        offset += len(self.all_tools)
+        self.experience_columns = {level: offset + i for i, level in enumerate(self.all_experience_levels)}
+
+        self.genre_positions = {genre: i for i, genre in enumerate(self.all_genres)}
+        if genre_index is None:
+            self._build_genre_index()
+        else:
+            self.genre_index_indptr, self.genre_index_rows = genre_index
+
+    def _compute_row_norms(self) -> np.ndarray:
+        """L2 norm of every producer row"""
+        if self.is_sparse:
+            squared = self.feature_matrix.astype(np.float64).power(2)
+            return np.sqrt(np.asarray(squared.sum(axis=1)).ravel())
+        return np.linalg.norm(self.feature_matrix.astype(np.float64), axis=1)
+
+    def _compute_column_counts(self) -> np.ndarray:
+        """Number of producer rows with a non-zero value in every feature column"""
+        if self.is_sparse:
+            return np.bincount(self.feature_matrix.indices[self.feature_matrix.data != 0],
+                               minlength=self.feature_matrix.shape[1]).astype(np.int64)
+        return np.count_nonzero(self.feature_matrix, axis=0).astype(np.int64)
+
+    def _build_genre_index(self):
+        """
+        Build an inverted index from each genre to the sorted rows of the producers that have it.
+        Postings are stored back to back in genre_index_rows, with genre_index_indptr[g]:genre_index_indptr[g + 1]
+        delimiting the rows for the genre at position g in all_genres.
+        """
+        genre_block = self.feature_matrix[:, :len(self.all_genres)]
+        if self.is_sparse:
+            # A CSC copy of the genre block already lists the rows of each genre column in order
+            genre_block = sparse.csc_matrix(genre_block)
+            # Genre features were multiplied by 2.0 during training
+            genre_block.data = np.where(genre_block.data > 1.9, 1.0, 0.0)  # Allow for small floating point differences
+            genre_block.eliminate_zeros()
+            genre_block.sort_indices()
+            self.genre_index_indptr = genre_block.indptr.astype(np.int64)
+            self.genre_index_rows = genre_block.indices.astype(np.int32)
+            return
+        # Genre features were multiplied by 2.0 during training
+        genre_ids, rows = np.nonzero(genre_block.T > 1.9)  # Allow for small floating point differences
+        counts = np.bincount(genre_ids, minlength=len(self.all_genres))
+        self.genre_index_indptr = np.concatenate(([0], np.cumsum(counts))).astype(np.int64)
+        self.genre_index_rows = rows.astype(np.int32)
+
+    def genre_postings(self, genre: str) -> np.ndarray:
+        """Sorted rows of the producers that have the given genre"""
+        position = self.genre_positions.get(genre)
+        if position is None:
+            return self.genre_index_rows[:0]
+        return self.genre_index_rows[self.genre_index_indptr[position]:self.genre_index_indptr[position + 1]]
+
+    def match_genres(self, genres: List[str]) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Find the producers that have at least one of the requested genres.
+        Returns the sorted candidate rows and, for each, how many requested genres it matches.
+        """
+        postings = [self.genre_postings(genre) for genre in genres]
+        if not postings:
+            return np.empty(0, dtype=np.int32), np.empty(0, dtype=np.int64)
+        return np.unique(np.concatenate(postings), return_counts=True)
+
+    def score_candidates(self, candidate_indices: np.ndarray, match_counts: np.ndarray,
+                         query_vector: np.ndarray, n_genres: int) -> np.ndarray:
+        """Cosine similarity to the query, boosted by the share of requested genres each candidate matches"""
+        # Cosine similarity for all candidates in one matrix-vector product
+        dot_products = self.feature_matrix[candidate_indices] @ query_vector
+        return self._boosted_similarities(dot_products, candidate_indices, match_counts,
+                                          np.linalg.norm(query_vector), n_genres)
+
+    def _boosted_similarities(self, dot_products: np.ndarray, candidate_indices: np.ndarray,
+                              match_counts: np.ndarray, query_norm: float, n_genres: int) -> np.ndarray:
+        """Turn candidates' dot products with a query into genre-boosted cosine similarities"""
+        denominators = query_norm * self.row_norms[candidate_indices]
+        similarities = np.zeros(len(candidate_indices))
+        np.divide(dot_products, denominators, out=similarities, where=denominators > 0)
+        # Boost similarity based on number of matching genres
+        return similarities * (1 + match_counts / n_genres)
+
+    def rank(self, query_vector: np.ndarray, genres: List[str], top_n: int) -> Tuple[np.ndarray, np.ndarray, int]:
+        """
+        Rank the producers that match at least one requested genre against the query.
+        Returns the top rows, their scores and the number of candidates scored.
+        """
+        candidate_indices, match_counts = self.match_genres(genres)
+        if len(candidate_indices) == 0:
+            return candidate_indices, np.empty(0), 0
+
+        scores = self.score_candidates(candidate_indices, match_counts, query_vector, len(genres))
+        top = top_k_indices(scores, top_n)
+        return candidate_indices[top], scores[top], len(candidate_indices)
+
+    def rank_batch(self, query_matrix: np.ndarray, genre_lists: List[List[str]], top_n: int,
+                   block_elements: int = 16_000_000) -> Iterator[Tuple[np.ndarray, np.ndarray, int]]:
+        """
+        Rank the catalogue for many queries at once, exactly as rank() would for each of them.
+        Dot products for a block of queries come from a single matrix-matrix product, with
+        at most block_elements of them held in memory; genre filtering and top-k are per query.
+        Yields the top rows, their scores and the number of candidates for each query, in order.
+        """
+        n_queries = query_matrix.shape[0]
+        query_norms = np.linalg.norm(query_matrix, axis=1)
+        block_size = max(1, block_elements // max(self.n_producers, 1))
+
+        for start in range(0, n_queries, block_size):
+            block = query_matrix[start:start + block_size]
+            # (producers, queries) dot products for the whole block
+            dot_products = np.asarray(self.feature_matrix @ block.T)
+            for offset in range(block.shape[0]):
+                query = start + offset
+                genres = genre_lists[query]
+                candidate_indices, match_counts = self.match_genres(genres)
+                if len(candidate_indices) == 0:
+                    yield candidate_indices, np.empty(0), 0
+                    continue
+                scores = self._boosted_similarities(dot_products[candidate_indices, offset], candidate_indices,
+                                                    match_counts, query_norms[query], len(genres))
+                top = top_k_indices(scores, top_n)
+                yield candidate_indices[top], scores[top], len(candidate_indices)
+
+    def recommend_batch(self, queries: List[Dict[str, Any]], top_n: int,
+                        block_elements: int = 16_000_000) -> Iterator[List[Dict[str, Any]]]:
+        """
+        Recommendations for many queries, dicts with genres, skills, tools and experience,
+        ranked with rank_batch. Yields each query's recommendations in order.
+        """
+        genre_lists = [query.get("genres") or [] for query in queries]
+        query_matrix = np.stack([
+            self.build_query_vector(genres, query.get("skills") or [], query.get("tools"), query.get("experience"))
+            for genres, query in zip(genre_lists, queries)
+        ]) if queries else np.zeros((0, self.n_features))
+
+        ranked = self.rank_batch(query_matrix, genre_lists, top_n, block_elements=block_elements)
+        for genres, (top_rows, top_scores, _) in zip(genre_lists, ranked):
+            yield [
+                {
+                    "id": self.producer_ids[index],
+                    "name": self.producer_names[index] if index < len(self.producer_names) else "",
+                    "similarity_score": score,
+                    "matching_genres": self.matching_genres(index, genres)
+                }
+                for index, score in zip(top_rows.tolist(), top_scores.tolist())
+            ]
+
+    def matching_genres(self, row: int, genres: List[str]) -> List[str]:
+        """Requested genres the producer at the given row has, in request order"""
+        matches = []
+        for genre in genres:
+            postings = self.genre_postings(genre)
+            position = np.searchsorted(postings, row)
+            if position < len(postings) and postings[position] == row:
+                matches.append(genre)
+        return matches
+
+    def similar_producers(self, row: int, limit: int) -> Tuple[np.ndarray, np.ndarray]:
+        """Rows and cosine similarities of the producers most similar to the one at the given row, best first"""
+        if self.neighbor_table is None:
+            return np.empty(0, dtype=np.int32), np.empty(0, dtype=np.float32)
+        indices, scores = self.neighbor_table
+        return lookup_neighbors(indices, scores, row, limit)
+
+    @classmethod
+    def from_metadata(cls, metadata: Dict[str, Any], sparse_features: bool = False) -> "ServingState":
+        """Build serving state from the model metadata dictionary"""
+        producer_ids = metadata["producer_ids"]
+        feature_matrix = np.asarray(metadata["feature_matrix"], dtype=np.float32)
+        if sparse_features:
+            feature_matrix = sparse.csr_matrix(feature_matrix)
+        return cls(
+            feature_matrix=feature_matrix,
+            producer_ids=producer_ids,
+            producer_names=metadata.get("producer_names", [""] * len(producer_ids)),
+            all_genres=metadata["all_genres"],
+            all_skills=metadata["all_skills"],
+            all_tools=metadata["all_tools"],
+            all_experience_levels=metadata.get("all_experience_levels", [])
+        )
+
+    def build_query_vector(self, genres: List[str], skills: List[str], tools: Optional[List[str]] = None,
+                           experience: Optional[str] = None) -> np.ndarray:
+        """
+        Encode a request into the same feature space as the producers.
+        Values no producer has, including ones every holder of was deleted or updated away
+        from since training, are ignored as a retrained model would.
+        """
+        query_vector = np.zeros(self.n_features)
+
+        for genre in genres:
+            self._set_query_value(query_vector, self.genre_columns.get(genre), GENRE_WEIGHT)
+
+        for skill in skills:
+            self._set_query_value(query_vector, self.skill_columns.get(skill), SKILL_WEIGHT)
+
+        for tool in tools or []:
+            self._set_query_value(query_vector, self.tool_columns.get(tool), TOOL_WEIGHT)
+
+        if experience:
+            self._set_query_value(query_vector, self.experience_columns.get(experience), EXPERIENCE_WEIGHT)
+
+        return query_vector
+
+    def _set_query_value(self, query_vector: np.ndarray, column: Optional[int], weight: float):
+        if column is not None and self.column_counts[column] > 0:
+            query_vector[column] = weight
+
+
+def top_k_indices(scores: np.ndarray, k: int) -> np.ndarray:
+    """
+    Return the positions of the k highest scores, best first.
+    Ties are broken by position, matching a stable descending sort.
+    """
+    n = len(scores)
+    if k <= 0 or n == 0:
+        return np.empty(0, dtype=np.intp)
+    
+    if k < n:
+        # Partition around the k-th best score, then keep every score above it
+        # and fill the remaining slots with the earliest tied positions
+        kth_score = scores[np.argpartition(-scores, k - 1)[k - 1]]
+        above = np.flatnonzero(scores > kth_score)
+        tied = np.flatnonzero(scores == kth_score)[:k - len(above)]
+        selected = np.concatenate((above, tied))
+    else:
+        selected = np.arange(n)
+    
+    order = np.lexsort((selected, -scores[selected]))
+    return selected[order]
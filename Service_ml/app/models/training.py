@@ -0,0 +1,119 @@
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Any, Optional, Callable
+from datetime import datetime
+
+from app.models.serving import ServingState
+from app.models.features import EncodedProducers
+from app.models.evaluation import evaluate_neighbor_similarity
+from app.models.neighbors import build_neighbor_table
+from app.models.artifact import save_artifact
+from app.models.model_store import ModelStore
+
+# The candidate generation backend settings.ANN_BACKEND can select; every genre-matching producer is scored
+EXACT_BACKEND = "exact"
+
+# Training runs in a separate process so that it never blocks the event loop
+_training_executor: Optional[ProcessPoolExecutor] = None
+
+
+def get_training_executor() -> ProcessPoolExecutor:
+    """Get the process pool used for training, creating it on first use"""
+    global _training_executor
+    if _training_executor is None:
+        # Spawn rather than fork: the server process has a running event loop and database client threads
+        _training_executor = ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("spawn"))
+    return _training_executor
+
+
+def shutdown_training_executor():
+    """Stop the training worker process if it was started"""
+    global _training_executor
+    if _training_executor is not None:
+        _training_executor.shutdown(wait=False, cancel_futures=True)
+        _training_executor = None
+
+
+def build_model_artifact(encoded: EncodedProducers, store_root: str, sparse_features: bool = True,
+                         evaluation_sample_size: Optional[int] = None,
+                         evaluation_block_elements: int = 16_000_000, neighbor_k: int = 10,
+                         ann_backend: str = EXACT_BACKEND,
+                         dataset_fingerprint: Optional[Dict[str, Any]] = None,
+                         progress: Optional[Callable[[str], None]] = None) -> Dict[str, Any]:
+    """
+    Index and evaluate encoded producers and write the model artifact
+    as a new version in the model store. The version is not made current here.
+    Runs in the training worker process; returns the training info stored in the manifest.
+    The fingerprint of the data the producers were read from is stored with the training info.
+    progress, if given, is called with the name of each stage as it starts and must be picklable.
+    """
+    if ann_backend != EXACT_BACKEND:
+        raise ValueError(f"Unsupported ANN backend '{ann_backend}'; only '{EXACT_BACKEND}' is available")
+    store = ModelStore(store_root)
+    version, staging_dir = store.create_staging_dir()
+    try:
+        info = _write_model_artifact(encoded, staging_dir, sparse_features,
+                                     evaluation_sample_size, evaluation_block_elements,
+                                     neighbor_k, dataset_fingerprint,
+                                     progress or _ignore_progress)
+        store.commit_staging_dir(version, staging_dir)
+    except Exception:
+        store.discard_staging_dir(staging_dir)
+        raise
+    info["version"] = version
+    return info
+
+
+def _ignore_progress(stage: str):
+    pass
+
+
+def _write_model_artifact(encoded: EncodedProducers, artifact_dir: str, sparse_features: bool,
+                          evaluation_sample_size: Optional[int], evaluation_block_elements: int,
+                          neighbor_k: int,
+                          dataset_fingerprint: Optional[Dict[str, Any]],
+                          progress: Callable[[str], None]) -> Dict[str, Any]:
+    """Train on the encoded producers and write the artifact files into the directory"""
+    X = encoded.feature_matrix(sparse_features)
+    producer_ids = encoded.producer_ids
+    producer_names = encoded.producer_names
+    
+    n_neighbors = min(11, len(producer_ids))  # Include the producer itself + up to 10 neighbors
+    
+    # Save model with timestamp
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    
+    progress("index")
+    # Build the serving state and save it as a binary artifact
+    state = ServingState(
+        feature_matrix=X,
+        producer_ids=producer_ids,
+        producer_names=producer_names,
+        all_genres=encoded.all_genres,
+        all_skills=encoded.all_skills,
+        all_tools=encoded.all_tools,
+        all_experience_levels=encoded.all_experience_levels
+    )
+    
+    # Precompute every producer's most similar producers so "more like this" lookups need no scoring
+    state.neighbor_table = build_neighbor_table(X, neighbor_k, block_elements=evaluation_block_elements)
+    
+    progress("evaluate")
+    # Evaluate model by computing average neighbor similarity for each producer (or a sample of them)
+    evaluation = evaluate_neighbor_similarity(
+        X, n_neighbors,
+        sample_size=evaluation_sample_size,
+        block_elements=evaluation_block_elements
+    )
+    
+    progress("persist")
+    info = {
+        "training_date": timestamp,
+        "dataset_size": encoded.n_producers,
+        "n_neighbors": n_neighbors,
+        "neighbor_k": neighbor_k,
+        "dataset_fingerprint": dataset_fingerprint,
+        **evaluation
+    }
+    save_artifact(artifact_dir, state, info)
+    return info
@@ -0,0 +1,247 @@
+import os
+import json
+import uuid
+import asyncio
+from datetime import datetime
+from functools import partial
+from typing import Dict, Any, Optional, Tuple, Callable, Awaitable
+
+from app.core.config import settings
+from app.core.file_lock import FileLock
+
+JOBS_DIR = "jobs"
+LOCK_FILE = "training.lock"
+TRAINING_STAGES = ("fetch", "encode", "index", "evaluate", "persist")
+FINISHED_STATUSES = ("succeeded", "failed")
+
+# Runs one training; called with a function that records the stage the training has reached
+TrainingRun = Callable[[Callable[[str], None]], Awaitable[Dict[str, Any]]]
+
+
+def _now() -> str:
+    return datetime.now().isoformat(timespec="seconds")
+
+
+def _job_path(jobs_dir: str, job_id: str) -> str:
+    return os.path.join(jobs_dir, f"{job_id}.json")
+
+
+def read_job(jobs_dir: str, job_id: str) -> Optional[Dict[str, Any]]:
+    """Status of a training job, or None if there is no such job"""
+    # Job ids are generated hex strings; anything else cannot name a job file
+    if not job_id or not all(c in "0123456789abcdef" for c in job_id):
+        return None
+    try:
+        with open(_job_path(jobs_dir, job_id), "r", encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+
+def write_job(jobs_dir: str, job: Dict[str, Any]):
+    """Replace a job's status file atomically, so pollers in other processes never read a partial file"""
+    os.makedirs(jobs_dir, exist_ok=True)
+    path = _job_path(jobs_dir, job["job_id"])
+    tmp_path = f"{path}.tmp-{os.getpid()}"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(job, f)
+    os.replace(tmp_path, path)
+
+
+def record_stage(jobs_dir: str, job_id: str, stage: str):
+    """
+    Mark a job as having reached a stage, finishing the stages before it.
+    Called from the training worker process as well as the server, so it only uses the files.
+    """
+    job = read_job(jobs_dir, job_id)
+    if job is None or stage not in TRAINING_STAGES:
+        return
+    now = _now()
+    reached = TRAINING_STAGES.index(stage)
+    for entry in job["stages"][:reached]:
+        if entry["status"] != "done":
+            entry["status"] = "done"
+            entry["started_at"] = entry["started_at"] or now
+            entry["finished_at"] = now
+    current = job["stages"][reached]
+    current["status"] = "running"
+    current["started_at"] = now
+    job["stage"] = stage
+    write_job(jobs_dir, job)
+
+
+class TrainingJobs:
+    """
+    Training runs as background jobs with status files that any server process can read.
+    A lock file in the model directory lets at most one job run across all processes
+    sharing the directory; submitting while a job runs returns that job instead.
+    """
+
+    def __init__(self, root: str, keep_jobs: int = 20):
+        self.jobs_dir = os.path.join(root, JOBS_DIR)
+        self.keep_jobs = keep_jobs
+        self._lock = FileLock(os.path.join(root, LOCK_FILE))
+        # Jobs running in this process
+        self._tasks: Dict[str, asyncio.Task] = {}
+
+    async def submit(self, run: TrainingRun) -> Tuple[Dict[str, Any], bool]:
+        """
+        Start a training job unless one is already running.
+        Returns the status of the started or running job and whether it was started by this call.
+        """
+        if self._lock.held or not self._lock.acquire():
+            job = await self._running_job()
+            if job is not None:
+                return job, False
+            # The holder finished while we looked for its job
+            if self._lock.held or not self._lock.acquire():
+                raise RuntimeError("A training job is running but its status could not be read")
+
+        job_id = uuid.uuid4().hex
+        job = {
+            "job_id": job_id,
+            "status": "queued",
+            "stage": None,
+            "stages": [
+                {"name": stage, "status": "pending", "started_at": None, "finished_at": None}
+                for stage in TRAINING_STAGES
+            ],
+            "created_at": _now(),
+            "started_at": None,
+            "finished_at": None,
+            "message": None,
+            "details": None,
+            "pid": os.getpid()
+        }
+        try:
+            # Name the job in the lock file first: a status file whose job is not named there belongs to a dead job
+            self._lock.write_owner(job_id)
+            write_job(self.jobs_dir, job)
+        except Exception:
+            self._lock.release()
+            raise
+        self._tasks[job_id] = asyncio.create_task(self._run(job_id, run))
+        self._prune()
+        return job, True
+
+    async def _running_job(self, attempts: int = 20) -> Optional[Dict[str, Any]]:
+        """The job of the process holding the lock; it records its job id just after taking the lock"""
+        for _ in range(attempts):
+            job_id = self._lock.read_owner()
+            job = read_job(self.jobs_dir, job_id) if job_id else None
+            if job is not None and job["status"] not in FINISHED_STATUSES:
+                return job
+            # A lock this process holds belongs to its own running job and must not be probed
+            if not self._lock.held and self._lock.acquire():
+                # Nobody holds the lock any more
+                self._lock.release()
+                return None
+            await asyncio.sleep(0.05)
+        return None
+
+    async def _run(self, job_id: str, run: TrainingRun) -> Dict[str, Any]:
+        job = read_job(self.jobs_dir, job_id)
+        job.update(status="running", started_at=_now())
+        write_job(self.jobs_dir, job)
+        try:
+            result = await run(partial(record_stage, self.jobs_dir, job_id))
+        except Exception as e:
+            result = {"success": False, "message": f"Error training model: {str(e)}", "details": None}
+
+        try:
+            job = read_job(self.jobs_dir, job_id)
+            now = _now()
+            for entry in job["stages"]:
+                if entry["status"] == "running":
+                    entry["status"] = "done" if result["success"] else "failed"
+                    entry["finished_at"] = now
+            job.update(
+                status="succeeded" if result["success"] else "failed",
+                finished_at=now,
+                message=result["message"],
+                details=result.get("details")
+            )
+            write_job(self.jobs_dir, job)
+        finally:
+            self._lock.release()
+            self._tasks.pop(job_id, None)
+        return result
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """Status of a job; a job whose process died without finishing it is reported as failed"""
+        job = read_job(self.jobs_dir, job_id)
+        if job is None or job["status"] in FINISHED_STATUSES or job_id in self._tasks:
+            return job
+        if self._lock.read_owner() != job_id:
+            # A later job has taken the lock since
+            return self._mark_interrupted(job)
+        if not self._lock.held and self._lock.acquire():
+            # The lock is free, so the process running the job is gone
+            try:
+                return self._mark_interrupted(job)
+            finally:
+                self._lock.release()
+        return job
+
+    def _mark_interrupted(self, job: Dict[str, Any]) -> Dict[str, Any]:
+        job.update(status="failed", finished_at=_now(), message="Training job was interrupted")
+        write_job(self.jobs_dir, job)
+        return job
+
+    async def wait(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """Wait for a job running in this process to finish and return its final status"""
+        task = self._tasks.get(job_id)
+        if task is not None:
+            await asyncio.shield(task)
+        return self.get(job_id)
+
+    def _prune(self):
+        """Delete the status files of all but the most recent finished jobs"""
+        try:
+            names = [name for name in os.listdir(self.jobs_dir) if name.endswith(".json")]
+        except FileNotFoundError:
+            return
+        paths = sorted((os.path.join(self.jobs_dir, name) for name in names), key=os.path.getmtime)
+        finished = []
+        for path in paths:
+            try:
+                with open(path, "r", encoding="utf-8") as f:
+                    if json.load(f)["status"] in FINISHED_STATUSES:
+                        finished.append(path)
+            except (OSError, ValueError, KeyError):
+                continue
+        for path in finished[:max(len(finished) - self.keep_jobs, 0)]:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+
+async def train_from_database(progress: Optional[Callable[[str], None]] = None) -> Dict[str, Any]:
+    """Train the model on the producers currently in the database"""
+    # Imported here so that the training worker process, which unpickles record_stage
+    # from this module, does not load the served model
+    from app.models.database import db
+    from app.models.ml_model import recommender_model
+
+    # Fingerprint the data before reading it, so changes made during training count as changes later
+    fingerprint = await db.get_dataset_fingerprint()
+    producers_count = fingerprint["count"]
+
+    if producers_count < 5:
+        return {
+            "success": False,
+            "message": "Not enough data to train model. Minimum 5 producers required.",
+            "details": {"producers_count": producers_count}
+        }
+
+    # Train the model on producers streamed from the database
+    return await recommender_model.train(
+        db.iter_training_producers(),
+        expected_count=producers_count,
+        fingerprint=fingerprint,
+        progress=progress
+    )
+
+
+training_jobs = TrainingJobs(settings.MODEL_ARTIFACT_DIR, keep_jobs=settings.TRAINING_JOBS_KEEP)
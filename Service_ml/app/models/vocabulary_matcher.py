@@ -0,0 +1,302 @@
+import re
+import json
+import math
+from collections import deque
+from typing import List, Dict, Any, Optional, Tuple
+
+# Aliases of vocabulary terms that the vocabulary itself does not spell out.
+# Keys are vocabulary terms; aliases of terms missing from the served vocabulary are ignored.
+DEFAULT_SYNONYMS: Dict[str, List[str]] = {
+    "Hip-Hop": ["hiphop", "rap"],
+    "R&B": ["rnb", "r and b", "rhythm and blues"],
+    "EDM": ["electronic", "electronic dance music", "dance music"],
+    "Lo-fi": ["lofi"],
+    "K-pop": ["kpop"],
+    "J-pop": ["jpop"],
+    "C-pop": ["cpop"],
+    "Classical": ["orchestral"],
+    "Beat Making": ["beatmaking", "beat maker", "beatmaker", "beats"],
+    "Composition": ["composer", "composing"],
+    "Arranging": ["arranger", "arrangement"],
+    "Mixing": ["mix", "mixer", "mixing engineer"],
+    "Mastering": ["mastering engineer"],
+    "Remixing": ["remix", "remixer"],
+    "Songwriting": ["songwriter", "song writing", "song writer"],
+    "Sound Designing": ["sound design"],
+    "Film Scoring": ["film score", "film composer", "scoring"],
+    "Vocal Producing": ["vocal production", "vocal producer"],
+    "Synthesizer Programming": ["synth programming", "sound synthesis"],
+    "Drum Programming": ["drum programmer"],
+    "Ableton Live": ["ableton"],
+    "FL Studio": ["fl", "fruity loops", "fruityloops"],
+    "Logic Pro": ["logic", "logic pro x"],
+    "Native Instruments Komplete": ["komplete"],
+    "Waves Plugins": ["waves"],
+}
+
+# Single-word terms that are also everyday English; only the language model can tell what they mean,
+# so the local parser leaves them unmatched
+AMBIGUOUS_TERMS = {"audition", "classic", "country", "fl", "house", "logic", "massive", "mix", "reason", "road"}
+
+# Words a query can contain without asking for anything, counted neither as matched nor unmatched
+STOPWORDS = {
+    "a", "about", "album", "also", "an", "and", "any", "anyone", "are", "artist", "as", "at", "be", "been", "best",
+    "but", "can", "could", "do", "does", "experience", "experienced", "expert", "find", "for", "from",
+    "genre", "get", "good", "great", "has", "have", "help", "how", "i", "in", "into", "is", "it", "know", "knows",
+    "least", "less", "like", "looking", "make", "me", "minimum", "more", "most", "music", "my", "need",
+    "of", "on", "or", "our", "over", "person", "please", "plus", "pro", "produce", "producer", "producing",
+    "production", "project", "recommend", "session", "should", "skill", "skilled", "someone", "somebody", "song",
+    "strong", "style", "than", "that", "the", "their", "them", "they", "this", "to", "track", "under",
+    "up", "us", "use", "using", "want", "we", "who", "whose", "will", "with", "work", "would", "year",
+    "yr", "you", "your",
+}
+
+# Words naming the kind of person wanted; nearly every query uses them, so a term made only of
+# these and stopwords, e.g. the skill "Music Producer", says nothing about the query
+ROLE_WORDS = {"artist", "musician", "producer", "producing", "production"}
+
+# Words that turn a mention into an exclusion, which only the language model can tell apart
+NEGATIONS = {"avoid", "don", "except", "exclude", "excluding", "no", "non", "not", "nothing", "without"}
+
+NUMBER_WORDS = {
+    "one": 1, "two": 2, "three": 3, "four": 4, "five": 5, "six": 6,
+    "seven": 7, "eight": 8, "nine": 9, "ten": 10, "eleven": 11, "twelve": 12,
+}
+
+_TOKEN = re.compile(r"[^\W_]+")
+_NUMBER_WORD = re.compile(r"\b(" + "|".join(NUMBER_WORDS) + r")\b")
+_YEARS = r"\s*(?:years?|yrs?)\b"
+_RANGE = re.compile(r"(\d+)\s*(?:-|–|to)\s*(\d+)\s*\+?" + _YEARS)
+_AT_LEAST = re.compile(r"(?:(?:at least|minimum(?: of)?|over|more than)\s*(\d+)\s*\+?" + _YEARS + r"|(\d+)\s*\+" + _YEARS
+                       + r"|(\d+)" + _YEARS + r"\s*(?:or more|and up|plus))")
+_AT_MOST = re.compile(r"(?:less than|under|fewer than|up to|at most)\s*(\d+)" + _YEARS)
+_POINT = re.compile(r"(\d+)" + _YEARS)
+_LEVEL_RANGE = re.compile(r"^\s*(\d+)\s*-\s*(\d+)")
+_LEVEL_AT_LEAST = re.compile(r"^\s*(\d+)\s*\+")
+
+
+def _singular(token: str) -> str:
+    """Crude singular form, applied alike to vocabulary and queries so plurals match"""
+    if len(token) <= 3 or token.isdigit():
+        return token
+    if token.endswith("ies"):
+        return token[:-3] + "y"
+    if token.endswith("sses"):
+        return token[:-2]
+    if token.endswith("s") and not token.endswith(("ss", "us", "is")):
+        return token[:-1]
+    return token
+
+
+def tokenize(text: str) -> List[str]:
+    """Case-folded, singular word tokens; punctuation separates words, so "Hip-Hop" and "hip hop" agree"""
+    return [_singular(token) for token in _TOKEN.findall(text.casefold())]
+
+
+_STOPWORD_TOKENS = {_singular(word) for word in STOPWORDS}
+_GENERIC_TOKENS = _STOPWORD_TOKENS | {_singular(word) for word in ROLE_WORDS}
+_NEGATION_TOKENS = {_singular(word) for word in NEGATIONS}
+
+
+def _level_range(level: str) -> Optional[Tuple[float, float]]:
+    """Years of experience an experience level covers, e.g. (3, 5) for "3-5 years" and (10, inf) for "10+ years\""""
+    match = _LEVEL_RANGE.match(level)
+    if match:
+        return float(match.group(1)), float(match.group(2))
+    match = _LEVEL_AT_LEAST.match(level)
+    if match:
+        return float(match.group(1)), math.inf
+    return None
+
+
+def _requested_years(text: str) -> Optional[Tuple[float, float]]:
+    """The range of years of experience a case-folded query asks for, if it names one"""
+    text = _NUMBER_WORD.sub(lambda match: str(NUMBER_WORDS[match.group(1)]), text)
+    match = _RANGE.search(text)
+    if match:
+        low, high = sorted((float(match.group(1)), float(match.group(2))))
+        return low, high
+    match = _AT_LEAST.search(text)
+    if match:
+        return float(next(group for group in match.groups() if group)), math.inf
+    match = _AT_MOST.search(text)
+    if match:
+        return 0.0, float(match.group(1))
+    match = _POINT.search(text)
+    if match:
+        return float(match.group(1)), float(match.group(1))
+    return None
+
+
+class VocabularyMatcher:
+    """
+    Extracts query parameters from a query with the served model's vocabulary alone.
+    Every genre, skill, tool and experience level, and the synonyms of those, is compiled
+    into an Aho-Corasick automaton over word tokens, so a query is matched against all of
+    them in a single pass; the longest match wins where matches overlap. Years of experience
+    written as numbers are mapped onto the numeric experience levels. Terms made only of
+    stopwords and role words, and single everyday words, are never matched.
+    """
+
+    def __init__(self, genres: List[str], skills: List[str], tools: List[str],
+                 experience_levels: List[str], synonyms: Optional[Dict[str, List[str]]] = None):
+        # Automaton state -> token -> next state, failure state and (pattern length, term id) outputs
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        self._outputs: List[List[Tuple[int, int]]] = [[]]
+        # Term id -> (category, vocabulary value)
+        self._terms: List[Tuple[str, str]] = []
+        self._levels: List[Tuple[str, Tuple[float, float]]] = []
+
+        canonical: Dict[str, Tuple[str, str]] = {}
+        for category, values in (("genres", genres), ("skills", skills), ("tools", tools)):
+            for value in values:
+                self._add(category, value, value)
+                canonical.setdefault(value.strip().casefold(), (category, value))
+        for level in experience_levels:
+            years = _level_range(level)
+            if years is not None:
+                self._levels.append((level, years))
+            else:
+                self._add("experience", level, level)
+                canonical.setdefault(level.strip().casefold(), ("experience", level))
+
+        for term, aliases in (synonyms if synonyms is not None else DEFAULT_SYNONYMS).items():
+            target = canonical.get(term.strip().casefold())
+            if target is not None:
+                for alias in aliases:
+                    self._add(target[0], target[1], alias)
+
+        self._link()
+
+    def _add(self, category: str, value: str, phrase: str):
+        tokens = tokenize(phrase)
+        if all(token in _GENERIC_TOKENS for token in tokens):
+            return
+        if len(tokens) == 1 and tokens[0] in AMBIGUOUS_TERMS:
+            return
+        state = 0
+        for token in tokens:
+            next_state = self._goto[state].get(token)
+            if next_state is None:
+                next_state = len(self._goto)
+                self._goto[state][token] = next_state
+                self._goto.append({})
+                self._fail.append(0)
+                self._outputs.append([])
+            state = next_state
+        # A phrase keeps the first term it was added for in each category, e.g. one of two duplicate skills
+        if any(self._terms[term_id][0] == category for _, term_id in self._outputs[state]):
+            return
+        self._terms.append((category, value))
+        self._outputs[state].append((len(tokens), len(self._terms) - 1))
+
+    def _link(self):
+        """Compute failure links breadth first, so each state also reports the patterns ending at its suffixes"""
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for token, next_state in self._goto[state].items():
+                queue.append(next_state)
+                fail = self._fail[state]
+                while fail and token not in self._goto[fail]:
+                    fail = self._fail[fail]
+                self._fail[next_state] = self._goto[fail].get(token, 0)
+                self._outputs[next_state] = self._outputs[next_state] + self._outputs[self._fail[next_state]]
+
+    def _matches(self, tokens: List[str]) -> List[Tuple[int, int, int]]:
+        """Non-overlapping (start, end, term id) matches, leftmost and then longest first"""
+        found = []
+        state = 0
+        for position, token in enumerate(tokens):
+            while state and token not in self._goto[state]:
+                state = self._fail[state]
+            state = self._goto[state].get(token, 0)
+            for length, term_id in self._outputs[state]:
+                found.append((position + 1 - length, position + 1, term_id))
+
+        found.sort(key=lambda match: (match[0], match[0] - match[1]))
+        selected = []
+        end = 0
+        for start, stop, term_id in found:
+            if start >= end or (selected and start == selected[-1][0] and stop == selected[-1][1]):
+                selected.append((start, stop, term_id))
+                end = stop
+        return selected
+
+    def _experience_level(self, years: Tuple[float, float]) -> Optional[str]:
+        """The numeric experience level closest to a requested range of years"""
+        low, high = years
+        for level, level_years in self._levels:
+            if level_years == years:
+                return level
+        if high != low and not math.isinf(high):
+            # A bounded range: the level sharing the most years with it, then the narrowest
+            overlaps = [
+                (min(high, level_high) - max(low, level_low), -(level_high - level_low), level)
+                for level, (level_low, level_high) in self._levels
+            ]
+            overlaps = [overlap for overlap in overlaps if overlap[0] > 0]
+            return max(overlaps)[2] if overlaps else None
+        # A number of years, or at least that many: the narrowest level containing it
+        containing = [
+            (level_high - level_low, level)
+            for level, (level_low, level_high) in self._levels
+            if level_low <= low < level_high
+        ]
+        return min(containing)[1] if containing else None
+
+    def extract(self, query_text: str) -> Tuple[Dict[str, Any], float]:
+        """
+        The genres, skills, tools and experience level a query names, and the confidence
+        in them between 0 and 1: the share of the query's words other than stopwords that
+        matched, and 0 if nothing matched or the query contains a negation.
+        """
+        text = query_text.casefold()
+        tokens = tokenize(text)
+        matches = self._matches(tokens)
+
+        params: Dict[str, Any] = {"genres": [], "skills": [], "tools": [], "experience": None}
+        covered = set()
+        for start, stop, term_id in matches:
+            category, value = self._terms[term_id]
+            if category == "experience":
+                params["experience"] = params["experience"] or value
+            elif value not in params[category]:
+                params[category].append(value)
+            covered.update(range(start, stop))
+
+        years = _requested_years(text)
+        if years is not None and params["experience"] is None:
+            params["experience"] = self._experience_level(years)
+
+        if not matches and params["experience"] is None:
+            return params, 0.0
+        if any(token in _NEGATION_TOKENS for token in tokens):
+            return params, 0.0
+
+        meaningful = [
+            position for position, token in enumerate(tokens)
+            if not (token in _STOPWORD_TOKENS or token.isdigit() or token in NUMBER_WORDS)
+        ]
+        if not meaningful:
+            return params, 1.0
+        return params, sum(1 for position in meaningful if position in covered) / len(meaningful)
+
+
+def load_synonyms(path: Optional[str]) -> Dict[str, List[str]]:
+    """The default synonyms, extended with those of a JSON file mapping vocabulary terms to lists of aliases"""
+    synonyms = {term: list(aliases) for term, aliases in DEFAULT_SYNONYMS.items()}
+    if not path:
+        return synonyms
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            extra = json.load(f)
+    except (OSError, ValueError) as e:
+        print(f"Could not load query synonyms from {path}: {str(e)}")
+        return synonyms
+    for term, aliases in extra.items():
+        if isinstance(aliases, str):
+            aliases = [aliases]
+        synonyms.setdefault(term, []).extend(str(alias) for alias in aliases)
+    return synonyms
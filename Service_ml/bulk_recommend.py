@@ -0,0 +1,231 @@
+import os
+import csv
+import json
+import time
+import argparse
+import itertools
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from typing import Dict, Any, Iterator, List, Optional, Tuple
+
+from app.core.config import settings
+from app.models.model_store import ModelStore
+from app.models.artifact import load_artifact
+from app.models.incremental import apply_producer_updates
+
+# Query fields read from each input record
+LIST_FIELDS = ("genres", "skills", "tools")
+
+# Set in each worker process by _init_worker
+_state = None
+_top_n = 3
+
+
+def read_records(path: str, list_separator: str = ";") -> Iterator[Dict[str, Any]]:
+    """
+    Stream query records from a JSONL or CSV file.
+    CSV list columns hold values separated by list_separator. Records that cannot be
+    parsed are passed on with an "error" field so that output lines stay aligned with input records.
+    """
+    with open(path, "r", encoding="utf-8", newline="") as f:
+        if path.lower().endswith(".csv"):
+            for row in csv.DictReader(f):
+                record = dict(row)
+                for field in LIST_FIELDS:
+                    values = (record.get(field) or "").split(list_separator)
+                    record[field] = [value.strip() for value in values if value.strip()]
+                record["experience"] = (record.get("experience") or "").strip() or None
+                yield record
+        else:
+            for line in f:
+                if not line.strip():
+                    continue
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError as e:
+                    record = {"error": f"Invalid JSON: {e}"}
+                yield record if isinstance(record, dict) else {"error": "Record is not a JSON object"}
+
+
+def _init_worker(store_root: str, version: str, top_n: int):
+    """
+    Load the pinned model version in a worker, with its incremental updates replayed.
+    Arrays are memory-mapped and shared through the page cache. The store is only read,
+    never locked, since a committed version and its updates are append-only.
+    """
+    global _state, _top_n
+    store = ModelStore(store_root)
+    state = load_artifact(store.version_dir(version), version=version)
+    changes = store.read_updates(version)
+    if changes:
+        state = apply_producer_updates(state, changes)
+    _state = state
+    _top_n = top_n
+
+
+def _score_chunk(records: List[Tuple[Any, Dict[str, Any]]]) -> List[str]:
+    """Score a chunk of (record id, record) pairs; returns one JSON output line per record"""
+    queries = []
+    for _, record in records:
+        queries.append({
+            "genres": record.get("genres") or [],
+            "skills": record.get("skills") or [],
+            "tools": record.get("tools") or [],
+            "experience": record.get("experience")
+        })
+
+    lines = []
+    results = _state.recommend_batch(queries, _top_n, block_elements=settings.BATCH_BLOCK_ELEMENTS)
+    for (record_id, record), recommendations in zip(records, results):
+        if record.get("error"):
+            output = {"id": record_id, "error": record["error"], "recommendations": []}
+        else:
+            output = {"id": record_id, "recommendations": recommendations}
+        lines.append(json.dumps(output) + "\n")
+    return lines
+
+
+def _load_checkpoint(path: str) -> Optional[Dict[str, Any]]:
+    try:
+        with open(path, "r") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+
+def _save_checkpoint(path: str, checkpoint: Dict[str, Any]):
+    """Replace the checkpoint file atomically"""
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(checkpoint, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+def run(input_path: str, output_path: str, workers: int, chunk_size: int, top_n: int,
+        checkpoint_path: str, version: Optional[str] = None, restart: bool = False,
+        list_separator: str = ";", progress_interval: float = 5.0) -> Dict[str, Any]:
+    """
+    Recommend producers for every query record in the input file and append the results
+    to the output file in input order. Progress is checkpointed after each chunk written,
+    so an interrupted run continues where it stopped.
+    """
+    store = ModelStore(settings.MODEL_ARTIFACT_DIR)
+    checkpoint = None if restart else _load_checkpoint(checkpoint_path)
+
+    if checkpoint is not None:
+        if checkpoint["input"] != os.path.abspath(input_path):
+            raise ValueError(f"Checkpoint {checkpoint_path} belongs to a different input file: {checkpoint['input']}")
+        version = checkpoint["version"]
+        records_done = checkpoint["records_done"]
+        if not os.path.exists(output_path) or os.path.getsize(output_path) < checkpoint["output_bytes"]:
+            raise ValueError(f"Output file {output_path} is shorter than its checkpoint; use --restart")
+        # Drop anything written after the last checkpoint
+        with open(output_path, "ab") as f:
+            f.truncate(checkpoint["output_bytes"])
+        print(f"Resuming after {records_done} records with model version {version}")
+    else:
+        version = version or store.current_version()
+        records_done = 0
+        open(output_path, "wb").close()
+    if not version or version not in store.list_versions():
+        raise ValueError(f"Model version '{version}' not found in {settings.MODEL_ARTIFACT_DIR}")
+
+    records = enumerate(read_records(input_path, list_separator))
+    records = itertools.islice(records, records_done, None)
+    # Record ids default to the position of the record in the input
+    chunks = (
+        [(record.get("id", index), record) for index, record in chunk]
+        for chunk in iter(lambda: list(itertools.islice(records, chunk_size)), [])
+    )
+
+    start_time = time.time()
+    last_report = start_time
+    processed = 0
+    max_in_flight = workers * 2
+
+    executor = ProcessPoolExecutor(
+        max_workers=workers,
+        mp_context=multiprocessing.get_context("spawn"),
+        initializer=_init_worker,
+        initargs=(store.root, version, top_n)
+    )
+    with executor, open(output_path, "ab") as output:
+        in_flight = {}
+        # Chunks that finished out of order wait here until the ones before them are written
+        completed = {}
+        next_submit = 0
+        next_write = 0
+        exhausted = False
+
+        while True:
+            while not exhausted and len(in_flight) + len(completed) < max_in_flight:
+                chunk = next(chunks, None)
+                if chunk is None:
+                    exhausted = True
+                    break
+                in_flight[executor.submit(_score_chunk, chunk)] = next_submit
+                next_submit += 1
+            if not in_flight and not completed:
+                break
+
+            if in_flight:
+                done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in done:
+                    completed[in_flight.pop(future)] = future.result()
+
+            while next_write in completed:
+                lines = completed.pop(next_write)
+                output.write("".join(lines).encode("utf-8"))
+                output.flush()
+                os.fsync(output.fileno())
+                records_done += len(lines)
+                processed += len(lines)
+                next_write += 1
+                _save_checkpoint(checkpoint_path, {
+                    "input": os.path.abspath(input_path),
+                    "version": version,
+                    "records_done": records_done,
+                    "output_bytes": output.tell()
+                })
+
+            now = time.time()
+            if now - last_report >= progress_interval:
+                print(f"{records_done} records done ({processed / (now - start_time):.0f} records/s)")
+                last_report = now
+
+    elapsed = time.time() - start_time
+    print(f"Finished: {records_done} records, {processed} this run in {elapsed:.1f} seconds "
+          f"({processed / elapsed if elapsed > 0 else 0:.0f} records/s)")
+    return {"version": version, "records_done": records_done, "processed": processed, "elapsed": elapsed}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Recommend producers for every query in a JSONL or CSV file")
+    parser.add_argument("input", help="JSONL or CSV file of queries with genres, skills, tools, experience and an optional id")
+    parser.add_argument("output", help="JSONL file to write one line of recommendations per query to")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="Worker processes")
+    parser.add_argument("--chunk-size", type=int, default=1000, help="Queries scored per task")
+    parser.add_argument("--top-n", type=int, default=settings.TOP_N_RECOMMENDATIONS, help="Recommendations per query")
+    parser.add_argument("--checkpoint", help="Checkpoint file (default: <output>.checkpoint)")
+    parser.add_argument("--version", help="Model version to use (default: the current version)")
+    parser.add_argument("--restart", action="store_true", help="Ignore an existing checkpoint and start over")
+    parser.add_argument("--list-separator", default=";", help="Separator of list values in CSV columns")
+    args = parser.parse_args()
+
+    run(
+        input_path=args.input,
+        output_path=args.output,
+        workers=args.workers,
+        chunk_size=args.chunk_size,
+        top_n=args.top_n,
+        checkpoint_path=args.checkpoint or f"{args.output}.checkpoint",
+        version=args.version,
+        restart=args.restart,
+        list_separator=args.list_separator
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,60 @@
+"""
+A stand-in for the Gemini API with injected latency and errors, for trying out timeouts,
+hedging and the circuit breaker locally. Start it and point the service at it:
+
+    python fake_gemini_server.py --port 8090 --latency 0.2 --slow-fraction 0.05 --slow-latency 5 --error-rate 0.1
+    GEMINI_API_KEY=fake GEMINI_API_ENDPOINT=http://localhost:8090 GEMINI_TRANSPORT=rest uvicorn app.main:app
+
+Query prompts get empty parameters, batched reason prompts a reason for every producer id
+and other prompts a fixed reason.
+"""
+import re
+import json
+import random
+import asyncio
+import argparse
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+import uvicorn
+
+app = FastAPI(title="Fake Gemini API")
+options = argparse.Namespace(latency=0.2, slow_fraction=0.0, slow_latency=5.0, error_rate=0.0)
+
+
+def _answer(prompt: str) -> str:
+    if "analyze this user query" in prompt:
+        return json.dumps({"genres": [], "skills": [], "tools": [], "experience": None})
+    if "mapping each producer's id" in prompt:
+        producers = re.search(r"\[\{.*\}\]", prompt, re.DOTALL)
+        ids = [producer["id"] for producer in json.loads(producers.group(0))] if producers else []
+        return json.dumps({producer_id: "A strong match for this request." for producer_id in ids})
+    return "A strong match for this request."
+
+
+@app.post("/v1beta/models/{model_call}")
+async def generate_content(model_call: str, request: Request):
+    body = await request.json()
+    slow = random.random() < options.slow_fraction
+    await asyncio.sleep(options.slow_latency if slow else options.latency)
+    if random.random() < options.error_rate:
+        return JSONResponse(status_code=503, content={"error": {"code": 503, "message": "Injected error", "status": "UNAVAILABLE"}})
+
+    prompt = "".join(part.get("text", "") for content in body.get("contents", []) for part in content.get("parts", []))
+    return {
+        "candidates": [{
+            "content": {"role": "model", "parts": [{"text": _answer(prompt)}]},
+            "finishReason": "STOP",
+            "index": 0
+        }]
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--port", type=int, default=8090)
+    parser.add_argument("--latency", type=float, default=0.2, help="Seconds before each answer")
+    parser.add_argument("--slow-fraction", type=float, default=0.0, help="Share of answers that take --slow-latency instead")
+    parser.add_argument("--slow-latency", type=float, default=5.0)
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Share of calls answered with a 503 error")
+    options = parser.parse_args(namespace=options)
+    uvicorn.run(app, host="127.0.0.1", port=options.port)
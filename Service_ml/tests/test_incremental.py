@@ -0,0 +1,116 @@
+import random
+
+import numpy as np
+import pytest
+
+from app.models.features import FeatureEncoder
+from app.models.serving import ServingState
+from app.models.neighbors import build_neighbor_table
+from app.models.incremental import apply_producer_updates
+
+GENRES = ["Pop", "Rock", "Jazz", "Hip Hop", "Electronic", "Classical"]
+SKILLS = ["Mixing", "Mastering", "Beat Making", "Vocal Production", "Arrangement"]
+TOOLS = ["FL Studio", "Ableton Live", "Logic Pro", "Pro Tools"]
+LEVELS = ["Beginner", "Intermediate", "Expert"]
+NEIGHBOR_K = 5
+
+QUERIES = [
+    {"genres": ["Pop"], "skills": ["Mixing"], "tools": ["FL Studio"], "experience": "Expert"},
+    {"genres": ["Jazz", "Rock"], "skills": ["Arrangement", "Mastering"], "tools": [], "experience": None},
+    # Values only the producers deleted or updated below ever had
+    {"genres": ["Pop", "Polka"], "skills": ["Yodelling", "Mixing"], "tools": ["Tape Machine"], "experience": "Legend"},
+    # Values only the producers added below have
+    {"genres": ["Drill"], "skills": ["Sampling"], "tools": ["Maschine"], "experience": "Beginner"},
+]
+
+
+def _producers(n: int, seed: int = 0):
+    rng = random.Random(seed)
+    return [
+        {
+            "_id": f"p{i}",
+            "fullName": f"Producer {i}",
+            "genres": rng.sample(GENRES, rng.randint(1, 3)),
+            "skills": rng.sample(SKILLS, rng.randint(1, 3)),
+            "tools": rng.sample(TOOLS, rng.randint(0, 2)),
+            "experience": rng.choice(LEVELS)
+        }
+        for i in range(n)
+    ]
+
+
+def _build(producers, sparse_features: bool) -> ServingState:
+    """Serving state as training builds it"""
+    encoder = FeatureEncoder(len(producers))
+    encoder.add_batch(producers)
+    encoded = encoder.finalize()
+    feature_matrix = encoded.feature_matrix(sparse_features)
+    return ServingState(
+        feature_matrix=feature_matrix,
+        producer_ids=encoded.producer_ids,
+        producer_names=encoded.producer_names,
+        all_genres=encoded.all_genres,
+        all_skills=encoded.all_skills,
+        all_tools=encoded.all_tools,
+        all_experience_levels=encoded.all_experience_levels,
+        neighbor_table=build_neighbor_table(feature_matrix, NEIGHBOR_K)
+    )
+
+
+def _scores(state: ServingState, query) -> dict:
+    """Score of every producer matching a requested genre, by producer id"""
+    query_vector = state.build_query_vector(query["genres"], query["skills"], query["tools"], query["experience"])
+    rows, scores, _ = state.rank(query_vector, query["genres"], state.n_producers)
+    return {state.producer_ids[row]: score for row, score in zip(rows.tolist(), scores.tolist())}
+
+
+@pytest.mark.parametrize("sparse_features", [True, False])
+def test_incremental_updates_match_rebuild(sparse_features):
+    producers = {producer["_id"]: producer for producer in _producers(60)}
+    # The only producers with these values are deleted or updated away from them below
+    producers["p1"].update(genres=["Polka", "Pop"], skills=["Yodelling"], tools=["Tape Machine"], experience="Legend")
+    producers["p2"].update(genres=["Polka"], skills=["Yodelling", "Mixing"])
+    state = _build(list(producers.values()), sparse_features)
+
+    changes = [
+        {"delete": "p1"},
+        {"upsert": {**producers["p2"], "genres": ["Rock"], "skills": ["Mixing"]}},
+        {"upsert": {"_id": "new1", "fullName": "New 1", "genres": ["Drill", "Pop"], "skills": ["Sampling"],
+                    "tools": ["Maschine"], "experience": "Beginner"}},
+        {"upsert": {**producers["p3"], "genres": ["Jazz"], "tools": ["Logic Pro"]}},
+        {"delete": "p4"},
+        {"upsert": {"_id": "new2", "fullName": "New 2", "genres": ["Rock", "Jazz"], "skills": ["Arrangement"],
+                    "tools": [], "experience": "Expert"}},
+        {"delete": "missing"},
+    ]
+    updated = apply_producer_updates(state, changes)
+
+    for change in changes:
+        if "delete" in change:
+            producers.pop(change["delete"], None)
+        else:
+            producers[change["upsert"]["_id"]] = change["upsert"]
+    rebuilt = _build(list(producers.values()), sparse_features)
+
+    for query in QUERIES:
+        incremental_scores = _scores(updated, query)
+        rebuilt_scores = _scores(rebuilt, query)
+        assert incremental_scores.keys() == rebuilt_scores.keys()
+        for producer_id, score in rebuilt_scores.items():
+            assert incremental_scores[producer_id] == pytest.approx(score)
+
+    for producer_id, row in rebuilt.producer_rows.items():
+        _, rebuilt_similarities = rebuilt.similar_producers(row, NEIGHBOR_K)
+        _, updated_similarities = updated.similar_producers(updated.producer_rows[producer_id], NEIGHBOR_K)
+        assert updated_similarities == pytest.approx(rebuilt_similarities, abs=1e-6)
+
+
+def test_values_without_producers_are_left_out_of_queries():
+    producers = _producers(10)
+    producers[0].update(genres=["Polka"], skills=["Yodelling"])
+    state = apply_producer_updates(_build(producers, True), [{"delete": "p0"}])
+
+    query_vector = state.build_query_vector(["Polka", "Pop"], ["Yodelling"])
+    assert query_vector[state.genre_columns["Polka"]] == 0
+    assert query_vector[state.skill_columns["Yodelling"]] == 0
+    assert query_vector[state.genre_columns["Pop"]] > 0